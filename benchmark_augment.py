@@ -0,0 +1,44 @@
+import argparse
+import json
+import re
+import sys
+
+from metadamagenet.augment.benchmark import transform_benchmarks, pipeline_benchmarks, run
+
+
+def main():
+    parser = argparse.ArgumentParser(description='measure throughput of augmentations on synthetic batches')
+    parser.add_argument('--fused', action='store_true', help='also benchmark pipelines with fused geometric transforms')
+    parser.add_argument('--only', default=None, help='regular expression of benchmark names to run')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('--devices', nargs='+', default=['cpu'], help='for example cpu cuda')
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 4], help='torch intra-op thread counts')
+    parser.add_argument('--probabilities', type=float, nargs='+', default=[0.1, 0.5, 1.],
+                        help='apply probabilities of single transforms')
+    parser.add_argument('--size', type=int, default=1024, help='height and width of synthetic images')
+    parser.add_argument('--iterations', type=int, default=5)
+    parser.add_argument('--warmup', type=int, default=1)
+    parser.add_argument('--output', default=None, help='json file to write results in. printed if not given')
+    args = parser.parse_args()
+
+    benchmarks = transform_benchmarks() + pipeline_benchmarks(fused=args.fused)
+    if args.only is not None:
+        benchmarks = [benchmark for benchmark in benchmarks if re.search(args.only, benchmark.name)]
+
+    def report(record):
+        result = record.get('error') or f"{record['images_per_second']:.2f} images/s"
+        print(f"{record['name']} device={record['device']} threads={record['threads']} "
+              f"batch_size={record['batch_size']} p={record['p']}: {result}", file=sys.stderr)
+
+    results = run(benchmarks, batch_sizes=args.batch_sizes, devices=args.devices, threads=args.threads,
+                  probabilities=args.probabilities, size=args.size, iterations=args.iterations,
+                  warmup=args.warmup, callback=report)
+    if args.output is None:
+        print(json.dumps(results, indent=2))
+    else:
+        with open(args.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+import argparse
+import json
+import sys
+import time
+from typing import Dict, List, Any, Type
+
+import torch
+from torch import nn
+
+from metadamagenet.models.unet import (UnetBase, Resnet34Unet, SeResnext50Unet, Dpn92Unet, SeNet154Unet,
+                                       EfficientUnetB0, EfficientUnetB0SCSE, EfficientUnetWideSEB0,
+                                       EfficientUnetB0Big, EfficientUnetB4, EfficientUnetB4SCSE, EfficientUnetB4Big)
+
+BACKBONES: Dict[str, Type[UnetBase]] = {unet.name(): unet for unet in (
+    Resnet34Unet, SeResnext50Unet, Dpn92Unet, SeNet154Unet, EfficientUnetB0, EfficientUnetB0SCSE,
+    EfficientUnetWideSEB0, EfficientUnetB0Big, EfficientUnetB4, EfficientUnetB4SCSE, EfficientUnetB4Big)}
+
+MEMORY_FORMATS: Dict[str, torch.memory_format] = {
+    'contiguous': torch.contiguous_format,
+    'channels_last': torch.channels_last,
+}
+
+
+def _synchronize(device: torch.device) -> None:
+    if device.type == 'cuda':
+        torch.cuda.synchronize(device)
+
+
+def contiguous_layers(unet: UnetBase, inputs: torch.Tensor) -> List[str]:
+    """
+    :return: names of layers with feature map outputs which are not in channels_last format
+    """
+    names: List[str] = []
+
+    def hook(name: str):
+        def check(module: nn.Module, args, output) -> None:
+            outputs = output if isinstance(output, (tuple, list)) else (output,)
+            if any(isinstance(tensor, torch.Tensor) and tensor.dim() == 4 and
+                   not tensor.is_contiguous(memory_format=torch.channels_last) for tensor in outputs):
+                names.append(name)
+
+        return check
+
+    handles = [module.register_forward_hook(hook(name)) for name, module in unet.named_modules() if name]
+    try:
+        with torch.no_grad():
+            unet(inputs)
+    finally:
+        for handle in handles:
+            handle.remove()
+    return names
+
+
+def measure(unet: UnetBase, memory_format: torch.memory_format, device: torch.device, batch_size: int, size: int,
+            iterations: int, warmup: int, train: bool) -> Dict[str, Any]:
+    """
+    :return: mean latency of a forward pass (and backward pass in training), memory format of outputs
+             and layers whose outputs are not channels_last, which are checked in a separate forward pass
+    """
+    unet = unet.to(device, memory_format=memory_format)
+    unet.train(train)
+    inputs: torch.Tensor = torch.rand(batch_size, 3, size, size, device=device) \
+        .contiguous(memory_format=memory_format)
+
+    def step() -> torch.Tensor:
+        with torch.set_grad_enabled(train):
+            outputs: torch.Tensor = unet(inputs)
+            if train:
+                outputs.mean().backward()
+        return outputs
+
+    for _ in range(warmup):
+        outputs = step()
+    _synchronize(device)
+    start: float = time.perf_counter()
+    for _ in range(iterations):
+        outputs = step()
+    _synchronize(device)
+    seconds: float = (time.perf_counter() - start) / iterations
+    layers: List[str] = contiguous_layers(unet, inputs)
+    return {
+        'latency': seconds,
+        'images_per_second': batch_size / seconds,
+        'output_channels_last': outputs.is_contiguous(memory_format=torch.channels_last),
+        'layers': sum(1 for name, _ in unet.named_modules() if name),
+        'contiguous_layers': layers,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='compare unet backbones in contiguous and channels_last formats')
+    parser.add_argument('--backbones', nargs='+', default=list(BACKBONES), choices=list(BACKBONES))
+    parser.add_argument('--device', default='cpu')
+    parser.add_argument('--threads', type=int, default=None, help='torch intra-op thread count')
+    parser.add_argument('--batch-size', type=int, default=2)
+    parser.add_argument('--size', type=int, default=512, help='height and width of inputs')
+    parser.add_argument('--iterations', type=int, default=5)
+    parser.add_argument('--warmup', type=int, default=1)
+    parser.add_argument('--train', action='store_true', help='measure forward and backward passes in training mode')
+    parser.add_argument('--output', default=None, help='json file to write results in. printed if not given')
+    args = parser.parse_args()
+
+    if args.threads is not None:
+        torch.set_num_threads(args.threads)
+    device = torch.device(args.device)
+    records: List[Dict[str, Any]] = []
+    for name in args.backbones:
+        unet: UnetBase = BACKBONES[name]()
+        record: Dict[str, Any] = {'backbone': name}
+        for format_name, memory_format in MEMORY_FORMATS.items():
+            record[format_name] = measure(unet, memory_format, device, args.batch_size, args.size,
+                                          args.iterations, args.warmup, args.train)
+        record['speedup'] = record['contiguous']['latency'] / record['channels_last']['latency']
+        print(f"{name}: contiguous {record['contiguous']['latency'] * 1000:.1f}ms "
+              f"channels_last {record['channels_last']['latency'] * 1000:.1f}ms "
+              f"speedup {record['speedup']:.2f}x "
+              f"contiguous layers in channels_last {len(record['channels_last']['contiguous_layers'])}",
+              file=sys.stderr)
+        records.append(record)
+
+    results = {
+        'torch': torch.__version__,
+        'device': args.device,
+        'threads': torch.get_num_threads(),
+        'batch_size': args.batch_size,
+        'size': args.size,
+        'train': args.train,
+        'records': records,
+    }
+    if args.output is None:
+        print(json.dumps(results, indent=2))
+    else:
+        with open(args.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
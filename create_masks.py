@@ -1,67 +1,36 @@
 import argparse
 import pathlib
+from multiprocessing import Pool
+from typing import List
 
-import numpy as np
 import numpy.typing as npt
 import cv2
-import shapely.geometry
-import torch
 from tqdm.autonotebook import tqdm
 
-from metadamagenet.configs import DamageType
-from metadamagenet.dataset import ImageData, DataTime, discover_directory
+from metadamagenet.dataset import ImageData, DataTime, discover_directory, LabelStore, rasterize_image_data, \
+    damage_type_color
 
 
 class MaskCreator:
-    damage_type_color = {
-        DamageType.UN_CLASSIFIED: 1,
-        DamageType.NO_DAMAGE: 1,
-        DamageType.MINOR_DAMAGE: 2,
-        DamageType.MAJOR_DAMAGE: 3,
-        DamageType.DESTROYED: 4
-    }
-
-    @staticmethod
-    def mask_for_polygon(poly: shapely.geometry.Polygon, im_size=(1024, 1024)):
-        """
-        creates a binary mask from a polygon
-        """
-
-        def int_coords(x):
-            return np.array(x).round().astype(np.int32)
-
-        img_mask = np.zeros(im_size, np.uint8)
-        exteriors = [int_coords(poly.exterior.coords)]
-        interiors = [int_coords(p.coords) for p in poly.interiors]
-        cv2.fillPoly(img_mask, exteriors, 1)
-        cv2.fillPoly(img_mask, interiors, 0)
-        return img_mask
+    damage_type_color = damage_type_color
 
     @classmethod
     def create_loc_mask(cls, image_data: ImageData) -> npt.NDArray:
         """
         creates localization mask for image data
         """
-        localization_mask = np.zeros((1024, 1024), dtype='uint8')  # a mask-image including polygons
-
-        for polygon in image_data.polygons(DataTime.PRE):
-            _msk = cls.mask_for_polygon(polygon)
-            localization_mask[_msk > 0] = 1
-
-        return localization_mask
+        return rasterize_image_data(image_data, DataTime.PRE)
 
     @classmethod
     def create_cls_mask(cls, image_data: ImageData) -> npt.NDArray:
-        classification_mask = np.zeros((1024, 1024), dtype='uint8')  # a mask-image with damage levels
-        damage_type: DamageType
-        for polygon, damage_type in image_data.polygons(DataTime.POST):
-            _msk = cls.mask_for_polygon(polygon)
-            classification_mask[_msk > 0] = cls.damage_type_color[damage_type]
-        return
+        """
+        creates classification mask (with damage levels) for image data
+        """
+        return rasterize_image_data(image_data, DataTime.POST)
 
     @classmethod
-    def save_masks(cls, image_data: ImageData, localization_msk: torch.Tensor,
-                   classification_msk: torch.Tensor) -> None:
+    def save_masks(cls, image_data: ImageData, localization_msk: npt.NDArray,
+                   classification_msk: npt.NDArray) -> None:
 
         cv2.imwrite(str(image_data.mask(DataTime.PRE)),
                     localization_msk,
@@ -71,24 +40,59 @@ class MaskCreator:
                     classification_msk,
                     [cv2.IMWRITE_PNG_COMPRESSION, 9])
 
-    def __init__(self, source: pathlib.Path):
+    @classmethod
+    def create_masks(cls, image_data: ImageData) -> None:
+        cls.save_masks(image_data, cls.create_loc_mask(image_data), cls.create_cls_mask(image_data))
+
+    @staticmethod
+    def is_up_to_date(image_data: ImageData) -> bool:
+        """
+        masks are up-to-date if each of them is newer than its label file
+        """
+        time: DataTime
+        for time in (DataTime.PRE, DataTime.POST):
+            mask_path: pathlib.Path = image_data.mask(time)
+            if not mask_path.exists() or mask_path.stat().st_mtime_ns < image_data.label(time).stat().st_mtime_ns:
+                return False
+        return True
+
+    def __init__(self, source: pathlib.Path, workers: int = 1, force: bool = False):
+        """
+        :param source: dataset directory
+        :param workers: number of processes creating masks
+        :param force: recreate masks even if they are newer than their labels
+        """
         assert source.exists() and source.is_dir(), \
             f"source {source.absolute()} does not exist or its not a directory"
         self._source: pathlib.Path = source
+        self._workers: int = workers
+        self._force: bool = force
 
     def run(self):
-        image_dataset = discover_directory(self._source, check=False)
-        for image_data in tqdm(image_dataset):
-            localization_msk: torch.Tensor = self.create_loc_mask(image_data)
-            classification_msk: torch.Tensor = self.create_cls_mask(image_data)
-            self.save_masks(image_data, localization_msk, classification_msk)
+        image_dataset: List[ImageData] = discover_directory(self._source, check=False)
+        if not self._force:
+            image_dataset = [image_data for image_data in image_dataset if not self.is_up_to_date(image_data)]
+        if self._workers <= 1:
+            for image_data in tqdm(image_dataset):
+                self.create_masks(image_data)
+            return
+        with Pool(self._workers) as pool:
+            for _ in tqdm(pool.imap_unordered(self.create_masks, image_dataset, chunksize=8),
+                          total=len(image_dataset)):
+                pass
 
 
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('--source', required=True)
+    parser.add_argument('--compile-labels', action='store_true',
+                        help='compile label files into a binary polygon store before creating masks')
+    parser.add_argument('--workers', type=int, default=1, help='number of processes creating masks')
+    parser.add_argument('--force', action='store_true', help='recreate masks which are newer than their labels')
     args = parser.parse_args()
-    mask_creator = MaskCreator(pathlib.Path(args.source))
+    if args.compile_labels:
+        LabelStore.build(pathlib.Path(args.source))
+    mask_creator = MaskCreator(pathlib.Path(args.source), workers=args.workers, force=args.force)
     mask_creator.run()
 
 
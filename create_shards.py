@@ -0,0 +1,19 @@
+import argparse
+import pathlib
+
+from metadamagenet.dataset import discover_directories, write_shards
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--source', required=True, nargs='+', help='dataset directories to pack')
+    parser.add_argument('--output', required=True, help='directory to write shards in')
+    parser.add_argument('--shard-size', type=int, default=256, help='number of samples in each shard')
+    parser.add_argument('--seed', type=int, default=0, help='seed of sample order')
+    args = parser.parse_args()
+    dataset = discover_directories([pathlib.Path(source) for source in args.source])
+    write_shards(dataset, pathlib.Path(args.output), shard_size=args.shard_size, seed=args.seed)
+
+
+if __name__ == '__main__':
+    main()
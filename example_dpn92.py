@@ -4,7 +4,6 @@ from torch.utils.data import DataLoader
 from torch.optim import AdamW
 from torch.optim.lr_scheduler import MultiStepLR
 from torch.cuda import amp
-from torch import nn
 
 from metadamagenet.utils import set_random_seeds
 from metadamagenet.dataset import LocalizationDataset, ClassificationDataset
@@ -14,8 +13,7 @@ from metadamagenet.losses import WeightedSum, BinaryFocalLoss2d, BinaryDiceLossW
     SegmentationCCE
 from metadamagenet.metrics import xview2
 from metadamagenet.runner import Trainer, ValidationInTrainingParams
-from metadamagenet.augment import Random, VFlip, Rotate90, Shift, RotateAndScale, BestCrop, OneOf, RGBShift, HSVShift, \
-    Clahe, GaussianNoise, Blur, Saturation, Brightness, Contrast, ElasticTransform, Dilation
+from metadamagenet.augment import pipelines
 
 train_dir = Path('/datasets/xview2/train')
 test_dir = Path('/datasets/xview2/test')
@@ -32,26 +30,7 @@ class Dpn92Classifier(Classifier[Dpn92Unet]):
 def train_localizer(seed: int):
     set_random_seeds(111 + seed)
 
-    transform = nn.Sequential(
-        Random(VFlip(), p=0.5),
-        Random(Rotate90(), p=0.95),
-        Random(Shift(y=(.2, .8), x=(.2, .8)), p=.1),
-        Random(RotateAndScale(center_y=(0.3, 0.7), center_x=(0.3, 0.7), angle=(-10., 10.), scale=(.9, 1.1)), p=0.1),
-        BestCrop(samples=5, dsize=(512, 512), size_range=(0.45, 0.55)),
-        Random(RGBShift().only_on('img'), p=0.01),
-        Random(HSVShift().only_on('img'), p=0.01),
-        OneOf(
-            (OneOf(
-                (Clahe().only_on('img'), 0.01),
-                (GaussianNoise().only_on('img'), 0.01),
-                (Blur().only_on('img'), 0.01)), 0.01),
-            (OneOf(
-                (Saturation().only_on('img'), 0.01),
-                (Brightness().only_on('img'), 0.01),
-                (Contrast().only_on('img'), 0.01)), 0.01)
-        ),
-        Random(ElasticTransform(), p=0.001)
-    )
+    transform = pipelines.dpn92_train_localizer()
 
     model = Dpn92Localizer(Dpn92Unet(pretrained_backbone=True))
     optimizer = AdamW(model.parameters(), lr=0.00015, weight_decay=1e-6)
@@ -99,28 +78,7 @@ def train_localizer(seed: int):
 def tune_localizer(seed: int):
     set_random_seeds(156 + seed)
 
-    transform = nn.Sequential(
-        Random(VFlip(), p=0.45),
-        Random(Rotate90(), p=0.9),
-        Random(Shift(), p=.05),
-        Random(RotateAndScale(), p=0.05),
-        BestCrop(samples=5, dsize=(512, 512), size_range=(0.45, 0.55)),
-        OneOf(
-            (RGBShift().only_on('img'), 0.01),
-            (HSVShift().only_on('img'), 0.01)
-        ),
-        OneOf(
-            (OneOf(
-                (Clahe().only_on('img'), 0.01),
-                (GaussianNoise().only_on('img'), 0.01),
-                (Blur().only_on('img'), 0.01)), 0.01),
-            (OneOf(
-                (Saturation().only_on('img'), 0.01),
-                (Brightness().only_on('img'), 0.01),
-                (Contrast().only_on('img'), 0.01)), 0.01)
-        ),
-        Random(ElasticTransform().only_on('img'), p=0.001)
-    )
+    transform = pipelines.dpn92_tune_localizer()
 
     model = Dpn92Localizer.from_checkpoint(version='0', seed=0)
     optimizer = AdamW(model.parameters(), lr=0.00004, weight_decay=1e-6)
@@ -166,44 +124,7 @@ def tune_localizer(seed: int):
 def train_classifier(seed: int):
     set_random_seeds(54321 + seed)
 
-    transform = nn.Sequential(
-        Random(VFlip(), p=0.5),
-        Random(Rotate90(), p=0.9999),
-        Random(Shift(y=(.2, .8), x=(.2, .8)), p=.5),
-        Random(RotateAndScale(center_y=(0.3, 0.7), center_x=(0.3, 0.7), angle=(-10., 10.), scale=(.9, 1.1)), p=0.95),
-        BestCrop(samples=10, dsize=(512, 512), size_range=(0.4, 0.6)),
-        OneOf(
-            (RGBShift().only_on('img_pre'), 0.1),
-            (RGBShift().only_on('img_post'), 0.1),
-        ),
-        OneOf(
-            (HSVShift().only_on('img_pre'), 0.1),
-            (HSVShift().only_on('img_post'), 0.1),
-        ),
-        OneOf(
-            (OneOf(
-                (Clahe().only_on('img_pre'), 0.1),
-                (GaussianNoise().only_on('img_pre'), 0.1),
-                (Blur().only_on('img_pre'), 0.1)), 0.1),
-            (OneOf(
-                (Saturation().only_on('img_pre'), 0.1),
-                (Brightness().only_on('img_pre'), 0.1),
-                (Contrast().only_on('img_pre'), 0.1)), 0.1)
-        ),
-        OneOf(
-            (OneOf(
-                (Clahe().only_on('img_post'), 0.1),
-                (GaussianNoise().only_on('img_post'), 0.1),
-                (Blur().only_on('img_post'), 0.1)), 0.1),
-            (OneOf(
-                (Saturation().only_on('img_post'), 0.1),
-                (Brightness().only_on('img_post'), 0.1),
-                (Contrast().only_on('img_post'), 0.1)), 0.1)
-        ),
-        Random(ElasticTransform().only_on('img_pre'), p=0.1),
-        Random(ElasticTransform().only_on('img_post'), p=0.1),
-        Random(Dilation().only_on('msk'), p=0.9)
-    )
+    transform = pipelines.dpn92_train_classifier()
 
     model = Dpn92Classifier(Dpn92Localizer.from_pretrained(version='0', seed=0).unet)
     optimizer = AdamW(model.parameters(), lr=0.0002, weight_decay=1e-6)
@@ -251,44 +172,7 @@ def train_classifier(seed: int):
 def tune_classifier(seed: int):
     set_random_seeds(seed + 777)
 
-    transform = nn.Sequential(
-        Random(VFlip(), p=0.3),
-        Random(Rotate90(), p=0.7),
-        Random(Shift(), p=.01),
-        Random(RotateAndScale(), p=0.5),
-        BestCrop(samples=10, dsize=(512, 512), size_range=(0.4, 0.6)),
-        OneOf(
-            (RGBShift().only_on('img_pre'), 0.01),
-            (RGBShift().only_on('img_post'), 0.01),
-        ),
-        OneOf(
-            (HSVShift().only_on('img_pre'), 0.01),
-            (HSVShift().only_on('img_post'), 0.01),
-        ),
-        OneOf(
-            (OneOf(
-                (Clahe().only_on('img_pre'), 0.01),
-                (GaussianNoise().only_on('img_pre'), 0.01),
-                (Blur().only_on('img_pre'), 0.01)), 0.01),
-            (OneOf(
-                (Saturation().only_on('img_pre'), 0.01),
-                (Brightness().only_on('img_pre'), 0.01),
-                (Contrast().only_on('img_pre'), 0.01)), 0.01)
-        ),
-        OneOf(
-            (OneOf(
-                (Clahe().only_on('img_post'), 0.01),
-                (GaussianNoise().only_on('img_post'), 0.01),
-                (Blur().only_on('img_post'), 0.01)), 0.01),
-            (OneOf(
-                (Saturation().only_on('img_post'), 0.01),
-                (Brightness().only_on('img_post'), 0.01),
-                (Contrast().only_on('img_post'), 0.01)), 0.01)
-        ),
-        Random(ElasticTransform().only_on('img_pre'), p=0.01),
-        Random(ElasticTransform().only_on('img_post'), p=0.01),
-        Random(Dilation().only_on('msk'), p=0.9)
-    )
+    transform = pipelines.dpn92_tune_classifier()
 
     model = Dpn92Classifier.from_pretrained(version='1', seed=0)
     optimizer = AdamW(model.parameters(), lr=0.000008, weight_decay=1e-6)
@@ -4,7 +4,6 @@ from torch.utils.data import DataLoader
 from torch.optim import AdamW
 from torch.optim.lr_scheduler import MultiStepLR
 from torch.cuda import amp
-from torch import nn
 
 from metadamagenet.utils import set_random_seeds
 from metadamagenet.dataset import LocalizationDataset, ClassificationDataset
@@ -13,8 +12,7 @@ from metadamagenet.models.unet import Resnet34Unet
 from metadamagenet.losses import WeightedSum, BinaryFocalLoss2d, BinaryDiceLossWithLogits, DiceLoss, FocalLoss2d
 from metadamagenet.metrics import xview2
 from metadamagenet.runner import Trainer, ValidationInTrainingParams
-from metadamagenet.augment import Random, VFlip, Rotate90, Shift, RotateAndScale, BestCrop, OneOf, RGBShift, HSVShift, \
-    Clahe, GaussianNoise, Blur, Saturation, Brightness, Contrast, ElasticTransform, Dilation
+from metadamagenet.augment import pipelines
 
 train_dir = Path('/datasets/xview2/train')
 test_dir = Path('/datasets/xview2/test')
@@ -31,28 +29,7 @@ class Resnet34Classifier(Classifier[Resnet34Unet]):
 def train_localizer(seed: int):
     set_random_seeds(545 + seed)
 
-    transform = nn.Sequential(
-        Random(VFlip(), p=0.5),
-        Random(Rotate90(), p=0.95),
-        Random(Shift(), p=.2),
-        Random(RotateAndScale(), p=0.8),
-        BestCrop(samples=5, dsize=(736, 736), size_range=(0.6, 0.9)),
-        OneOf(
-            (RGBShift().only_on('img'), 0.03),
-            (HSVShift().only_on('img'), 0.03)
-        ),
-        OneOf(
-            (OneOf(
-                (Clahe().only_on('img'), 0.03),
-                (GaussianNoise().only_on('img'), 0.03),
-                (Blur().only_on('img'), 0.02)), 0.07),
-            (OneOf(
-                (Saturation().only_on('img'), 0.03),
-                (Brightness().only_on('img'), 0.03),
-                (Contrast().only_on('img'), 0.03)), 0.07)
-        ),
-        Random(ElasticTransform().only_on('img'), p=0.03)
-    )
+    transform = pipelines.resnet34_train_localizer()
     Trainer(
         model=Resnet34Localizer(Resnet34Unet(pretrained_backbone=True)),
         version='1',
@@ -92,44 +69,7 @@ def train_localizer(seed: int):
 def train_classifier(seed: int):
     set_random_seeds(321 + seed)
 
-    transform = nn.Sequential(
-        Random(VFlip(), p=0.5),
-        Random(Rotate90(), p=0.95),
-        Random(Shift(), p=.1),
-        Random(RotateAndScale(), p=0.4),
-        BestCrop(samples=10, dsize=(608, 608), size_range=(0.65, 0.85)),
-        OneOf(
-            (RGBShift().only_on('img_pre'), 0.015),
-            (RGBShift().only_on('img_post'), 0.015),
-        ),
-        OneOf(
-            (HSVShift().only_on('img_pre'), 0.015),
-            (HSVShift().only_on('img_post'), 0.015),
-        ),
-        OneOf(
-            (OneOf(
-                (Clahe().only_on('img_pre'), 0.015),
-                (GaussianNoise().only_on('img_pre'), 0.015),
-                (Blur().only_on('img_pre'), 0.1)), 0.015),
-            (OneOf(
-                (Saturation().only_on('img_pre'), 0.015),
-                (Brightness().only_on('img_pre'), 0.015),
-                (Contrast().only_on('img_pre'), 0.015)), 0.02)
-        ),
-        OneOf(
-            (OneOf(
-                (Clahe().only_on('img_post'), 0.015),
-                (GaussianNoise().only_on('img_post'), 0.015),
-                (Blur().only_on('img_post'), 0.1)), 0.015),
-            (OneOf(
-                (Saturation().only_on('img_post'), 0.015),
-                (Brightness().only_on('img_post'), 0.015),
-                (Contrast().only_on('img_post'), 0.015)), 0.02)
-        ),
-        Random(ElasticTransform().only_on('img_pre'), p=0.017),
-        Random(ElasticTransform().only_on('img_post'), p=0.017),
-        Random(Dilation().only_on('msk'), p=0.9)
-    )
+    transform = pipelines.resnet34_train_classifier()
 
     model = Resnet34Classifier(Resnet34Localizer.from_pretrained(version='1', seed=0).unet)
     opt = AdamW(model.parameters(), lr=0.0002, weight_decay=1e-6)
@@ -176,44 +116,7 @@ def train_classifier(seed: int):
 def tune_classifier(seed: int):
     set_random_seeds(seed + 357)
 
-    transform = nn.Sequential(
-        Random(VFlip(), p=0.3),
-        Random(Rotate90(), p=0.7),
-        Random(Shift(), p=.02),
-        Random(RotateAndScale(), p=0.5),
-        BestCrop(samples=10, dsize=(608, 608), size_range=(0.65, 0.85)),
-        OneOf(
-            (RGBShift().only_on('img_pre'), 0.01),
-            (RGBShift().only_on('img_post'), 0.01),
-        ),
-        OneOf(
-            (HSVShift().only_on('img_pre'), 0.01),
-            (HSVShift().only_on('img_post'), 0.01),
-        ),
-        OneOf(
-            (OneOf(
-                (Clahe().only_on('img_pre'), 0.01),
-                (GaussianNoise().only_on('img_pre'), 0.01),
-                (Blur().only_on('img_pre'), 0.01)), 0.01),
-            (OneOf(
-                (Saturation().only_on('img_pre'), 0.01),
-                (Brightness().only_on('img_pre'), 0.01),
-                (Contrast().only_on('img_pre'), 0.01)), 0.01)
-        ),
-        OneOf(
-            (OneOf(
-                (Clahe().only_on('img_post'), 0.015),
-                (GaussianNoise().only_on('img_post'), 0.015),
-                (Blur().only_on('img_post'), 0.015)), 0.01),
-            (OneOf(
-                (Saturation().only_on('img_post'), 0.01),
-                (Brightness().only_on('img_post'), 0.01),
-                (Contrast().only_on('img_post'), 0.01)), 0.01)
-        ),
-        Random(ElasticTransform().only_on('img_pre'), p=0.01),
-        Random(ElasticTransform().only_on('img_post'), p=0.01),
-        Random(Dilation().only_on('msk'), p=0.9)
-    )
+    transform = pipelines.resnet34_tune_classifier()
 
     model = Resnet34Classifier.from_checkpoint(version='1', seed=0)
     optimizer = AdamW(model.parameters(), lr=0.000008, weight_decay=1e-6)
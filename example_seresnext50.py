@@ -4,7 +4,6 @@ from torch.utils.data import DataLoader
 from torch.optim import AdamW
 from torch.optim.lr_scheduler import MultiStepLR
 from torch.cuda import amp
-from torch import nn
 
 from metadamagenet.utils import set_random_seeds
 from metadamagenet.dataset import LocalizationDataset, ClassificationDataset
@@ -14,8 +13,7 @@ from metadamagenet.losses import WeightedSum, BinaryFocalLoss2d, BinaryDiceLossW
     SegmentationCCE
 from metadamagenet.metrics import xview2
 from metadamagenet.runner import Trainer, ValidationInTrainingParams
-from metadamagenet.augment import Random, VFlip, Rotate90, Shift, RotateAndScale, BestCrop, OneOf, RGBShift, HSVShift, \
-    Clahe, GaussianNoise, Blur, Saturation, Brightness, Contrast, ElasticTransform, Dilation
+from metadamagenet.augment import pipelines
 
 train_dir = Path('/datasets/xview2/train')
 test_dir = Path('/datasets/xview2/test')
@@ -31,26 +29,7 @@ class SeResnext50Classifier(Classifier[SeResnext50Unet]):
 
 def train_localizer(seed: int):
     set_random_seeds(seed + 123)
-    transform = nn.Sequential(
-        Random(VFlip(), p=0.5),
-        Random(Rotate90(), p=0.95),
-        Random(Shift(), p=.1),
-        Random(RotateAndScale(), p=0.1),
-        BestCrop(samples=5, dsize=(512, 512), size_range=(0.45, 0.55)),
-        Random(RGBShift().only_on('img'), p=0.01),
-        Random(HSVShift().only_on('img'), p=0.01),
-        OneOf(
-            (OneOf(
-                (Clahe().only_on('img'), 0.01),
-                (GaussianNoise().only_on('img'), 0.01),
-                (Blur().only_on('img'), 0.01)), 0.01),
-            (OneOf(
-                (Saturation().only_on('img'), 0.01),
-                (Brightness().only_on('img'), 0.01),
-                (Contrast().only_on('img'), 0.01)), 0.01)
-        ),
-        Random(ElasticTransform().only_on('img'), p=0.001)
-    )
+    transform = pipelines.seresnext50_train_localizer()
     model = SeResnext50Localizer(SeResnext50Unet(pretrained_backbone=True))
     optimizer = AdamW(model.parameters(), lr=0.00015, weight_decay=1e-6)
     lr_scheduler = MultiStepLR(optimizer,
@@ -95,28 +74,7 @@ def train_localizer(seed: int):
 
 def tune_localizer(seed: int):
     set_random_seeds(432 + seed)
-    transform = nn.Sequential(
-        Random(VFlip(), p=0.45),
-        Random(Rotate90(), p=0.9),
-        Random(Shift(), p=.05),
-        Random(RotateAndScale(), p=0.05),
-        BestCrop(samples=5, dsize=(512, 512), size_range=(0.45, 0.55)),
-        OneOf(
-            (RGBShift().only_on('img'), 0.01),
-            (HSVShift().only_on('img'), 0.01)
-        ),
-        OneOf(
-            (OneOf(
-                (Clahe().only_on('img'), 0.01),
-                (GaussianNoise().only_on('img'), 0.01),
-                (Blur().only_on('img'), 0.01)), 0.01),
-            (OneOf(
-                (Saturation().only_on('img'), 0.01),
-                (Brightness().only_on('img'), 0.01),
-                (Contrast().only_on('img'), 0.01)), 0.01)
-        ),
-        Random(ElasticTransform().only_on('img'), p=0.001)
-    )
+    transform = pipelines.seresnext50_tune_localizer()
 
     model = SeResnext50Localizer.from_checkpoint(version='0', seed=0)
     optimizer = AdamW(model.parameters(), lr=0.00004, weight_decay=1e-6)
@@ -163,44 +121,7 @@ def tune_localizer(seed: int):
 def train_classifier(seed: int):
     set_random_seeds(1234 + seed)
 
-    transform = nn.Sequential(
-        Random(VFlip(), p=0.5),
-        Random(Rotate90(), p=0.05),
-        Random(Shift(), p=.2),
-        Random(RotateAndScale(), p=0.8),
-        BestCrop(samples=10, dsize=(512, 512), size_range=(0.4, 0.6)),
-        OneOf(
-            (RGBShift().only_on('img_pre'), 0.04),
-            (RGBShift().only_on('img_post'), 0.04),
-        ),
-        OneOf(
-            (HSVShift().only_on('img_pre'), 0.04),
-            (HSVShift().only_on('img_post'), 0.04),
-        ),
-        OneOf(
-            (OneOf(
-                (Clahe().only_on('img_pre'), 0.04),
-                (GaussianNoise().only_on('img_pre'), 0.04),
-                (Blur().only_on('img_pre'), 0.1)), 0.04),
-            (OneOf(
-                (Saturation().only_on('img_pre'), 0.04),
-                (Brightness().only_on('img_pre'), 0.04),
-                (Contrast().only_on('img_pre'), 0.04)), 0.1)
-        ),
-        OneOf(
-            (OneOf(
-                (Clahe().only_on('img_post'), 0.04),
-                (GaussianNoise().only_on('img_post'), 0.04),
-                (Blur().only_on('img_post'), 0.1)), 0.04),
-            (OneOf(
-                (Saturation().only_on('img_post'), 0.04),
-                (Brightness().only_on('img_post'), 0.04),
-                (Contrast().only_on('img_post'), 0.04)), 0.1)
-        ),
-        Random(ElasticTransform().only_on('img_pre'), p=0.04),
-        Random(ElasticTransform().only_on('img_post'), p=0.04),
-        Random(Dilation().only_on('msk'), p=0.9)
-    )
+    transform = pipelines.seresnext50_train_classifier()
 
     model = SeResnext50Classifier(SeResnext50Localizer.from_pretrained(version='0', seed=0).unet)
     optimizer = AdamW(model.parameters(), lr=0.0002, weight_decay=1e-6)
@@ -247,44 +168,7 @@ def train_classifier(seed: int):
 
 def tune_classifier(seed: int):
     set_random_seeds(131313 + seed)
-    transform = nn.Sequential(
-        Random(VFlip(), p=0.3),
-        Random(Rotate90(), p=0.7),
-        Random(Shift(), p=.01),
-        Random(RotateAndScale(), p=0.5),
-        BestCrop(samples=10, dsize=(512, 512), size_range=(0.4, 0.6)),
-        OneOf(
-            (RGBShift().only_on('img_pre'), 0.01),
-            (RGBShift().only_on('img_post'), 0.01),
-        ),
-        OneOf(
-            (HSVShift().only_on('img_pre'), 0.01),
-            (HSVShift().only_on('img_post'), 0.01),
-        ),
-        OneOf(
-            (OneOf(
-                (Clahe().only_on('img_pre'), 0.04),
-                (GaussianNoise().only_on('img_pre'), 0.04),
-                (Blur().only_on('img_pre'), 0.04)), 0.01),
-            (OneOf(
-                (Saturation().only_on('img_pre'), 0.01),
-                (Brightness().only_on('img_pre'), 0.01),
-                (Contrast().only_on('img_pre'), 0.01)), 0.01)
-        ),
-        OneOf(
-            (OneOf(
-                (Clahe().only_on('img_post'), 0.01),
-                (GaussianNoise().only_on('img_post'), 0.01),
-                (Blur().only_on('img_post'), 0.01)), 0.01),
-            (OneOf(
-                (Saturation().only_on('img_post'), 0.01),
-                (Brightness().only_on('img_post'), 0.01),
-                (Contrast().only_on('img_post'), 0.01)), 0.01)
-        ),
-        Random(ElasticTransform().only_on('img_pre'), p=0.017),
-        Random(ElasticTransform().only_on('img_post'), p=0.017),
-        Random(Dilation().only_on('msk'), p=0.9)
-    )
+    transform = pipelines.seresnext50_tune_classifier()
 
     model = SeResnext50Classifier.from_checkpoint(version='0', seed=0)
     optimizer = AdamW(model.parameters(), lr=0.00001, weight_decay=1e-6)
@@ -0,0 +1,108 @@
+import argparse
+import json
+import sys
+import time
+from typing import Dict, List, Any, Type
+
+import torch
+from torch import nn
+
+from metadamagenet.models import BaseModel, Localizer
+from metadamagenet.models.unet import (UnetBase, Resnet34Unet, SeResnext50Unet, Dpn92Unet, SeNet154Unet,
+                                       EfficientUnetB0, EfficientUnetB0SCSE, EfficientUnetWideSEB0,
+                                       EfficientUnetB0Big, EfficientUnetB4, EfficientUnetB4SCSE, EfficientUnetB4Big)
+
+BACKBONES: Dict[str, Type[UnetBase]] = {unet.name(): unet for unet in (
+    Resnet34Unet, SeResnext50Unet, Dpn92Unet, SeNet154Unet, EfficientUnetB0, EfficientUnetB0SCSE,
+    EfficientUnetWideSEB0, EfficientUnetB0Big, EfficientUnetB4, EfficientUnetB4SCSE, EfficientUnetB4Big)}
+
+
+def localizer_type(unet_type: Type[UnetBase]) -> Type[Localizer]:
+    class UnetLocalizer(Localizer[unet_type]):
+        pass
+
+    return UnetLocalizer
+
+
+def randomize_batch_norms(model: nn.Module) -> None:
+    """
+    randomly initialized batch norms are identities in eval mode, so folding them would not be verified.
+    """
+    for layer in model.modules():
+        if isinstance(layer, nn.BatchNorm2d):
+            layer.running_mean.uniform_(-0.5, 0.5)
+            layer.running_var.uniform_(0.5, 2)
+            layer.weight.data.uniform_(-1, 2)
+            layer.bias.data.uniform_(-0.5, 0.5)
+
+
+def latency(model: nn.Module, sample: torch.Tensor, iterations: int, warmup: int) -> float:
+    with torch.no_grad():
+        for _ in range(warmup):
+            model(sample)
+        if sample.device.type == 'cuda':
+            torch.cuda.synchronize(sample.device)
+        start: float = time.perf_counter()
+        for _ in range(iterations):
+            model(sample)
+        if sample.device.type == 'cuda':
+            torch.cuda.synchronize(sample.device)
+    return (time.perf_counter() - start) / iterations
+
+
+def main():
+    parser = argparse.ArgumentParser(description='fold batch norms of unet localizers and verify their outputs')
+    parser.add_argument('--backbones', nargs='+', default=list(BACKBONES), choices=list(BACKBONES))
+    parser.add_argument('--checkpoint', nargs=2, metavar=('VERSION', 'SEED'), default=None,
+                        help='checkpoint of localizers. randomly initialized if not given')
+    parser.add_argument('--device', default='cpu')
+    parser.add_argument('--channels-last', action='store_true', help='run models in channels_last memory format')
+    parser.add_argument('--unfrozen', action='store_true', help='only fold batch norms, without freezing models')
+    parser.add_argument('--batch-size', type=int, default=2)
+    parser.add_argument('--size', type=int, default=512, help='height and width of the sample batch')
+    parser.add_argument('--iterations', type=int, default=5)
+    parser.add_argument('--warmup', type=int, default=2)
+    parser.add_argument('--output', default=None, help='json file to write the report in. printed if not given')
+    args = parser.parse_args()
+
+    device = torch.device(args.device)
+    memory_format: torch.memory_format = torch.channels_last if args.channels_last else torch.contiguous_format
+    torch.manual_seed(0)
+    records: List[Dict[str, Any]] = []
+    for name in args.backbones:
+        model_type: Type[Localizer] = localizer_type(BACKBONES[name])
+        model: BaseModel
+        if args.checkpoint is not None:
+            model = model_type.from_pretrained(args.checkpoint[0], int(args.checkpoint[1]))
+        else:
+            model = model_type()
+            randomize_batch_norms(model)
+        model = model.to(device, memory_format=memory_format).eval()
+        sample: torch.Tensor = (torch.rand(args.batch_size, 3, args.size, args.size, device=device) * 2 - 1) \
+            .contiguous(memory_format=memory_format)
+        optimized, report = model.optimize_for_inference(sample, frozen=not args.unfrozen)
+        record: Dict[str, Any] = {'backbone': name, **vars(report),
+                                  'latency': latency(model, sample, args.iterations, args.warmup),
+                                  'optimized_latency': latency(optimized, sample, args.iterations, args.warmup)}
+        record['speedup'] = record['latency'] / record['optimized_latency']
+        print(f"{name}: folded={report.folded} moved={report.moved} frozen={report.frozen} "
+              f"max_abs_deviation={report.max_abs_deviation:.2e} speedup {record['speedup']:.2f}x", file=sys.stderr)
+        records.append(record)
+
+    results = {
+        'torch': torch.__version__,
+        'device': args.device,
+        'channels_last': args.channels_last,
+        'batch_size': args.batch_size,
+        'size': args.size,
+        'records': records,
+    }
+    if args.output is None:
+        print(json.dumps(results, indent=2))
+    else:
+        with open(args.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,11 @@
-from .base import ImageCollection, Random, Transform, CollectionTransform, OnlyOn, OneOf
+from .base import ImageCollection, Random, Transform, CollectionTransform, OnlyOn, OneOf, subset_execution, \
+    channel_batched, is_label
 from .enhance import Clahe, Brightness, Contrast, Saturation, RGBShift, HSVShift
 from .filter import Blur
-from .geometric import ElasticTransform, VFlip, Shift, RotateAndScale, RotateAndScaleState, Rotate90, BestCrop
+from .geometric import AffineTransform, ElasticTransform, VFlip, Shift, RotateAndScale, RotateAndScaleState, Rotate90, \
+    BestCrop, warp_labels
+from .fused import FusedGeometric, fuse_geometric, is_fusable
+from .compiled import static_execution, compile_pipeline
 from .intensity import GaussianNoise
 from .utils import random_float_tensor
 from .transforms import Resize
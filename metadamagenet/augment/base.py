@@ -1,10 +1,12 @@
 import abc
-from typing import Sequence, Dict, TypeVar, Generic, Tuple, Union
+import dataclasses
+from typing import Sequence, Dict, TypeVar, Generic, Tuple, Union, Callable, Iterable, List
 
 import torch
 from torch import nn
 
-__all__ = ('ImageCollection', 'Random', 'Transform', 'CollectionTransform', 'OnlyOn', 'OneOf')
+__all__ = ('ImageCollection', 'Random', 'Transform', 'CollectionTransform', 'OnlyOn', 'OneOf', 'subset_execution',
+           'channel_batched', 'is_label')
 
 
 def _assert_prob(prob: float) -> float:
@@ -19,14 +21,49 @@ def _assert_prob(prob: float) -> float:
 ImageCollection = Dict[str,  # key is data type for example: 'img' or 'img_pre' or 'msk'
                        torch.FloatTensor]  # batch of images for that data type
 
+
+def is_label(key: str) -> bool:
+    """
+    :return: whether a key of an image collection holds label maps ('msk' keys) instead of images.
+             label maps can be integer or bool tensors and their values should never be blended
+    """
+    return key.startswith('msk')
+
 StateType = TypeVar('StateType')
 
 
+def channel_batched(function: Callable[[torch.Tensor], torch.Tensor], img_group: ImageCollection,
+                    keys: Iterable[str]) -> ImageCollection:
+    """
+    applies a channel-wise function on some keys of a collection. keys with the same batch size, image size and dtype
+    are concatenated along the channel dimension, so the function runs once for them. the result is split back.
+    :param function: function which transforms each channel independently of other channels
+    :param img_group: image collection
+    :param keys: keys to apply function on
+    :return: results of keys
+    """
+    groups: Dict[tuple, List[str]] = {}
+    for key in keys:
+        val: torch.Tensor = img_group[key]
+        groups.setdefault((val.size(0), *val.shape[2:], val.dtype), []).append(key)
+    output: ImageCollection = {}
+    for group in groups.values():
+        if len(group) == 1:
+            output[group[0]] = function(img_group[group[0]])
+            continue
+        results: Tuple[torch.Tensor, ...] = function(torch.cat([img_group[key] for key in group], dim=1)) \
+            .split([img_group[key].size(1) for key in group], dim=1)
+        output.update(zip(group, results))
+    return output
+
+
 class Transform(nn.Module, abc.ABC, Generic[StateType]):
     """
     a transform which can ba applied to a batch of images.
     input values are expected to be in [0,1].
     """
+    # transforms each channel independently, so keys sharing a state can be stacked along channels
+    channelwise: bool = False
 
     def __init__(self):
         super().__init__()
@@ -55,6 +92,34 @@ class Transform(nn.Module, abc.ABC, Generic[StateType]):
         """
         pass
 
+    def forward_labels(self, labels: torch.Tensor, state: StateType) -> torch.Tensor:
+        """
+        transforms a batch of label maps, like forward does with images.
+        geometric transforms override it to sample labels with nearest neighbour, keeping their dtype.
+        :param labels: batch of label maps with shape (B,C,H,W), of any dtype
+        :param state: needed parameters for transforms
+        :return: augmented batch of label maps
+        """
+        return self(labels, state)
+
+    def select_state(self, state: StateType, indices: torch.LongTensor) -> StateType:
+        """
+        selects the state of some images of the batch.
+        tensors (and tensor fields of dataclass states) are indexed along their first dimension.
+        transforms whose state is not per image should override it.
+        :param state: state of the whole batch
+        :param indices: indices of selected images
+        :return: state of selected images
+        """
+        if state is None:
+            return None
+        if isinstance(state, torch.Tensor):
+            return state[indices]
+        if dataclasses.is_dataclass(state):
+            return dataclasses.replace(state, **{field.name: getattr(state, field.name)[indices]
+                                                 for field in dataclasses.fields(state)})
+        raise TypeError(f"cannot select state of type {type(state)}")
+
     def only_on(self, *keys: str) -> 'OnlyOn':
         """
         shortcut for creating OnlyOn object
@@ -63,6 +128,9 @@ class Transform(nn.Module, abc.ABC, Generic[StateType]):
 
 
 class CollectionTransform(nn.Module, abc.ABC):
+    # output images can have another size than input images, like crops and resizes
+    changes_size: bool = False
+
     def __init__(self):
         super().__init__()
         self.dummy_param = nn.Parameter(torch.empty(0))
@@ -81,10 +149,22 @@ class OnlyOn(nn.Module):
         super().__init__()
         self.transform: Transform = transform
         self._keys: Sequence[str] = keys
+        self.subset: bool = False
 
     def keys(self) -> Sequence[str]:
         return self._keys
 
+    def _transform(self, img_group: ImageCollection, keys: Iterable[str], state: StateType) -> ImageCollection:
+        output: ImageCollection = {}
+        keys = list(keys)
+        for function, function_keys in ((self.transform, [key for key in keys if not is_label(key)]),
+                                        (self.transform.forward_labels, [key for key in keys if is_label(key)])):
+            if self.transform.channelwise:
+                output.update(channel_batched(lambda images: function(images, state), img_group, function_keys))
+            else:
+                output.update({key: function(img_group[key], state) for key in function_keys})
+        return output
+
     def forward(self, img_group: ImageCollection, state: StateType, apply: torch.BoolTensor) -> ImageCollection:
         """
         :param img_group: image collection
@@ -92,12 +172,41 @@ class OnlyOn(nn.Module):
         :param apply: bool tensor of shape (B,) which indicates whether to apply transform on each image or not
         :return: transformed batch
         """
+        if self.subset:
+            indices: torch.LongTensor = apply.view(-1).nonzero().squeeze(1)
+            if indices.numel() == 0:
+                return img_group
+            return self.apply_subset(img_group, self.transform.select_state(state, indices), indices)
+
         keys = self._keys if len(self._keys) > 0 else img_group.keys()
+        transformed: ImageCollection = self._transform(img_group, [key for key in img_group if key in keys], state)
         key: str
         output: ImageCollection = {}
         for key, val in img_group.items():
             if key in keys:
-                output[key] = ~apply * val + apply * self.transform(val, state)
+                output[key] = torch.where(apply, transformed[key], val)
+            else:
+                output[key] = val
+        return output
+
+    def apply_subset(self, img_group: ImageCollection, state: StateType,
+                     indices: torch.LongTensor) -> ImageCollection:
+        """
+        transforms only the selected images and scatters them back into the batch
+        :param img_group: image collection
+        :param state: transform state of selected images
+        :param indices: indices of selected images
+        :return: transformed batch
+        """
+        keys = self._keys if len(self._keys) > 0 else img_group.keys()
+        selected_keys: List[str] = [key for key in img_group if key in keys]
+        transformed: ImageCollection = self._transform({key: img_group[key][indices] for key in selected_keys},
+                                                       selected_keys, state)
+        key: str
+        output: ImageCollection = {}
+        for key, val in img_group.items():
+            if key in keys:
+                output[key] = val.index_copy(0, indices, transformed[key])
             else:
                 output[key] = val
         return output
@@ -112,12 +221,21 @@ class Random(CollectionTransform):
         super().__init__()
         self.transform: OnlyOn = transform if isinstance(transform, OnlyOn) else OnlyOn(transform)
         self._p: float = _assert_prob(p)
+        self.subset: bool = False
 
     def forward(self, img_group: ImageCollection) -> ImageCollection:
         try:
             input_shape: torch.Size = next(iter(img_group.values())).size()
         except StopIteration:
             raise ValueError(f"img_group should not be empty. keys are {img_group.keys()}")
+        if self.subset:
+            # state is generated only for the selected images
+            indices: torch.LongTensor = (torch.rand(input_shape[0], device=self.device) <= self._p) \
+                .nonzero().squeeze(1)
+            if indices.numel() == 0:
+                return img_group
+            state = self.transform.transform.generate_state(torch.Size((indices.numel(), *input_shape[1:])))
+            return self.transform.apply_subset(img_group, state, indices)
         state = self.transform.transform.generate_state(input_shape)
         apply: torch.BoolTensor = torch.rand(input_shape[0], 1, 1, 1, device=self.device) <= self._p
         return self.transform(img_group, state, apply)
@@ -138,10 +256,23 @@ class OneOf(CollectionTransform):
                 raise ValueError("all transforms should be of the same type")
         self.transforms: nn.ModuleList = nn.ModuleList(transforms)
         self._probs = probs
+        self.subset: bool = False
+        self.static: bool = False
+
+    def probabilities(self) -> Tuple[float, ...]:
+        return self._probs
 
     def forward(self, img_group: ImageCollection) -> ImageCollection:
+        """
+        applies the first transform whose random value is below its probability.
+        transforms of images are chosen per image and collection transforms for the whole batch.
+        random values of all transforms are always drawn, so normal and static execution draw the same numbers
+        for choosing transforms
+        """
         if isinstance(self.transforms[0], OnlyOn):
             input_shape: torch.Size = next(iter(img_group.values())).size()
+            if self.subset:
+                return self._forward_subset(img_group, input_shape)
             applied_to: torch.BoolTensor = torch.zeros(input_shape[0], 1, 1, 1, device=self.device).bool()
             r: OnlyOn
             prob: float
@@ -152,13 +283,77 @@ class OneOf(CollectionTransform):
                               state,
                               torch.logical_and(torch.logical_not(applied_to), randoms))
                 applied_to = torch.logical_or(applied_to, randoms)
-                if torch.all(applied_to):
-                    break
         elif isinstance(self.transforms[0], CollectionTransform):
+            chosen: torch.BoolTensor = self._choose()
+            if self.static:
+                return self._forward_static(img_group, chosen)
+            i: int
             transform: CollectionTransform
-            prob: float
-            for transform, prob in zip(self.transforms, self._probs):
-                if torch.rand(1) <= prob:
-                    img_group = transform(img_group)
-                    break
+            for i, transform in enumerate(self.transforms):
+                if chosen[i]:
+                    return transform(img_group)
+        return img_group
+
+    def _choose(self) -> torch.BoolTensor:
+        """
+        :return: bool tensor of shape (N,) which is true for the chosen collection transform, if any
+        """
+        randoms: torch.BoolTensor = torch.rand(len(self.transforms), device=self.device) <= \
+            torch.tensor(self._probs, device=self.device)
+        return torch.logical_and(randoms, randoms.cumsum(dim=0) == 1)
+
+    def _forward_static(self, img_group: ImageCollection, chosen: torch.BoolTensor) -> ImageCollection:
+        """
+        applies the chosen collection transform without branching on random values.
+        all of them are applied and the output of the chosen one is selected. transforms which are not chosen
+        still draw their random values, so the following transforms of a pipeline draw different numbers
+        than in normal execution. they should not change image sizes, static_execution keeps OneOf of
+        BestCrop and Resize in normal execution.
+        """
+        output: ImageCollection = img_group
+        i: int
+        transform: CollectionTransform
+        for i, transform in enumerate(self.transforms):
+            transformed: ImageCollection = transform(img_group)
+            for key, val in output.items():
+                if transformed[key].shape != val.shape:
+                    raise ValueError(f"{type(transform).__name__} changed the shape of {key} from {tuple(val.shape)} "
+                                     f"to {tuple(transformed[key].shape)}. it cannot run in static execution")
+            output = {key: torch.where(chosen[i], transformed[key], val) for key, val in output.items()}
+        return output
+
+    def _forward_subset(self, img_group: ImageCollection, input_shape: torch.Size) -> ImageCollection:
+        """
+        applies each transform only on the images it is chosen for.
+        states are generated only for those images and transforms which are not chosen for any image are skipped.
+        """
+        applied_to: torch.BoolTensor = torch.zeros(input_shape[0], device=self.device).bool()
+        r: OnlyOn
+        prob: float
+        for r, prob in zip(self.transforms, self._probs):
+            randoms: torch.BoolTensor = torch.rand(input_shape[0], device=self.device) <= prob
+            indices: torch.LongTensor = torch.logical_and(torch.logical_not(applied_to), randoms) \
+                .nonzero().squeeze(1)
+            if indices.numel() > 0:
+                state = r.transform.generate_state(torch.Size((indices.numel(), *input_shape[1:])))
+                img_group = r.apply_subset(img_group, state, indices)
+            applied_to = torch.logical_or(applied_to, randoms)
+            if torch.all(applied_to):
+                break
         return img_group
+
+
+def subset_execution(transform: nn.Module, enabled: bool = True) -> nn.Module:
+    """
+    switches Random, OneOf and OnlyOn modules of a pipeline to (or from) subset execution.
+    in subset execution, transforms run only on the images they are applied to and are skipped
+    when no image is chosen. random numbers are drawn in a different order, so results differ
+    from normal execution for the same seed, but follow the same distribution.
+    :param transform: augmentation pipeline
+    :param enabled: enable or disable subset execution
+    :return: the same pipeline
+    """
+    for module in transform.modules():
+        if isinstance(module, (Random, OneOf, OnlyOn)):
+            module.subset = enabled
+    return transform
@@ -0,0 +1,233 @@
+import dataclasses
+import platform
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Any
+
+import kornia
+import torch
+from torch import nn
+from torch.nn import functional
+from torch.profiler import profile, ProfilerActivity, DeviceType
+
+from .base import ImageCollection, Random, is_label
+from .enhance import Clahe, Brightness, Contrast, Saturation, RGBShift, HSVShift
+from .filter import Blur
+from .geometric import ElasticTransform, VFlip, Shift, RotateAndScale, Rotate90, BestCrop
+from .fused import fuse_geometric
+from .intensity import GaussianNoise
+from .transforms import Resize
+from .morphology import Dilation
+from .pipelines import PIPELINES
+
+__all__ = ('Benchmark', 'transform_benchmarks', 'pipeline_benchmarks', 'synthetic_batch', 'measure', 'run')
+
+LOCALIZATION_KEYS: Tuple[str, ...] = ('img', 'msk')
+CLASSIFICATION_KEYS: Tuple[str, ...] = ('img_pre', 'img_post', 'msk')
+IMAGE_KEYS: Tuple[str, ...] = ('img_pre', 'img_post')
+
+
+@dataclasses.dataclass
+class Benchmark:
+    """
+    a transform to benchmark.
+    build creates the transform. for single transforms it takes the apply probability, pipelines ignore it
+    """
+    name: str
+    kind: str  # 'transform', 'collection' or 'pipeline'
+    keys: Tuple[str, ...]
+    build: Callable[[float], nn.Module]
+    uses_probability: bool
+
+
+def transform_benchmarks() -> List[Benchmark]:
+    """
+    :return: a benchmark for each transform of the package with its default parameters.
+             geometric transforms are applied on all keys of a classification sample, color and intensity transforms
+             on its images and Dilation on its mask
+    """
+    geometric: Dict[str, Callable[[], nn.Module]] = {
+        'VFlip': VFlip,
+        'Rotate90': Rotate90,
+        'Shift': Shift,
+        'RotateAndScale': RotateAndScale,
+        'ElasticTransform': ElasticTransform,
+        'ElasticTransform(downscale=4)': lambda: ElasticTransform(downscale=4),
+    }
+    images: Dict[str, Callable[[], nn.Module]] = {
+        'Clahe': Clahe,
+        'Brightness': Brightness,
+        'Contrast': Contrast,
+        'Saturation': Saturation,
+        'RGBShift': RGBShift,
+        'HSVShift': HSVShift,
+        'Blur': Blur,
+        'GaussianNoise': GaussianNoise,
+    }
+    benchmarks: List[Benchmark] = []
+    for name, factory in geometric.items():
+        benchmarks.append(Benchmark(name, 'transform', CLASSIFICATION_KEYS,
+                                    lambda p, factory=factory: Random(factory(), p=p), True))
+    for name, factory in images.items():
+        benchmarks.append(Benchmark(name, 'transform', CLASSIFICATION_KEYS,
+                                    lambda p, factory=factory: Random(factory().only_on(*IMAGE_KEYS), p=p), True))
+    benchmarks.append(Benchmark('Dilation', 'transform', CLASSIFICATION_KEYS,
+                                lambda p: Random(Dilation().only_on('msk'), p=p), True))
+    benchmarks.append(Benchmark('BestCrop', 'collection', CLASSIFICATION_KEYS, lambda _: BestCrop(), False))
+    benchmarks.append(Benchmark('Resize', 'collection', CLASSIFICATION_KEYS, lambda _: Resize(512, 512), False))
+    return benchmarks
+
+
+def pipeline_benchmarks(fused: bool = False) -> List[Benchmark]:
+    """
+    pipelines of classifiers get classification samples and others get localization samples
+    :param fused: also add the pipelines with fused geometric transforms
+    :return: a benchmark for each augmentation pipeline of the example scripts
+    """
+    benchmarks: List[Benchmark] = []
+    for name, pipeline in PIPELINES.items():
+        keys: Tuple[str, ...] = CLASSIFICATION_KEYS if 'classifier' in name else LOCALIZATION_KEYS
+        benchmarks.append(Benchmark(name, 'pipeline', keys, lambda _, pipeline=pipeline: pipeline(), False))
+        if fused:
+            benchmarks.append(Benchmark(f'{name}[fused]', 'pipeline', keys,
+                                        lambda _, pipeline=pipeline: fuse_geometric(pipeline()), False))
+    return benchmarks
+
+
+def synthetic_batch(keys: Sequence[str], batch_size: int, size: int, device: torch.device) -> ImageCollection:
+    """
+    :return: random images with [0,1] values and uint8 masks with 0-4 values in blocks of 32*32 pixels,
+             like the batches the runners pass to transforms
+    """
+    batch: ImageCollection = {}
+    for key in keys:
+        if is_label(key):
+            blocks: torch.ByteTensor = torch.randint(0, 5, (batch_size, 1, -(-size // 32), -(-size // 32)),
+                                                     dtype=torch.uint8, device=device)
+            batch[key] = functional.interpolate(blocks, scale_factor=32, mode='nearest')[..., :size, :size] \
+                .contiguous()
+        else:
+            batch[key] = torch.rand(batch_size, 3, size, size, device=device)
+    return batch
+
+
+def _synchronize(device: torch.device) -> None:
+    if device.type == 'cuda':
+        torch.cuda.synchronize(device)
+
+
+def _peak_memory(events) -> int:
+    """
+    :return: peak of host memory allocated by the profiled code, from the allocations and frees the profiler recorded
+    """
+    allocated: int = 0
+    peak: int = 0
+    for event in sorted((event for event in events if event.name == '[memory]'),
+                        key=lambda event: event.time_range.start):
+        allocated += event.cpu_memory_usage
+        peak = max(peak, allocated)
+    return peak
+
+
+def measure(transform: nn.Module, batch: ImageCollection, device: torch.device, iterations: int = 5,
+            warmup: int = 1) -> Dict[str, Any]:
+    """
+    :return: throughput, peak memory and operator counts of a transform on a batch.
+             peak memory and counts are taken from a separate profiled run. peak memory is the peak of allocated
+             memory on cuda devices and the peak of host memory allocated by torch on cpu.
+             kernel launches are only counted on cuda devices
+    """
+    batch_size: int = next(iter(batch.values())).size(0)
+    transform = transform.to(device)
+    with torch.no_grad():
+        for _ in range(warmup):
+            transform(batch)
+        _synchronize(device)
+
+        start: float = time.perf_counter()
+        for _ in range(iterations):
+            transform(batch)
+        _synchronize(device)
+        seconds: float = time.perf_counter() - start
+
+        allocated: int = 0
+        if device.type == 'cuda':
+            torch.cuda.reset_peak_memory_stats(device)
+            allocated = torch.cuda.memory_allocated(device)
+        activities: List[ProfilerActivity] = [ProfilerActivity.CPU]
+        if device.type == 'cuda':
+            activities.append(ProfilerActivity.CUDA)
+        with profile(activities=activities, profile_memory=True) as profiler:
+            transform(batch)
+            _synchronize(device)
+    events = profiler.events()
+    peak_memory: int = torch.cuda.max_memory_allocated(device) - allocated if device.type == 'cuda' \
+        else _peak_memory(events)
+    return {
+        'iterations': iterations,
+        'seconds': seconds,
+        'images_per_second': batch_size * iterations / seconds,
+        'peak_memory_bytes': peak_memory,
+        'operators': sum(1 for event in events if event.name.startswith('aten::')),
+        'kernel_launches': sum(1 for event in events if event.device_type == DeviceType.CUDA)
+        if device.type == 'cuda' else None,
+    }
+
+
+def run(benchmarks: Sequence[Benchmark],
+        batch_sizes: Sequence[int] = (1, 4, 16),
+        devices: Sequence[str] = ('cpu',),
+        threads: Sequence[int] = (1, 4),
+        probabilities: Sequence[float] = (0.1, 0.5, 1.),
+        size: int = 1024,
+        iterations: int = 5,
+        warmup: int = 1,
+        seed: int = 0,
+        callback: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+    """
+    runs benchmarks for each combination of device, thread count, batch size and apply probability.
+    probabilities are only swept for single transforms. a failing run is recorded with its error
+    :param callback: called with each record when it is measured
+    :return: environment and a record for each run, which can be saved as json
+    """
+    records: List[Dict[str, Any]] = []
+    default_threads: int = torch.get_num_threads()
+    try:
+        for device_name in devices:
+            device = torch.device(device_name)
+            for thread_count in threads:
+                torch.set_num_threads(thread_count)
+                for batch_size in batch_sizes:
+                    for benchmark in benchmarks:
+                        for p in (probabilities if benchmark.uses_probability else [None]):
+                            torch.manual_seed(seed)
+                            record: Dict[str, Any] = {
+                                'name': benchmark.name,
+                                'kind': benchmark.kind,
+                                'device': device_name,
+                                'threads': thread_count,
+                                'batch_size': batch_size,
+                                'size': size,
+                                'p': p,
+                            }
+                            try:
+                                batch: ImageCollection = synthetic_batch(benchmark.keys, batch_size, size, device)
+                                record.update(measure(benchmark.build(p), batch, device, iterations, warmup))
+                            except Exception as e:
+                                record['error'] = f'{type(e).__name__}: {e}'
+                            records.append(record)
+                            if callback is not None:
+                                callback(record)
+    finally:
+        torch.set_num_threads(default_threads)
+    return {
+        'environment': {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'processor': platform.processor(),
+            'torch': torch.__version__,
+            'kornia': kornia.__version__,
+            'cuda': torch.cuda.get_device_name() if torch.cuda.is_available() else None,
+        },
+        'records': records,
+    }
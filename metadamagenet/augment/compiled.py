@@ -0,0 +1,70 @@
+import copy
+import logging
+
+import torch
+from torch import nn
+
+from .base import Random, OneOf, OnlyOn, CollectionTransform
+from .fused import FusedGeometric, fuse_geometric
+from ..logging import EmojiAdapter
+
+__all__ = ('static_execution', 'compile_pipeline')
+
+logger = EmojiAdapter(logging.getLogger())
+
+
+def _changes_size(one_of: OneOf) -> bool:
+    """
+    :return: whether some collection transforms of a OneOf can change image sizes
+    """
+    return any(isinstance(module, CollectionTransform) and module.changes_size
+               for transform in one_of.transforms for module in transform.modules())
+
+
+def static_execution(transform: nn.Module, enabled: bool = True) -> nn.Module:
+    """
+    switches OneOf and FusedGeometric modules of a pipeline to (or from) static execution and disables
+    subset execution, so the pipeline never branches in python on random values and can be traced as one graph.
+    in static execution, OneOf of collection transforms runs all of them and selects the output of the chosen one,
+    and FusedGeometric warps even when no transform is applied.
+    OneOf of transforms which change image sizes, like BestCrop and Resize, keeps branching in normal execution.
+    random values are drawn in the same order as in normal execution, so a pipeline gives the same results for
+    the same seed, except after a OneOf of collection transforms: its transforms which are not chosen draw random
+    values too, so the transforms following it draw different numbers, with the same distribution.
+    transform states are not changed. they stay the tensors or dataclasses each transform generates.
+    :param transform: augmentation pipeline
+    :param enabled: enable or disable static execution
+    :return: the same pipeline
+    """
+    for module in transform.modules():
+        if isinstance(module, OneOf) and enabled and _changes_size(module):
+            # outputs of its transforms cannot be selected with torch.where, so it keeps branching
+            logger.warning(":warning: OneOf of size changing transforms cannot run in static execution")
+            module.static = False
+        elif isinstance(module, (OneOf, FusedGeometric)):
+            module.static = enabled
+        if enabled and isinstance(module, (Random, OneOf, OnlyOn)):
+            module.subset = False
+    return transform
+
+
+def compile_pipeline(transform: nn.Module, fuse: bool = True, **options) -> nn.Module:
+    """
+    creates a compiled version of an augmentation pipeline.
+    consecutive geometric transforms are fused, the pipeline is switched to static execution
+    and compiled with torch.compile. the given pipeline is not changed.
+    results are the same as the pipeline for the same seed, unless it has a OneOf of collection transforms.
+    after such a OneOf, random values follow the same distribution but differ. see static_execution
+    :param transform: augmentation pipeline
+    :param fuse: fuse consecutive geometric transforms of a sequential pipeline into single warps
+    :param options: keyword arguments of torch.compile, like mode or dynamic
+    :return: compiled pipeline. if torch.compile is not available, the static pipeline without compilation
+    """
+    transform = copy.deepcopy(transform)
+    if fuse and isinstance(transform, nn.Sequential):
+        transform = fuse_geometric(transform)
+    transform = static_execution(transform)
+    if not hasattr(torch, 'compile'):
+        logger.warning(f"torch {torch.__version__} has no torch.compile. augmentation pipeline is not compiled")
+        return transform
+    return torch.compile(transform, **options)
@@ -0,0 +1,123 @@
+from typing import List, Tuple, Union
+
+import torch
+from torch import nn
+import kornia.geometry as kg
+
+from .base import CollectionTransform, ImageCollection, Random, OneOf, OnlyOn, channel_batched, is_label
+from .geometric import AffineTransform, BestCrop, warp_labels
+
+__all__ = ('FusedGeometric', 'fuse_geometric', 'is_fusable')
+
+FusableStep = Union[Random, OneOf, BestCrop]
+
+
+def _is_affine(transform: OnlyOn) -> bool:
+    return isinstance(transform, OnlyOn) and isinstance(transform.transform, AffineTransform) \
+        and len(transform.keys()) == 0
+
+
+def is_fusable(module: nn.Module) -> bool:
+    """
+    :return: whether a transform can be merged into a FusedGeometric.
+             it should apply an affine transform or BestCrop on all keys
+    """
+    if isinstance(module, Random):
+        return _is_affine(module.transform)
+    if isinstance(module, OneOf):
+        return all(_is_affine(transform) for transform in module.transforms)
+    if isinstance(module, BestCrop):
+        return module.only_on is None
+    return False
+
+
+class FusedGeometric(CollectionTransform):
+    """
+    applies a sequence of affine transforms and BestCrop with a single warp of each key.
+    random states and apply decisions are drawn in the same order as running the transforms one by one,
+    and their matrices are multiplied into one affine matrix per image.
+    BestCrop scores its candidates on the mask warped with the matrix accumulated so far.
+    label maps are warped with nearest neighbour sampling.
+    """
+
+    def __init__(self, *steps: FusableStep):
+        super().__init__()
+        for step in steps:
+            if not is_fusable(step):
+                raise ValueError(f"{type(step).__name__} cannot be fused. only Random and OneOf of affine transforms "
+                                 f"applied to all keys and BestCrop without only_on can be fused")
+        self.steps: nn.ModuleList = nn.ModuleList(steps)
+        # always warp, even if no transform is applied
+        self.static: bool = False
+
+    @staticmethod
+    def _warp(images: torch.FloatTensor, matrix: torch.FloatTensor, size: Tuple[int, int],
+              label: bool = False) -> torch.FloatTensor:
+        if label:
+            return warp_labels(images, matrix, size, padding_mode='reflection')
+        return kg.transform.warp_affine(images, matrix[:, :2, :], dsize=size, mode='bilinear',
+                                        padding_mode='reflection')
+
+    def forward(self, img_group: ImageCollection) -> ImageCollection:
+        try:
+            b, c, h, w = next(iter(img_group.values())).size()
+        except StopIteration:
+            raise ValueError(f"img_group should not be empty. keys are {img_group.keys()}")
+        size: Tuple[int, int] = (h, w)
+        identity: torch.FloatTensor = torch.eye(3, device=self.device).unsqueeze(0)
+        matrix: torch.FloatTensor = identity.repeat(b, 1, 1)
+
+        step: FusableStep
+        for step in self.steps:
+            input_shape: torch.Size = torch.Size((b, c, *size))
+            if isinstance(step, Random):
+                transform: AffineTransform = step.transform.transform
+                state = transform.generate_state(input_shape)
+                apply: torch.BoolTensor = torch.rand(b, 1, 1, 1, device=self.device) <= step.probability()
+                matrix = torch.where(apply.view(b, 1, 1), transform.matrix(state, size), identity) @ matrix
+            elif isinstance(step, OneOf):
+                applied_to: torch.BoolTensor = torch.zeros(b, 1, 1, 1, device=self.device).bool()
+                r: OnlyOn
+                prob: float
+                for r, prob in zip(step.transforms, step.probabilities()):
+                    state = r.transform.generate_state(input_shape)
+                    randoms: torch.BoolTensor = torch.rand(b, 1, 1, 1, device=self.device) <= prob
+                    apply = torch.logical_and(torch.logical_not(applied_to), randoms)
+                    matrix = torch.where(apply.view(b, 1, 1), r.transform.matrix(state, size), identity) @ matrix
+                    applied_to = torch.logical_or(applied_to, randoms)
+            else:
+                assert isinstance(step, BestCrop)
+                boxes: torch.FloatTensor = step.select_boxes(self._warp(img_group[step.msk_key], matrix, size,
+                                                                        label=is_label(step.msk_key)))
+                matrix = step.matrix(boxes) @ matrix
+                size = step.dsize
+
+        if not self.static and size == (h, w) and torch.equal(matrix, identity.expand_as(matrix)):
+            return img_group
+        output: ImageCollection = channel_batched(lambda images: self._warp(images, matrix, size), img_group,
+                                                  [key for key in img_group if not is_label(key)])
+        output.update(channel_batched(lambda labels: self._warp(labels, matrix, size, label=True), img_group,
+                                      [key for key in img_group if is_label(key)]))
+        return {key: output[key] for key in img_group}
+
+
+def fuse_geometric(transform: nn.Sequential) -> nn.Sequential:
+    """
+    replaces each run of consecutive fusable transforms in a pipeline with a FusedGeometric
+    :param transform: augmentation pipeline
+    :return: pipeline with the same random behaviour which warps each key once per run
+    """
+    modules: List[nn.Module] = []
+    run: List[FusableStep] = []
+    for module in list(transform) + [None]:
+        if module is not None and is_fusable(module):
+            run.append(module)
+            continue
+        if len(run) > 1:
+            modules.append(FusedGeometric(*run))
+        else:
+            modules.extend(run)
+        run = []
+        if module is not None:
+            modules.append(module)
+    return nn.Sequential(*modules)
@@ -1,37 +1,144 @@
-from typing import Tuple, Optional, Sequence
+import abc
+import math
+from typing import Tuple, Optional, Sequence, List
 import dataclasses
 
 import torch
+from torch.nn import functional
+import kornia.utils
+import kornia.filters as kf
 import kornia.geometry as kg
 
-from .base import Transform, CollectionTransform, ImageCollection
+from .base import Transform, CollectionTransform, ImageCollection, StateType, channel_batched, is_label
 from .utils import random_float_tensor
 
-__all__ = ('VFlip', 'Rotate90', 'Shift', 'RotateAndScaleState', 'RotateAndScale', 'ElasticTransform', 'BestCrop')
+__all__ = ('AffineTransform', 'VFlip', 'Rotate90', 'Shift', 'RotateAndScaleState', 'RotateAndScale',
+           'ElasticTransform', 'BestCrop', 'warp_labels')
+
+
+def _reflect(indices: torch.LongTensor, size: int) -> torch.LongTensor:
+    """
+    reflects pixel indices into [0,size-1] around the centers of border pixels, same as reflection padding of kornia
+    """
+    if size == 1:
+        return torch.zeros_like(indices)
+    period: int = 2 * (size - 1)
+    indices = indices.remainder(period)
+    return torch.where(indices >= size, period - indices, indices)
+
+
+def _sample_nearest(labels: torch.Tensor, x: torch.FloatTensor, y: torch.FloatTensor,
+                    padding_mode: str) -> torch.Tensor:
+    """
+    samples label maps at the nearest pixels of some coordinates, without converting them to float
+    :param labels: label maps of shape (B,C,H,W) of any dtype
+    :param x: x pixel coordinates of shape (B,h,w) or (1,h,w)
+    :param y: y pixel coordinates of shape (B,h,w) or (1,h,w)
+    :param padding_mode: 'reflection' or 'zeros'
+    :return: label maps of shape (B,C,h,w)
+    """
+    b, c, h, w = labels.size()
+    columns: torch.LongTensor = x.round().long()
+    rows: torch.LongTensor = y.round().long()
+    inside: Optional[torch.BoolTensor] = None
+    if padding_mode == 'reflection':
+        columns, rows = _reflect(columns, w), _reflect(rows, h)
+    elif padding_mode == 'zeros':
+        inside = (columns >= 0) & (columns < w) & (rows >= 0) & (rows < h)
+        columns, rows = columns.clamp(0, w - 1), rows.clamp(0, h - 1)
+    else:
+        raise ValueError(f"unsupported padding mode {padding_mode}")
+    index: torch.LongTensor = (rows * w + columns).view(rows.size(0), 1, -1).expand(b, c, -1)
+    sampled: torch.Tensor = labels.reshape(b, c, h * w).gather(dim=2, index=index).view(b, c, *rows.shape[1:])
+    if inside is not None:
+        sampled = torch.where(inside.unsqueeze(1), sampled, torch.zeros_like(sampled))
+    return sampled
+
+
+def warp_labels(labels: torch.Tensor, matrix: torch.FloatTensor, dsize: Tuple[int, int],
+                padding_mode: str = 'zeros') -> torch.Tensor:
+    """
+    warps label maps with nearest neighbour sampling. it keeps their dtype, so uint8 and bool label maps
+    are warped without blending their values or converting them to float.
+    pixels are mapped the same way as kornia's warp_affine and warp_perspective with align_corners=True
+    :param labels: label maps of shape (B,C,H,W) of any dtype
+    :param matrix: matrices of shape (B,3,3) or (1,3,3) mapping pixel coordinates (x,y) of input to output
+    :param dsize: (height,width) of output
+    :param padding_mode: 'reflection' or 'zeros'
+    :return: label maps of shape (B,C,*dsize)
+    """
+    h, w = dsize
+    points: torch.FloatTensor = kornia.utils.create_meshgrid(h, w, normalized_coordinates=False,
+                                                             device=labels.device).view(1, h * w, 2)
+    points = kg.convert_points_to_homogeneous(points).to(matrix.dtype)
+    source: torch.FloatTensor = kg.convert_points_from_homogeneous(points @ torch.inverse(matrix).transpose(1, 2))
+    return _sample_nearest(labels, source[..., 0].view(-1, h, w), source[..., 1].view(-1, h, w), padding_mode)
+
+
+class AffineTransform(Transform[StateType], abc.ABC):
+    """
+    a geometric transform which can be expressed as an affine matrix,
+    so consecutive affine transforms can be merged into a single warp
+    """
+    channelwise = True
+    # padding mode of forward, which is also used for label maps
+    padding_mode: str = 'zeros'
+
+    @abc.abstractmethod
+    def matrix(self, state: StateType, size: Tuple[int, int]) -> torch.FloatTensor:
+        """
+        :param state: transform state
+        :param size: (height,width) of images
+        :return: matrices of shape (B,3,3), or (1,3,3) if they are the same for the batch,
+                 mapping pixel coordinates (x,y) of input images to output images
+        """
+        pass
 
+    def forward_labels(self, labels: torch.Tensor, state: StateType) -> torch.Tensor:
+        size: Tuple[int, int] = (labels.size(-2), labels.size(-1))
+        return warp_labels(labels, self.matrix(state, size), size, self.padding_mode)
 
-class VFlip(Transform[None]):
+
+class VFlip(AffineTransform[None]):
     """image vertical flip"""
 
     def forward(self, images: torch.FloatTensor, _) -> torch.FloatTensor:
         return kg.vflip(images)
 
+    def forward_labels(self, labels: torch.Tensor, _) -> torch.Tensor:
+        return labels.flip(-2)
+
     def generate_state(self, _) -> None:
         return None
 
+    def matrix(self, _, size: Tuple[int, int]) -> torch.FloatTensor:
+        flip: torch.FloatTensor = torch.eye(3, device=self.device)
+        flip[1, 1] = -1
+        flip[1, 2] = size[0] - 1
+        return flip.unsqueeze(0)
 
-class Rotate90(Transform[torch.IntTensor]):
+
+class Rotate90(AffineTransform[torch.FloatTensor]):
     """rotates image 90 degrees randomly between 0-3 times """
 
-    def generate_state(self, input_shape: torch.Size) -> torch.IntTensor:
+    def generate_state(self, input_shape: torch.Size) -> torch.FloatTensor:
         return torch.randint(low=0, high=4, size=(input_shape[0],), device=self.device).float() * 90
 
-    def forward(self, images: torch.FloatTensor, state: torch.IntTensor) -> torch.FloatTensor:
+    def forward(self, images: torch.FloatTensor, state: torch.FloatTensor) -> torch.FloatTensor:
         return kg.rotate(images, state)
 
+    def matrix(self, state: torch.FloatTensor, size: Tuple[int, int]) -> torch.FloatTensor:
+        h, w = size
+        # same matrix as kornia.geometry.rotate, which rotates around image center
+        center: torch.FloatTensor = torch.tensor([[(w - 1) / 2, (h - 1) / 2]], device=self.device) \
+            .repeat(state.size(0), 1)
+        return kg.convert_affinematrix_to_homography(
+            kg.get_rotation_matrix2d(center, state, torch.ones_like(center)))
+
 
-class Shift(Transform[torch.FloatTensor]):
+class Shift(AffineTransform[torch.FloatTensor]):
     """shifts image. moving the shift point to (0,0). replaces empty pixels with reflection"""
+    padding_mode = 'reflection'
 
     def __init__(self, y: Tuple[float, float] = (.2, .8), x: Tuple[float, float] = (.2, .8)):
         """
@@ -52,21 +159,96 @@ class Shift(Transform[torch.FloatTensor]):
         return kg.translate(images, state * torch.tensor([h, w], device=self.device, dtype=torch.float32),
                             padding_mode='reflection')
 
+    def matrix(self, state: torch.FloatTensor, size: Tuple[int, int]) -> torch.FloatTensor:
+        translation: torch.FloatTensor = torch.eye(3, device=self.device).repeat(state.size(0), 1, 1)
+        translation[:, :2, 2] = state * torch.tensor(size, device=self.device, dtype=torch.float32)
+        return translation
+
 
 class ElasticTransform(Transform[torch.FloatTensor]):
+    """
+    elastic transform of kornia.
+    with downscale > 1, the random displacement field is drawn on a grid downscale times coarser than the image,
+    smoothed there with a separable gaussian of sigma / downscale and upsampled bilinearly.
+    smoothed field is scaled to have the same standard deviation as the full resolution one,
+    so sigma and alpha keep their meaning. downscale should be small enough to keep sigma / downscale about 2 or more.
+    """
+    channelwise = True
+
     def __init__(self, kernel_size: Tuple[int, int] = (63, 63), sigma: Tuple[float, float] = (10., 10.),
-                 alpha: Tuple[float, float] = (0.0, 0.5)):
+                 alpha: Tuple[float, float] = (0.0, 0.5), downscale: int = 1):
+        """
+        :param kernel_size: size of gaussian kernel which smooths the displacement field
+        :param sigma: standard deviation of gaussian kernel
+        :param alpha: scale of displacement in x and y directions
+        :param downscale: factor by which the displacement field is coarser than the image. 1 uses kornia directly
+        """
         super().__init__()
+        if downscale < 1:
+            raise ValueError(f"downscale should be a positive integer. got {downscale}")
         self._kernel_size: Tuple[int, int] = kernel_size
         self._sigma: Tuple[float, float] = sigma
         self._alpha: Tuple[float, float] = alpha
+        self._downscale: int = downscale
 
     def generate_state(self, input_shape: torch.Size) -> torch.FloatTensor:
         b, _, h, w = input_shape
-        return random_float_tensor((b, 2, h, w), (-1., 1.), device=self.device)
+        r: int = self._downscale
+        return random_float_tensor((b, 2, -(-h // r), -(-w // r)), (-1., 1.), device=self.device)
+
+    @staticmethod
+    def _kernel(sigma: float, size: int, device: torch.device) -> torch.FloatTensor:
+        return kf.get_gaussian_kernel1d(size, sigma).to(device)
+
+    def _displacement(self, state: torch.FloatTensor, size: Tuple[int, int]) -> torch.FloatTensor:
+        """
+        :return: displacement field of shape (B,2,H,W) in normalized coordinates
+        """
+        r: int = self._downscale
+        # same as kornia, x displacement is smoothed with sigma[1] and y displacement with sigma[0]
+        sigmas: Tuple[float, float] = (self._sigma[1], self._sigma[0])
+        if r == 1:
+            kh, kw = self._kernel_size
+            full_kernels: torch.FloatTensor = torch.stack([kf.get_gaussian_kernel2d(self._kernel_size, (sigma, sigma))
+                                                           for sigma in sigmas]).unsqueeze(1).to(state.device)
+            return functional.conv2d(state, full_kernels, padding=(kh // 2, kw // 2), groups=2) * \
+                torch.tensor(self._alpha, device=state.device).view(1, 2, 1, 1)
+
+        coarse_size: int = 2 * math.ceil(3 * max(sigmas) / r) + 1
+        kernels: torch.FloatTensor = torch.stack([self._kernel(sigma / r, coarse_size, state.device)
+                                                  for sigma in sigmas]).unsqueeze(1).unsqueeze(1)  # 2*1*1*k
+        displacement: torch.FloatTensor = functional.conv2d(state, kernels, padding=(0, coarse_size // 2), groups=2)
+        displacement = functional.conv2d(displacement, kernels.transpose(2, 3), padding=(coarse_size // 2, 0),
+                                         groups=2)
+
+        # match standard deviation of smoothing full resolution noise with the full kernel
+        scales: List[float] = []
+        for sigma, alpha in zip(sigmas, self._alpha):
+            full: float = float(self._kernel(sigma, self._kernel_size[0], state.device).norm() *
+                                self._kernel(sigma, self._kernel_size[1], state.device).norm())
+            coarse: float = float(self._kernel(sigma / r, coarse_size, state.device).norm()) ** 2
+            scales.append(alpha * full / coarse)
+        displacement = displacement * torch.tensor(scales, device=state.device).view(1, 2, 1, 1)
+
+        h, w = size
+        displacement = functional.interpolate(displacement, scale_factor=r, mode='bilinear', align_corners=False)
+        return displacement[:, :, :h, :w]
 
     def forward(self, images: torch.FloatTensor, state: torch.FloatTensor) -> torch.FloatTensor:
-        return kg.elastic_transform2d(images, state, self._kernel_size, self._sigma, self._alpha)
+        if self._downscale == 1:
+            return kg.elastic_transform2d(images, state, self._kernel_size, self._sigma, self._alpha)
+        b, _, h, w = images.size()
+        grid: torch.FloatTensor = kornia.utils.create_meshgrid(h, w, device=images.device).to(images.dtype)
+        displacement: torch.FloatTensor = self._displacement(state, (h, w)).to(images.dtype).permute(0, 2, 3, 1)
+        return functional.grid_sample(images, (grid + displacement).clamp(-1, 1), mode='bilinear',
+                                      padding_mode='zeros', align_corners=False)
+
+    def forward_labels(self, labels: torch.Tensor, state: torch.FloatTensor) -> torch.Tensor:
+        _, _, h, w = labels.size()
+        grid: torch.FloatTensor = kornia.utils.create_meshgrid(h, w, device=labels.device)
+        grid = (grid + self._displacement(state, (h, w)).permute(0, 2, 3, 1)).clamp(-1, 1)
+        # pixel coordinates of grid_sample with align_corners=False
+        return _sample_nearest(labels, ((grid[..., 0] + 1) * w - 1) / 2, ((grid[..., 1] + 1) * h - 1) / 2, 'zeros')
 
 
 @dataclasses.dataclass
@@ -76,8 +258,9 @@ class RotateAndScaleState:
     scale: torch.FloatTensor  # B
 
 
-class RotateAndScale(Transform[RotateAndScaleState]):
+class RotateAndScale(AffineTransform[RotateAndScaleState]):
     """ rotate image around a center and scale"""
+    padding_mode = 'reflection'
 
     def __init__(self,
                  center_y: Tuple[float, float] = (0.3, 0.7),
@@ -108,20 +291,23 @@ class RotateAndScale(Transform[RotateAndScaleState]):
             scale=random_float_tensor((input_shape[0], 1), self._scale, device=self.device).repeat(1, 2)
         )
 
-    def forward(self, images: torch.FloatTensor, state: RotateAndScaleState) -> torch.FloatTensor:
-        _, _, h, w = images.size()
-        transform_mat: torch.Tensor = kg.get_rotation_matrix2d(
-            state.center * torch.tensor([h, w], device=self.device, dtype=torch.float32),
+    def matrix(self, state: RotateAndScaleState, size: Tuple[int, int]) -> torch.FloatTensor:
+        return kg.convert_affinematrix_to_homography(kg.get_rotation_matrix2d(
+            state.center * torch.tensor(size, device=self.device, dtype=torch.float32),
             state.angle,
-            state.scale)
+            state.scale))
+
+    def forward(self, images: torch.FloatTensor, state: RotateAndScaleState) -> torch.FloatTensor:
         return kg.transform.warp_affine(images,
-                                        transform_mat,
+                                        self.matrix(state, (images.size(-2), images.size(-1)))[:, :2, :],
                                         dsize=(images.size(-2), images.size(-1)),
                                         mode='bilinear',
                                         padding_mode='reflection')
 
 
 class BestCrop(CollectionTransform):
+    changes_size = True
+
     def __init__(self,
                  samples: int = 5,
                  size_range: Tuple[float, float] = (0.9, 1),
@@ -149,24 +335,70 @@ class BestCrop(CollectionTransform):
         bottom_right_rel = top_left_rel + sizes_rel
         return torch.stack((top_left_rel, top_right_rel, bottom_right_rel, bottom_left_rel), dim=1)
 
-    def forward(self, collection: ImageCollection) -> ImageCollection:
-        b, c, h, w = collection[self._msk_key].size()
-        img_shape = torch.tensor([h, w], device=self.device)
-        repeated_msk = collection[self._msk_key].unsqueeze(1).repeat(1, self._samples, 1, 1, 1) \
-            .reshape(b * self._samples, c, h, w)
+    @property
+    def dsize(self) -> Tuple[int, int]:
+        return self._dsize
+
+    @property
+    def only_on(self) -> Optional[Sequence[str]]:
+        return self._only_on
 
+    @property
+    def msk_key(self) -> str:
+        return self._msk_key
+
+    def select_boxes(self, msk: torch.FloatTensor) -> torch.FloatTensor:
+        """
+        candidates are scored by their mean mask value, which is read from an integral image of the mask
+        in constant time per candidate.
+        :param msk: batch of masks of shape (B,C,H,W)
+        :return: boxes of shape (B,4,2) containing the most mask pixels among the candidates
+        """
+        b, c, h, w = msk.size()
+        img_shape = torch.tensor([h, w], device=self.device)
         candidate_boxes: torch.FloatTensor = self._generate_boxes(b, self._samples) * img_shape
-        candidates: torch.FloatTensor = kg.transform.crop_and_resize(repeated_msk, candidate_boxes, size=self._dsize,
-                                                                     padding_mode='reflection') \
-            .reshape(b, self._samples, -1)
-        indices = candidates.sum(dim=2).argmax(dim=1, keepdim=True).unsqueeze(-1).repeat(1, 1, 4 * 2)
-        boxes = candidate_boxes.reshape(b, self._samples, 4 * 2).gather(dim=1, index=indices).reshape(b, 4, 2)
+        if self._samples == 1:
+            return candidate_boxes
+
+        integral: torch.Tensor = functional.pad(msk.sum(dim=1).double().cumsum(1).cumsum(2), (1, 0, 1, 0)) \
+            .reshape(b, -1)
+        # corners of the box are the centers of its first and last pixels, same as crop_and_resize
+        corners: torch.LongTensor = candidate_boxes.reshape(b, self._samples, 4, 2).round().long()
+        lefts: torch.LongTensor = corners[:, :, 0, 0].clamp(0, w - 1)
+        tops: torch.LongTensor = corners[:, :, 0, 1].clamp(0, h - 1)
+        rights: torch.LongTensor = torch.maximum(corners[:, :, 2, 0].clamp(max=w - 1), lefts) + 1
+        bottoms: torch.LongTensor = torch.maximum(corners[:, :, 2, 1].clamp(max=h - 1), tops) + 1
+
+        def at(rows: torch.LongTensor, columns: torch.LongTensor) -> torch.Tensor:
+            return integral.gather(dim=1, index=rows * (w + 1) + columns)
+
+        sums: torch.Tensor = at(bottoms, rights) - at(tops, rights) - at(bottoms, lefts) + at(tops, lefts)
+        scores: torch.Tensor = sums / ((bottoms - tops) * (rights - lefts))
+        indices = scores.argmax(dim=1, keepdim=True).unsqueeze(-1).repeat(1, 1, 4 * 2)
+        return candidate_boxes.reshape(b, self._samples, 4 * 2).gather(dim=1, index=indices).reshape(b, 4, 2)
+
+    def matrix(self, boxes: torch.FloatTensor) -> torch.FloatTensor:
+        """
+        :param boxes: crop boxes of shape (B,4,2)
+        :return: matrices of shape (B,3,3) mapping boxes to output images, same as kornia's crop_and_resize
+        """
+        h, w = self._dsize
+        points_dst: torch.FloatTensor = torch.tensor([[[0, 0], [w - 1, 0], [w - 1, h - 1], [0, h - 1]]],
+                                                     device=boxes.device, dtype=boxes.dtype) \
+            .repeat(boxes.size(0), 1, 1)
+        return kg.get_perspective_transform(boxes, points_dst)
+
+    def forward(self, collection: ImageCollection) -> ImageCollection:
+        boxes: torch.FloatTensor = self.select_boxes(collection[self._msk_key])
 
-        result: ImageCollection = {}
         keys = self._only_on if self._only_on is not None else collection.keys()
-        for key, val in collection.items():
-            if key in keys:
-                result[key] = kg.transform.crop_and_resize(val, boxes, size=self._dsize, padding_mode='reflection')
-            else:
-                result[key] = val
-        return result
+        selected_keys: List[str] = [key for key in collection if key in keys]
+        cropped: ImageCollection = channel_batched(
+            lambda images: kg.transform.crop_and_resize(images, boxes, size=self._dsize, padding_mode='reflection'),
+            collection, [key for key in selected_keys if not is_label(key)])
+        matrix: Optional[torch.FloatTensor] = None
+        if any(is_label(key) for key in selected_keys):
+            matrix = self.matrix(boxes)
+        cropped.update(channel_batched(lambda labels: warp_labels(labels, matrix, self._dsize, 'reflection'),
+                                       collection, [key for key in selected_keys if is_label(key)]))
+        return {key: cropped.get(key, val) for key, val in collection.items()}
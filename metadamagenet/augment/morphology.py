@@ -1,18 +1,38 @@
+import math
 from typing import Tuple
 
 import torch
+from torch.nn import functional
 
 from .base import Transform
-import kornia.morphology as km
 
 
-class Dilation(Transform[torch.IntTensor]):
+class Dilation(Transform[torch.FloatTensor]):
+    """
+    dilation with a flat rectangular kernel, which is a maximum filter.
+    it is computed with max pooling for float tensors and with a separable maximum for integer and bool label maps.
+    pixels outside the image are ignored, same as geodesic border of kornia's dilation
+    """
+
     def __init__(self, kernel_size: Tuple[int, int] = (5, 5)):
         super().__init__()
         self._kernel_size: Tuple[int, int] = kernel_size
 
-    def generate_state(self, input_shape: torch.Size) -> torch.IntTensor:
+    def generate_state(self, input_shape: torch.Size) -> torch.FloatTensor:
         return torch.ones(self._kernel_size, device=self.device)
 
-    def forward(self, images: torch.FloatTensor, state: torch.IntTensor) -> torch.FloatTensor:
-        return km.dilation(images, state)
+    def select_state(self, state: torch.FloatTensor, indices: torch.LongTensor) -> torch.FloatTensor:
+        # the kernel is shared by all images
+        return state
+
+    def forward(self, images: torch.Tensor, state: torch.FloatTensor) -> torch.Tensor:
+        kh, kw = state.shape
+        # same origin as kornia, kernel_size // 2
+        padding: Tuple[int, int, int, int] = (kw // 2, kw - kw // 2 - 1, kh // 2, kh - kh // 2 - 1)
+        if images.is_floating_point():
+            return functional.max_pool2d(functional.pad(images, padding, value=-math.inf), (kh, kw), stride=1)
+        if images.dtype == torch.bool:
+            return self(images.to(torch.uint8), state).bool()
+        # padding with the minimum value keeps it out of the maximum
+        padded: torch.Tensor = functional.pad(images, padding, value=int(torch.iinfo(images.dtype).min))
+        return padded.unfold(2, kh, 1).amax(dim=-1).unfold(3, kw, 1).amax(dim=-1)
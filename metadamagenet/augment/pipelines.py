@@ -0,0 +1,496 @@
+"""
+augmentation pipelines used by the example training scripts.
+they are defined here so they can be imported, e.g. by the augmentation benchmark
+"""
+from typing import Dict, Callable
+
+from torch import nn
+
+from .base import Random, OneOf
+from .enhance import Clahe, Brightness, Contrast, Saturation, RGBShift, HSVShift
+from .filter import Blur
+from .geometric import ElasticTransform, VFlip, Shift, RotateAndScale, Rotate90, BestCrop
+from .intensity import GaussianNoise
+from .morphology import Dilation
+
+__all__ = ('PIPELINES',)
+
+
+def resnet34_train_localizer() -> nn.Sequential:
+    return nn.Sequential(
+        Random(VFlip(), p=0.5),
+        Random(Rotate90(), p=0.95),
+        Random(Shift(), p=.2),
+        Random(RotateAndScale(), p=0.8),
+        BestCrop(samples=5, dsize=(736, 736), size_range=(0.6, 0.9)),
+        OneOf(
+            (RGBShift().only_on('img'), 0.03),
+            (HSVShift().only_on('img'), 0.03)
+        ),
+        OneOf(
+            (OneOf(
+                (Clahe().only_on('img'), 0.03),
+                (GaussianNoise().only_on('img'), 0.03),
+                (Blur().only_on('img'), 0.02)), 0.07),
+            (OneOf(
+                (Saturation().only_on('img'), 0.03),
+                (Brightness().only_on('img'), 0.03),
+                (Contrast().only_on('img'), 0.03)), 0.07)
+        ),
+        Random(ElasticTransform().only_on('img'), p=0.03)
+    )
+
+
+def resnet34_train_classifier() -> nn.Sequential:
+    return nn.Sequential(
+        Random(VFlip(), p=0.5),
+        Random(Rotate90(), p=0.95),
+        Random(Shift(), p=.1),
+        Random(RotateAndScale(), p=0.4),
+        BestCrop(samples=10, dsize=(608, 608), size_range=(0.65, 0.85)),
+        OneOf(
+            (RGBShift().only_on('img_pre'), 0.015),
+            (RGBShift().only_on('img_post'), 0.015),
+        ),
+        OneOf(
+            (HSVShift().only_on('img_pre'), 0.015),
+            (HSVShift().only_on('img_post'), 0.015),
+        ),
+        OneOf(
+            (OneOf(
+                (Clahe().only_on('img_pre'), 0.015),
+                (GaussianNoise().only_on('img_pre'), 0.015),
+                (Blur().only_on('img_pre'), 0.1)), 0.015),
+            (OneOf(
+                (Saturation().only_on('img_pre'), 0.015),
+                (Brightness().only_on('img_pre'), 0.015),
+                (Contrast().only_on('img_pre'), 0.015)), 0.02)
+        ),
+        OneOf(
+            (OneOf(
+                (Clahe().only_on('img_post'), 0.015),
+                (GaussianNoise().only_on('img_post'), 0.015),
+                (Blur().only_on('img_post'), 0.1)), 0.015),
+            (OneOf(
+                (Saturation().only_on('img_post'), 0.015),
+                (Brightness().only_on('img_post'), 0.015),
+                (Contrast().only_on('img_post'), 0.015)), 0.02)
+        ),
+        Random(ElasticTransform().only_on('img_pre'), p=0.017),
+        Random(ElasticTransform().only_on('img_post'), p=0.017),
+        Random(Dilation().only_on('msk'), p=0.9)
+    )
+
+
+def resnet34_tune_classifier() -> nn.Sequential:
+    return nn.Sequential(
+        Random(VFlip(), p=0.3),
+        Random(Rotate90(), p=0.7),
+        Random(Shift(), p=.02),
+        Random(RotateAndScale(), p=0.5),
+        BestCrop(samples=10, dsize=(608, 608), size_range=(0.65, 0.85)),
+        OneOf(
+            (RGBShift().only_on('img_pre'), 0.01),
+            (RGBShift().only_on('img_post'), 0.01),
+        ),
+        OneOf(
+            (HSVShift().only_on('img_pre'), 0.01),
+            (HSVShift().only_on('img_post'), 0.01),
+        ),
+        OneOf(
+            (OneOf(
+                (Clahe().only_on('img_pre'), 0.01),
+                (GaussianNoise().only_on('img_pre'), 0.01),
+                (Blur().only_on('img_pre'), 0.01)), 0.01),
+            (OneOf(
+                (Saturation().only_on('img_pre'), 0.01),
+                (Brightness().only_on('img_pre'), 0.01),
+                (Contrast().only_on('img_pre'), 0.01)), 0.01)
+        ),
+        OneOf(
+            (OneOf(
+                (Clahe().only_on('img_post'), 0.015),
+                (GaussianNoise().only_on('img_post'), 0.015),
+                (Blur().only_on('img_post'), 0.015)), 0.01),
+            (OneOf(
+                (Saturation().only_on('img_post'), 0.01),
+                (Brightness().only_on('img_post'), 0.01),
+                (Contrast().only_on('img_post'), 0.01)), 0.01)
+        ),
+        Random(ElasticTransform().only_on('img_pre'), p=0.01),
+        Random(ElasticTransform().only_on('img_post'), p=0.01),
+        Random(Dilation().only_on('msk'), p=0.9)
+    )
+
+
+def seresnext50_train_localizer() -> nn.Sequential:
+    return nn.Sequential(
+        Random(VFlip(), p=0.5),
+        Random(Rotate90(), p=0.95),
+        Random(Shift(), p=.1),
+        Random(RotateAndScale(), p=0.1),
+        BestCrop(samples=5, dsize=(512, 512), size_range=(0.45, 0.55)),
+        Random(RGBShift().only_on('img'), p=0.01),
+        Random(HSVShift().only_on('img'), p=0.01),
+        OneOf(
+            (OneOf(
+                (Clahe().only_on('img'), 0.01),
+                (GaussianNoise().only_on('img'), 0.01),
+                (Blur().only_on('img'), 0.01)), 0.01),
+            (OneOf(
+                (Saturation().only_on('img'), 0.01),
+                (Brightness().only_on('img'), 0.01),
+                (Contrast().only_on('img'), 0.01)), 0.01)
+        ),
+        Random(ElasticTransform().only_on('img'), p=0.001)
+    )
+
+
+def seresnext50_tune_localizer() -> nn.Sequential:
+    return nn.Sequential(
+        Random(VFlip(), p=0.45),
+        Random(Rotate90(), p=0.9),
+        Random(Shift(), p=.05),
+        Random(RotateAndScale(), p=0.05),
+        BestCrop(samples=5, dsize=(512, 512), size_range=(0.45, 0.55)),
+        OneOf(
+            (RGBShift().only_on('img'), 0.01),
+            (HSVShift().only_on('img'), 0.01)
+        ),
+        OneOf(
+            (OneOf(
+                (Clahe().only_on('img'), 0.01),
+                (GaussianNoise().only_on('img'), 0.01),
+                (Blur().only_on('img'), 0.01)), 0.01),
+            (OneOf(
+                (Saturation().only_on('img'), 0.01),
+                (Brightness().only_on('img'), 0.01),
+                (Contrast().only_on('img'), 0.01)), 0.01)
+        ),
+        Random(ElasticTransform().only_on('img'), p=0.001)
+    )
+
+
+def seresnext50_train_classifier() -> nn.Sequential:
+    return nn.Sequential(
+        Random(VFlip(), p=0.5),
+        Random(Rotate90(), p=0.05),
+        Random(Shift(), p=.2),
+        Random(RotateAndScale(), p=0.8),
+        BestCrop(samples=10, dsize=(512, 512), size_range=(0.4, 0.6)),
+        OneOf(
+            (RGBShift().only_on('img_pre'), 0.04),
+            (RGBShift().only_on('img_post'), 0.04),
+        ),
+        OneOf(
+            (HSVShift().only_on('img_pre'), 0.04),
+            (HSVShift().only_on('img_post'), 0.04),
+        ),
+        OneOf(
+            (OneOf(
+                (Clahe().only_on('img_pre'), 0.04),
+                (GaussianNoise().only_on('img_pre'), 0.04),
+                (Blur().only_on('img_pre'), 0.1)), 0.04),
+            (OneOf(
+                (Saturation().only_on('img_pre'), 0.04),
+                (Brightness().only_on('img_pre'), 0.04),
+                (Contrast().only_on('img_pre'), 0.04)), 0.1)
+        ),
+        OneOf(
+            (OneOf(
+                (Clahe().only_on('img_post'), 0.04),
+                (GaussianNoise().only_on('img_post'), 0.04),
+                (Blur().only_on('img_post'), 0.1)), 0.04),
+            (OneOf(
+                (Saturation().only_on('img_post'), 0.04),
+                (Brightness().only_on('img_post'), 0.04),
+                (Contrast().only_on('img_post'), 0.04)), 0.1)
+        ),
+        Random(ElasticTransform().only_on('img_pre'), p=0.04),
+        Random(ElasticTransform().only_on('img_post'), p=0.04),
+        Random(Dilation().only_on('msk'), p=0.9)
+    )
+
+
+def seresnext50_tune_classifier() -> nn.Sequential:
+    return nn.Sequential(
+        Random(VFlip(), p=0.3),
+        Random(Rotate90(), p=0.7),
+        Random(Shift(), p=.01),
+        Random(RotateAndScale(), p=0.5),
+        BestCrop(samples=10, dsize=(512, 512), size_range=(0.4, 0.6)),
+        OneOf(
+            (RGBShift().only_on('img_pre'), 0.01),
+            (RGBShift().only_on('img_post'), 0.01),
+        ),
+        OneOf(
+            (HSVShift().only_on('img_pre'), 0.01),
+            (HSVShift().only_on('img_post'), 0.01),
+        ),
+        OneOf(
+            (OneOf(
+                (Clahe().only_on('img_pre'), 0.04),
+                (GaussianNoise().only_on('img_pre'), 0.04),
+                (Blur().only_on('img_pre'), 0.04)), 0.01),
+            (OneOf(
+                (Saturation().only_on('img_pre'), 0.01),
+                (Brightness().only_on('img_pre'), 0.01),
+                (Contrast().only_on('img_pre'), 0.01)), 0.01)
+        ),
+        OneOf(
+            (OneOf(
+                (Clahe().only_on('img_post'), 0.01),
+                (GaussianNoise().only_on('img_post'), 0.01),
+                (Blur().only_on('img_post'), 0.01)), 0.01),
+            (OneOf(
+                (Saturation().only_on('img_post'), 0.01),
+                (Brightness().only_on('img_post'), 0.01),
+                (Contrast().only_on('img_post'), 0.01)), 0.01)
+        ),
+        Random(ElasticTransform().only_on('img_pre'), p=0.017),
+        Random(ElasticTransform().only_on('img_post'), p=0.017),
+        Random(Dilation().only_on('msk'), p=0.9)
+    )
+
+
+def dpn92_train_localizer() -> nn.Sequential:
+    return nn.Sequential(
+        Random(VFlip(), p=0.5),
+        Random(Rotate90(), p=0.95),
+        Random(Shift(y=(.2, .8), x=(.2, .8)), p=.1),
+        Random(RotateAndScale(center_y=(0.3, 0.7), center_x=(0.3, 0.7), angle=(-10., 10.), scale=(.9, 1.1)), p=0.1),
+        BestCrop(samples=5, dsize=(512, 512), size_range=(0.45, 0.55)),
+        Random(RGBShift().only_on('img'), p=0.01),
+        Random(HSVShift().only_on('img'), p=0.01),
+        OneOf(
+            (OneOf(
+                (Clahe().only_on('img'), 0.01),
+                (GaussianNoise().only_on('img'), 0.01),
+                (Blur().only_on('img'), 0.01)), 0.01),
+            (OneOf(
+                (Saturation().only_on('img'), 0.01),
+                (Brightness().only_on('img'), 0.01),
+                (Contrast().only_on('img'), 0.01)), 0.01)
+        ),
+        Random(ElasticTransform(), p=0.001)
+    )
+
+
+def dpn92_tune_localizer() -> nn.Sequential:
+    return nn.Sequential(
+        Random(VFlip(), p=0.45),
+        Random(Rotate90(), p=0.9),
+        Random(Shift(), p=.05),
+        Random(RotateAndScale(), p=0.05),
+        BestCrop(samples=5, dsize=(512, 512), size_range=(0.45, 0.55)),
+        OneOf(
+            (RGBShift().only_on('img'), 0.01),
+            (HSVShift().only_on('img'), 0.01)
+        ),
+        OneOf(
+            (OneOf(
+                (Clahe().only_on('img'), 0.01),
+                (GaussianNoise().only_on('img'), 0.01),
+                (Blur().only_on('img'), 0.01)), 0.01),
+            (OneOf(
+                (Saturation().only_on('img'), 0.01),
+                (Brightness().only_on('img'), 0.01),
+                (Contrast().only_on('img'), 0.01)), 0.01)
+        ),
+        Random(ElasticTransform().only_on('img'), p=0.001)
+    )
+
+
+def dpn92_train_classifier() -> nn.Sequential:
+    return nn.Sequential(
+        Random(VFlip(), p=0.5),
+        Random(Rotate90(), p=0.9999),
+        Random(Shift(y=(.2, .8), x=(.2, .8)), p=.5),
+        Random(RotateAndScale(center_y=(0.3, 0.7), center_x=(0.3, 0.7), angle=(-10., 10.), scale=(.9, 1.1)), p=0.95),
+        BestCrop(samples=10, dsize=(512, 512), size_range=(0.4, 0.6)),
+        OneOf(
+            (RGBShift().only_on('img_pre'), 0.1),
+            (RGBShift().only_on('img_post'), 0.1),
+        ),
+        OneOf(
+            (HSVShift().only_on('img_pre'), 0.1),
+            (HSVShift().only_on('img_post'), 0.1),
+        ),
+        OneOf(
+            (OneOf(
+                (Clahe().only_on('img_pre'), 0.1),
+                (GaussianNoise().only_on('img_pre'), 0.1),
+                (Blur().only_on('img_pre'), 0.1)), 0.1),
+            (OneOf(
+                (Saturation().only_on('img_pre'), 0.1),
+                (Brightness().only_on('img_pre'), 0.1),
+                (Contrast().only_on('img_pre'), 0.1)), 0.1)
+        ),
+        OneOf(
+            (OneOf(
+                (Clahe().only_on('img_post'), 0.1),
+                (GaussianNoise().only_on('img_post'), 0.1),
+                (Blur().only_on('img_post'), 0.1)), 0.1),
+            (OneOf(
+                (Saturation().only_on('img_post'), 0.1),
+                (Brightness().only_on('img_post'), 0.1),
+                (Contrast().only_on('img_post'), 0.1)), 0.1)
+        ),
+        Random(ElasticTransform().only_on('img_pre'), p=0.1),
+        Random(ElasticTransform().only_on('img_post'), p=0.1),
+        Random(Dilation().only_on('msk'), p=0.9)
+    )
+
+
+def dpn92_tune_classifier() -> nn.Sequential:
+    return nn.Sequential(
+        Random(VFlip(), p=0.3),
+        Random(Rotate90(), p=0.7),
+        Random(Shift(), p=.01),
+        Random(RotateAndScale(), p=0.5),
+        BestCrop(samples=10, dsize=(512, 512), size_range=(0.4, 0.6)),
+        OneOf(
+            (RGBShift().only_on('img_pre'), 0.01),
+            (RGBShift().only_on('img_post'), 0.01),
+        ),
+        OneOf(
+            (HSVShift().only_on('img_pre'), 0.01),
+            (HSVShift().only_on('img_post'), 0.01),
+        ),
+        OneOf(
+            (OneOf(
+                (Clahe().only_on('img_pre'), 0.01),
+                (GaussianNoise().only_on('img_pre'), 0.01),
+                (Blur().only_on('img_pre'), 0.01)), 0.01),
+            (OneOf(
+                (Saturation().only_on('img_pre'), 0.01),
+                (Brightness().only_on('img_pre'), 0.01),
+                (Contrast().only_on('img_pre'), 0.01)), 0.01)
+        ),
+        OneOf(
+            (OneOf(
+                (Clahe().only_on('img_post'), 0.01),
+                (GaussianNoise().only_on('img_post'), 0.01),
+                (Blur().only_on('img_post'), 0.01)), 0.01),
+            (OneOf(
+                (Saturation().only_on('img_post'), 0.01),
+                (Brightness().only_on('img_post'), 0.01),
+                (Contrast().only_on('img_post'), 0.01)), 0.01)
+        ),
+        Random(ElasticTransform().only_on('img_pre'), p=0.01),
+        Random(ElasticTransform().only_on('img_post'), p=0.01),
+        Random(Dilation().only_on('msk'), p=0.9)
+    )
+
+
+def senet154_train_localizer() -> nn.Sequential:
+    return nn.Sequential(
+        Random(VFlip(), p=0.4),
+        Random(Rotate90(), p=0.9),
+        Random(Shift(y=(.2, .8), x=(.2, .8)), p=.3),
+        Random(RotateAndScale(center_y=(0.3, 0.7), center_x=(0.3, 0.7), angle=(-10., 10.), scale=(.9, 1.1)), p=0.6),
+        BestCrop(samples=5, dsize=(480, 480), size_range=(0.42, 0.52)),
+        Random(RGBShift().only_on('img'), p=0.05),
+        Random(HSVShift().only_on('img'), p=0.04),
+        OneOf(
+            (OneOf(
+                (Clahe().only_on('img'), 0.08),
+                (GaussianNoise().only_on('img'), 0.08),
+                (Blur().only_on('img'), 0.08)), 0.08),
+            (OneOf(
+                (Saturation().only_on('img'), 0.08),
+                (Brightness().only_on('img'), 0.08),
+                (Contrast().only_on('img'), 0.08)), 0.08)
+        ),
+        Random(ElasticTransform(), p=0.05)
+    )
+
+
+def senet154_train_classifier() -> nn.Sequential:
+    return nn.Sequential(
+        Random(VFlip(), p=0.5),
+        Random(Rotate90(), p=0.9999),
+        Random(Shift(y=(.2, .8), x=(.2, .8)), p=.5),
+        Random(RotateAndScale(center_y=(0.3, 0.7), center_x=(0.3, 0.7), angle=(-10., 10.), scale=(.9, 1.1)), p=0.95),
+        BestCrop(samples=10, dsize=(512, 512), size_range=(0.4, 0.6)),
+        OneOf(
+            (RGBShift().only_on('img_pre'), 0.1),
+            (RGBShift().only_on('img_post'), 0.1),
+        ),
+        OneOf(
+            (HSVShift().only_on('img_pre'), 0.1),
+            (HSVShift().only_on('img_post'), 0.1),
+        ),
+        OneOf(
+            (OneOf(
+                (Clahe().only_on('img_pre'), 0.1),
+                (GaussianNoise().only_on('img_pre'), 0.1),
+                (Blur().only_on('img_pre'), 0.1)), 0.1),
+            (OneOf(
+                (Saturation().only_on('img_pre'), 0.1),
+                (Brightness().only_on('img_pre'), 0.1),
+                (Contrast().only_on('img_pre'), 0.1)), 0.1)
+        ),
+        OneOf(
+            (OneOf(
+                (Clahe().only_on('img_post'), 0.1),
+                (GaussianNoise().only_on('img_post'), 0.1),
+                (Blur().only_on('img_post'), 0.1)), 0.1),
+            (OneOf(
+                (Saturation().only_on('img_post'), 0.1),
+                (Brightness().only_on('img_post'), 0.1),
+                (Contrast().only_on('img_post'), 0.1)), 0.1)
+        ),
+        Random(ElasticTransform().only_on('img_pre'), p=0.1),
+        Random(ElasticTransform().only_on('img_post'), p=0.1),
+        Random(Dilation().only_on('msk'), p=0.9)
+    )
+
+
+def senet154_tune_classifier() -> nn.Sequential:
+    return nn.Sequential(
+        Random(VFlip(), p=0.3),
+        Random(Rotate90(), p=0.7),
+        Random(Shift(), p=.01),
+        Random(RotateAndScale(), p=0.5),
+        BestCrop(samples=10, dsize=(512, 512), size_range=(0.4, 0.6)),
+        OneOf(
+            (RGBShift().only_on('img_pre'), 0.01),
+            (RGBShift().only_on('img_post'), 0.01),
+        ),
+        OneOf(
+            (HSVShift().only_on('img_pre'), 0.01),
+            (HSVShift().only_on('img_post'), 0.01),
+        ),
+        OneOf(
+            (OneOf(
+                (Clahe().only_on('img_pre'), 0.01),
+                (GaussianNoise().only_on('img_pre'), 0.01),
+                (Blur().only_on('img_pre'), 0.01)), 0.01),
+            (OneOf(
+                (Saturation().only_on('img_pre'), 0.01),
+                (Brightness().only_on('img_pre'), 0.01),
+                (Contrast().only_on('img_pre'), 0.01)), 0.01)
+        ),
+        OneOf(
+            (OneOf(
+                (Clahe().only_on('img_post'), 0.01),
+                (GaussianNoise().only_on('img_post'), 0.01),
+                (Blur().only_on('img_post'), 0.01)), 0.01),
+            (OneOf(
+                (Saturation().only_on('img_post'), 0.01),
+                (Brightness().only_on('img_post'), 0.01),
+                (Contrast().only_on('img_post'), 0.01)), 0.01)
+        ),
+        Random(ElasticTransform().only_on('img_pre'), p=0.01),
+        Random(ElasticTransform().only_on('img_post'), p=0.01),
+        Random(Dilation().only_on('msk'), p=0.9)
+    )
+
+
+PIPELINES: Dict[str, Callable[[], nn.Sequential]] = {pipeline.__name__: pipeline for pipeline in (
+    resnet34_train_localizer, resnet34_train_classifier, resnet34_tune_classifier, seresnext50_train_localizer,
+    seresnext50_tune_localizer, seresnext50_train_classifier, seresnext50_tune_classifier, dpn92_train_localizer,
+    dpn92_tune_localizer, dpn92_train_classifier, dpn92_tune_classifier, senet154_train_localizer,
+    senet154_train_classifier, senet154_tune_classifier
+)}
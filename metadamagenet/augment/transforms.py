@@ -1,13 +1,22 @@
 import torch
+from torch.nn import functional
 
 from . import ImageCollection
-from .base import CollectionTransform
+from .base import CollectionTransform, is_label
 import kornia.geometry as kg
 
 
 class Resize(CollectionTransform):
+    changes_size = True
+
+    def _resize_labels(self, labels: torch.Tensor) -> torch.Tensor:
+        if labels.dtype == torch.bool:
+            return self._resize_labels(labels.to(torch.uint8)).bool()
+        return functional.interpolate(labels, size=(self._height, self._width), mode='nearest')
+
     def forward(self, img_group: ImageCollection) -> ImageCollection:
-        return {k: kg.resize(v, size=(self._height, self._width)) for k, v in img_group.items()}
+        return {k: self._resize_labels(v) if is_label(k) else kg.resize(v, size=(self._height, self._width))
+                for k, v in img_group.items()}
 
     def __init__(self, height: int, width: int):
         """
@@ -1,4 +1,13 @@
 from .data_time import DataTime
 from .image_data import ImageData, discover_directories, discover_directory, group_by_disasters
+from .table import ImageDataTable
+from .labels import LabelStore, label_store
+from .rasterize import rasterize, rasterize_image_data, damage_type_color
+from .manifest import Manifest, ImageStats
+from .cache import TensorCache, MaskCache, TaskCache
+from .tiled import TiledImageStore, Window, read_window, write_tiles
+from .crop import CropSampler
 from .dataset import LocalizationDataset, ClassificationDataset
+from .sampler import DamageAwareSampler, image_stats
+from .shards import ShardDataset, ShardLocalizationDataset, ShardClassificationDataset, write_shards
 from .meta import MetaDataLoader, TaskSet, Task
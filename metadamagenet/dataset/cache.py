@@ -0,0 +1,347 @@
+import abc
+import json
+import logging
+import os
+import pathlib
+from collections import OrderedDict
+from typing import Dict, List, Tuple, Sequence, Callable, Hashable, Optional, TypeVar, Generic
+
+import numpy as np
+import torch
+import kornia.io as kio
+from kornia.io import ImageLoadType
+from tqdm.autonotebook import tqdm
+
+from .data_time import DataTime
+from .image_data import ImageData
+from ..logging import EmojiAdapter
+
+logger = EmojiAdapter(logging.getLogger())
+
+
+class TensorCache:
+    """
+    pre-decoded uint8 copy of images and masks of a dataset, stored in memory-mapped shards.
+    each entry holds pre- and post-disaster images with shape (2,3,H,W) and masks with shape (2,1,H,W).
+    entries are keyed by image data and re-decoded when modification time of any of their source files changes.
+    """
+    index_filename: str = 'index.json'
+
+    def __init__(self, root: pathlib.Path, image_size: Tuple[int, int] = (1024, 1024), shard_size: int = 64,
+                 with_masks: bool = True):
+        """
+        :param root: directory to keep shards and index in
+        :param image_size: (height,width) of dataset images
+        :param shard_size: number of entries in each shard file
+        :param with_masks: cache mask files too. disable it when masks are rasterized from labels.
+        """
+        self._root: pathlib.Path = root
+        self._image_size: Tuple[int, int] = image_size
+        self._shard_size: int = shard_size
+        self._with_masks: bool = with_masks
+        self._entries: Dict[str, dict] = {}  # key -> {'slot': int, 'mtimes': List[int]}
+        self._shards: Dict[Tuple[str, int], np.memmap] = {}
+        self._root.mkdir(parents=True, exist_ok=True)
+        self._load_index()
+
+    @staticmethod
+    def key(image_data: ImageData) -> str:
+        return f"{image_data.base.absolute()}/{image_data.disaster}_{image_data.identifier}"
+
+    @property
+    def _index_path(self) -> pathlib.Path:
+        return self._root / self.index_filename
+
+    def _load_index(self) -> None:
+        if not self._index_path.exists():
+            # shards without an index have unknown layout and entries
+            self._remove_shards()
+            return
+        with open(self._index_path, 'r') as index_file:
+            index: dict = json.load(index_file)
+        if tuple(index['image_size']) != self._image_size or index['shard_size'] != self._shard_size or \
+                index.get('with_masks', True) != self._with_masks:
+            logger.info(f":wastebasket: cache layout at {self._root} has changed. rebuilding it.")
+            self._remove_shards()
+            return
+        self._entries = index['entries']
+
+    def _remove_shards(self) -> None:
+        """
+        deletes the index and shard files, which would otherwise be reopened with another shape
+        """
+        self._index_path.unlink(missing_ok=True)
+        for kind in ('images', 'masks'):
+            for path in self._root.glob(f'{kind}-*.u8'):
+                path.unlink()
+
+    def _save_index(self) -> None:
+        with open(self._index_path, 'w') as index_file:
+            json.dump({
+                'image_size': list(self._image_size),
+                'shard_size': self._shard_size,
+                'with_masks': self._with_masks,
+                'entries': self._entries
+            }, index_file)
+
+    def _shard(self, kind: str, number: int, writable: bool = False) -> np.memmap:
+        """
+        :param kind: 'images' or 'masks'
+        :param number: shard number
+        :param writable: open shard for writing decoded entries into it
+        """
+        if (kind, number) in self._shards:
+            return self._shards[(kind, number)]
+        path: pathlib.Path = self._root / f'{kind}-{number:05d}.u8'
+        channels: int = 3 if kind == 'images' else 1
+        mode: str
+        if writable:
+            mode = 'r+' if path.exists() else 'w+'
+        else:
+            # copy-on-write gives writable arrays, so torch can share their memory without a copy
+            mode = 'c'
+        shard = np.memmap(path, dtype=np.uint8, mode=mode,
+                          shape=(self._shard_size, 2, channels, *self._image_size))
+        self._shards[(kind, number)] = shard
+        return shard
+
+    @property
+    def with_masks(self) -> bool:
+        return self._with_masks
+
+    def _sources(self, image_data: ImageData) -> List[pathlib.Path]:
+        sources: List[pathlib.Path] = [image_data.image(DataTime.PRE), image_data.image(DataTime.POST)]
+        if self._with_masks:
+            sources += [image_data.mask(DataTime.PRE), image_data.mask(DataTime.POST)]
+        return sources
+
+    def sync(self, dataset: Sequence[ImageData]) -> int:
+        """
+        decodes entries which are not cached yet or their source files have changed since they were cached
+        :param dataset: image datas to cache
+        :return: number of decoded entries
+        """
+        stale: List[Tuple[ImageData, List[int]]] = []
+        image_data: ImageData
+        for image_data in dataset:
+            mtimes: List[int] = [os.stat(path).st_mtime_ns for path in self._sources(image_data)]
+            entry = self._entries.get(self.key(image_data))
+            if entry is None or entry['mtimes'] != mtimes:
+                stale.append((image_data, mtimes))
+
+        if len(stale) == 0:
+            return 0
+
+        logger.info(f":floppy_disk: decoding {len(stale)} entries into cache at {self._root}")
+        self._shards.clear()
+        next_slot: int = max((entry['slot'] for entry in self._entries.values()), default=-1) + 1
+        for image_data, mtimes in tqdm(stale, leave=False):
+            key: str = self.key(image_data)
+            if key in self._entries:
+                slot: int = self._entries[key]['slot']
+            else:
+                slot = next_slot
+                next_slot += 1
+            shard_number, offset = divmod(slot, self._shard_size)
+            images: np.memmap = self._shard('images', shard_number, writable=True)
+            for i, time in enumerate((DataTime.PRE, DataTime.POST)):
+                images[offset, i] = kio.load_image(str(image_data.image(time)), ImageLoadType.RGB8).numpy()
+                if self._with_masks:
+                    self._shard('masks', shard_number, writable=True)[offset, i] = \
+                        kio.load_image(str(image_data.mask(time)), ImageLoadType.UNCHANGED) \
+                        .float().mean(dim=0, keepdim=True).round().to(torch.uint8).numpy()
+            self._entries[key] = {'slot': slot, 'mtimes': mtimes}
+
+        for shard in self._shards.values():
+            shard.flush()
+        self._shards.clear()
+        self._save_index()
+        return len(stale)
+
+    def __contains__(self, image_data: ImageData) -> bool:
+        return self.key(image_data) in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _slice(self, kind: str, key: str, time: DataTime) -> torch.Tensor:
+        slot: int = self._entries[key]['slot']
+        shard_number, offset = divmod(slot, self._shard_size)
+        return torch.from_numpy(self._shard(kind, shard_number)[offset, 0 if time == DataTime.PRE else 1])
+
+    def image(self, key: str, time: DataTime = DataTime.PRE) -> torch.Tensor:
+        """
+        :param key: key of image data, see key
+        :return: uint8 tensor of shape (3,H,W) sharing memory with the cache shard
+        """
+        return self._slice('images', key, time)
+
+    def mask(self, key: str, time: DataTime = DataTime.PRE) -> torch.Tensor:
+        """
+        :param key: key of image data, see key
+        :return: uint8 tensor of shape (1,H,W) sharing memory with the cache shard
+        """
+        if not self._with_masks:
+            raise ValueError(f"cache at {self._root} does not keep masks")
+        return self._slice('masks', key, time)
+
+    def __getstate__(self) -> dict:
+        # memory maps are reopened lazily in each DataLoader worker instead of being pickled
+        state = self.__dict__.copy()
+        state['_shards'] = {}
+        return state
+
+
+ValueType = TypeVar('ValueType')
+
+
+class BoundedLRUCache(Generic[ValueType], metaclass=abc.ABCMeta):
+    """
+    least recently used cache bounded by the total size of its values in bytes
+    """
+
+    def __init__(self, max_bytes: int):
+        """
+        :param max_bytes: maximum total size of cached values
+        """
+        self._max_bytes: int = max_bytes
+        self._entries: OrderedDict[Hashable, ValueType] = OrderedDict()
+        self._bytes: int = 0
+
+    @staticmethod
+    @abc.abstractmethod
+    def _size(value: ValueType) -> int:
+        """
+        :return: size of a value in bytes
+        """
+        pass
+
+    def _lookup(self, key: Hashable) -> Optional[ValueType]:
+        """
+        :return: cached value, marked as the most recently used one. None if it is not cached
+        """
+        if key not in self._entries:
+            return None
+        self._entries.move_to_end(key)
+        return self._entries[key]
+
+    def _insert(self, key: Hashable, value: ValueType) -> None:
+        """
+        caches a value and evicts the least recently used ones which do not fit with it.
+        values larger than the whole cache and keys which are already cached are ignored
+        """
+        size: int = self._size(value)
+        if size > self._max_bytes or key in self._entries:
+            return
+        while self._bytes + size > self._max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= self._size(evicted)
+        self._entries[key] = value
+        self._bytes += size
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def size(self) -> int:
+        """
+        total size of cached values in bytes
+        """
+        return self._bytes
+
+
+class MaskCache(BoundedLRUCache[torch.Tensor]):
+    """
+    least recently used cache of masks, bounded by their total size in bytes.
+    each DataLoader worker holds its own copy of the dataset and so its own cache.
+    """
+
+    def __init__(self, max_bytes: int = 256 * 2 ** 20):
+        """
+        :param max_bytes: maximum total size of cached masks
+        """
+        super().__init__(max_bytes)
+        self.hits: int = 0
+        self.misses: int = 0
+
+    @staticmethod
+    def _size(value: torch.Tensor) -> int:
+        return value.element_size() * value.nelement()
+
+    def get(self, key: Hashable, create: Callable[[], torch.Tensor]) -> torch.Tensor:
+        """
+        :param key: mask key
+        :param create: creates the mask if it is not cached
+        :return: cached or newly created mask
+        """
+        value: Optional[torch.Tensor] = self._lookup(key)
+        if value is not None:
+            self.hits += 1
+            return value
+        self.misses += 1
+        value = create()
+        self._insert(key, value)
+        return value
+
+
+class TaskCache(BoundedLRUCache[Dict[str, torch.Tensor]]):
+    """
+    least recently used cache of decoded images and masks of meta-learning tasks, bounded by their total size in bytes.
+    entries are whole decoded tensors of an image data (see Xview2Dataset.decode), so random choices of the dataset
+    (crop window, replacing pre-disaster images with post-disaster ones) are made again on each access.
+    entries are grouped by disaster (task name) and hits and misses are counted per disaster.
+    """
+
+    def __init__(self, max_bytes: int = 2 * 2 ** 30):
+        """
+        :param max_bytes: maximum total size of cached entries
+        """
+        super().__init__(max_bytes)
+        self._hits: Dict[str, int] = {}
+        self._misses: Dict[str, int] = {}
+
+    @staticmethod
+    def _size(value: Dict[str, torch.Tensor]) -> int:
+        return sum(tensor.element_size() * tensor.nelement() for tensor in value.values())
+
+    def get(self, disaster: str, key: str) -> Optional[Dict[str, torch.Tensor]]:
+        """
+        :param key: key of image data, see TensorCache.key
+        :return: cached decoded tensors of image data, None if they are not cached
+        """
+        decoded: Optional[Dict[str, torch.Tensor]] = self._lookup((disaster, key))
+        if decoded is not None:
+            self._hits[disaster] = self._hits.get(disaster, 0) + 1
+        else:
+            self._misses[disaster] = self._misses.get(disaster, 0) + 1
+        return decoded
+
+    def put(self, disaster: str, key: str, decoded: Dict[str, torch.Tensor]) -> None:
+        """
+        :param key: key of image data, see TensorCache.key
+        :param decoded: decoded tensors of image data
+        """
+        self._insert((disaster, key), decoded)
+
+    @property
+    def hit_rate(self) -> float:
+        lookups: int = sum(self._hits.values()) + sum(self._misses.values())
+        return sum(self._hits.values()) / lookups if lookups > 0 else 0.
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """
+        :return: number of hits, misses and hit rate of each disaster
+        """
+        result: Dict[str, Dict[str, float]] = {}
+        for disaster in sorted(set(self._hits) | set(self._misses)):
+            hits, misses = self._hits.get(disaster, 0), self._misses.get(disaster, 0)
+            result[disaster] = {'hits': hits, 'misses': misses, 'hit_rate': hits / (hits + misses)}
+        return result
+
+    def log_stats(self) -> None:
+        """
+        logs overall hit rate and size of cache, and statistics of each disaster in debug level
+        """
+        logger.info(f":card_file_box: task cache hit rate: {self.hit_rate:.3f} "
+                    f"({len(self)} entries, {self.size / 2 ** 20:.1f} MiB)")
+        logger.debug("%s", self.stats())
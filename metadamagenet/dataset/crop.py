@@ -0,0 +1,62 @@
+from typing import Tuple, Optional
+
+import torch
+import torch.nn.functional as tf
+
+from .tiled import Window
+
+
+class CropSampler:
+    """
+    picks the crop window of a sample before its images are read, so only that region has to be decoded.
+    windows are sampled like BestCrop: a square box with relative size in size_range at a random position,
+    and among several candidates the one with the most mask pixels (relative to its area) is chosen.
+    crops are resized to dsize.
+    """
+
+    def __init__(self,
+                 samples: int = 5,
+                 size_range: Tuple[float, float] = (0.9, 1.),
+                 dsize: Tuple[int, int] = (512, 512)):
+        """
+        :param samples: number of candidate windows
+        :param size_range: range of window size relative to image size
+        :param dsize: (height,width) of output crops
+        """
+        self._samples: int = samples
+        self._size_range: Tuple[float, float] = size_range
+        self._dsize: Tuple[int, int] = dsize
+
+    def window(self, height: int, width: int, mask: Optional[torch.Tensor] = None) -> Window:
+        """
+        :param height: image height
+        :param width: image width
+        :param mask: tensor of shape (1,H,W). used to score candidate windows if passed
+        :return: chosen window
+        """
+        sizes: torch.Tensor = torch.rand(self._samples) * (self._size_range[1] - self._size_range[0]) \
+            + self._size_range[0]
+        box_heights: torch.Tensor = (sizes * height).long().clamp_(min=1, max=height)
+        box_widths: torch.Tensor = (sizes * width).long().clamp_(min=1, max=width)
+        tops: torch.Tensor = (torch.rand(self._samples) * (height - box_heights + 1)).long()
+        lefts: torch.Tensor = (torch.rand(self._samples) * (width - box_widths + 1)).long()
+
+        best: int = 0
+        if mask is not None and self._samples > 1:
+            integral: torch.Tensor = tf.pad(mask[0].double().cumsum(0).cumsum(1), (1, 0, 1, 0))
+            bottoms, rights = tops + box_heights, lefts + box_widths
+            sums: torch.Tensor = integral[bottoms, rights] - integral[tops, rights] \
+                - integral[bottoms, lefts] + integral[tops, lefts]
+            best = int((sums / (box_heights * box_widths)).argmax())
+        return int(tops[best]), int(lefts[best]), int(box_heights[best]), int(box_widths[best])
+
+    def resize(self, crop: torch.ByteTensor, label: bool = False) -> torch.ByteTensor:
+        """
+        :param crop: uint8 tensor of shape (C,h,w)
+        :param label: crop is a label map. it is resized with nearest neighbour interpolation to keep its values
+        :return: uint8 tensor of shape (C,*dsize)
+        """
+        if label:
+            return tf.interpolate(crop.unsqueeze(0), size=self._dsize, mode='nearest').squeeze(0)
+        return tf.interpolate(crop.unsqueeze(0).float(), size=self._dsize, mode='bilinear', align_corners=False) \
+            .squeeze(0).round_().clamp_(0, 255).to(torch.uint8)
@@ -1,7 +1,9 @@
-from abc import ABC
-from typing import Dict, Union, Sequence, Iterable
+import abc
+from typing import Dict, Union, Sequence, Iterable, Optional, Tuple
 from pathlib import Path
 
+import cv2
+import numpy as np
 import torch
 from torch.utils.data import Dataset
 import kornia.io as kio
@@ -9,26 +11,187 @@ from kornia.io import ImageLoadType
 
 from .data_time import DataTime
 from .image_data import ImageData, discover_directories, discover_directory
+from .table import ImageDataTable
+from .cache import TensorCache, MaskCache
+from .rasterize import rasterize_image_data
+from .tiled import TiledImageStore, Window
+from .crop import CropSampler
 
 
-class Xview2Dataset(Dataset, ABC):
-    def __init__(self, source: Union[Sequence[ImageData], Sequence[Path], Path], check: bool = False):
+def _crop(image: torch.Tensor, window: Optional[Window]) -> torch.Tensor:
+    if window is None:
+        return image
+    top, left, height, width = window
+    return image[:, top:top + height, left:left + width]
+
+
+_reduced_color_flags: Dict[int, int] = {
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8
+}
+
+
+def post_disaster_images(use_post_disaster_images: Union[bool, float]) -> Tuple[bool, float]:
+    """
+    parses use_post_disaster_images argument of localization datasets
+    :param use_post_disaster_images: bool, or probability in [0,1) of replacing a pre-disaster image with its
+                                     post-disaster version
+    :return: (use both versions of each image, probability of replacing pre-disaster image with post-disaster one)
+    """
+    if isinstance(use_post_disaster_images, float):
+        if not 0 <= use_post_disaster_images < 1:
+            raise ValueError("post_version_prob should be in [0,1]")
+        return False, use_post_disaster_images
+    if isinstance(use_post_disaster_images, bool):
+        return use_post_disaster_images, 0.
+    raise TypeError(f"unsupported type for 'use_post_disaster_images'"
+                    f" expected Union[bool,float] got {type(use_post_disaster_images)}")
+
+
+def _read_reduced(path: str, reduction: int) -> torch.ByteTensor:
+    """
+    decodes an image at 1/reduction of its size with OpenCV's reduced decoding
+    :return: uint8 RGB tensor of shape (3,H/reduction,W/reduction)
+    """
+    image: np.ndarray = cv2.imread(path, _reduced_color_flags[reduction])
+    if image is None:
+        raise FileNotFoundError(f"could not read image {path}")
+    return torch.from_numpy(np.ascontiguousarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB).transpose(2, 0, 1)))
+
+
+class Xview2Dataset(Dataset, abc.ABC):
+    def __init__(self, source: Union[Sequence[ImageData], Sequence[Path], Path], check: bool = False,
+                 cache: Optional[TensorCache] = None, manifest: bool = False,
+                 rasterize_masks: bool = False, mask_cache_bytes: int = 256 * 2 ** 20,
+                 tiles: Optional[TiledImageStore] = None, crop: Optional[CropSampler] = None,
+                 decode_reduction: int = 1, manifest_dir: Optional[Path] = None):
+        """
+        :param source: source of images, could be a folder
+        :param cache: if passed, images and masks are decoded once into this cache and read from it afterwards
+        :param manifest: discover folders from their manifest instead of the filesystem
+        :param rasterize_masks: create masks from polygon labels instead of reading mask files
+        :param mask_cache_bytes: size limit of each worker's cache of rasterized masks
+        :param tiles: if passed, images are converted once into tiles and only the needed tiles are read afterwards
+        :param crop: if passed, crop window of each sample is chosen before reading its images
+                     and samples are cropped and resized in the dataset
+        :param decode_reduction: 1, 2, 4 or 8. images are decoded at 1/decode_reduction of their size
+                                 and masks are subsampled to match
+        :param manifest_dir: directory to keep manifests of folders in. defaults to each folder
+        """
         super(Xview2Dataset, self).__init__()
-        self._image_dataset: Sequence[ImageData]
+        # image datas are kept in a table, which is cheap to pickle to data loader workers
+        self._image_dataset: ImageDataTable
         if isinstance(source, Sequence) and isinstance(source[0], ImageData):
-            self._image_dataset = source
+            self._image_dataset = ImageDataTable.from_image_datas(source)
         elif isinstance(source, Path):
-            self._image_dataset = discover_directory(source, check)
+            self._image_dataset = ImageDataTable.from_image_datas(discover_directory(source, check, manifest,
+                                                                                       manifest_dir))
         elif isinstance(source, Sequence) and isinstance(source[0], Path):
-            self._image_dataset = discover_directories(source, check)
+            self._image_dataset = ImageDataTable.from_image_datas(discover_directories(source, check, manifest,
+                                                                                         manifest_dir))
         else:
             raise TypeError(f"invalid type {type(source)} for source.")
+        self._cache: Optional[TensorCache] = cache
+        if self._cache is not None:
+            if rasterize_masks and self._cache.with_masks:
+                raise ValueError("masks are rasterized from labels. cache should be created with with_masks=False")
+            self._cache.sync(self._image_dataset)
+        self._mask_cache: Optional[MaskCache] = MaskCache(mask_cache_bytes) if rasterize_masks else None
+        self._tiles: Optional[TiledImageStore] = tiles
+        if self._tiles is not None:
+            self._tiles.sync(self._image_dataset)
+        self._crop: Optional[CropSampler] = crop
+        if decode_reduction != 1 and decode_reduction not in _reduced_color_flags:
+            raise ValueError(f"decode_reduction should be one of 1, 2, 4 or 8. got {decode_reduction}")
+        if decode_reduction != 1 and (cache is not None or tiles is not None):
+            raise ValueError("reduced decoding reads image files. it cannot be used with cache or tiles")
+        self._decode_reduction: int = decode_reduction
+
+    def _load_image(self, index: int, time: DataTime, window: Optional[Window] = None) -> torch.ByteTensor:
+        """
+        :param index: # of image data
+        :param window: region of image to load. whole image if None
+        :return: uint8 tensor of shape (3,H,W)
+        """
+        if self._tiles is not None:
+            return torch.from_numpy(self._tiles.read(self._image_dataset.base(index),
+                                                     self._image_dataset.name(index, time), window))
+        if self._cache is not None:
+            return _crop(self._cache.image(self._image_dataset.key(index), time), window)
+        if self._decode_reduction > 1:
+            return _crop(_read_reduced(self._image_dataset.image(index, time), self._decode_reduction), window)
+        return _crop(kio.load_image(self._image_dataset.image(index, time), ImageLoadType.RGB8), window)
+
+    def _load_mask(self, index: int, time: DataTime) -> torch.ByteTensor:
+        """
+        :param index: # of image data
+        :return: uint8 tensor of shape (1,H,W) with mask values
+        """
+        msk: torch.ByteTensor = self._read_mask(index, time)
+        if self._decode_reduction > 1:
+            # nearest neighbour subsampling keeps mask values valid
+            msk = msk[:, ::self._decode_reduction, ::self._decode_reduction]
+        return msk
+
+    def _read_mask(self, index: int, time: DataTime) -> torch.ByteTensor:
+        if self._mask_cache is not None:
+            return self._mask_cache.get(
+                (self._image_dataset.key(index), time),
+                lambda: torch.from_numpy(rasterize_image_data(self._image_dataset[index], time)).unsqueeze(0)
+            )
+        if self._cache is not None:
+            return self._cache.mask(self._image_dataset.key(index), time)
+        msk: torch.ByteTensor = kio.load_image(self._image_dataset.mask(index, time), ImageLoadType.UNCHANGED)
+        if msk.size(0) > 1:
+            msk = msk.float().mean(dim=0, keepdim=True).round().to(torch.uint8)
+        return msk
+
+    def _sample_window(self, msk: torch.ByteTensor) -> Optional[Window]:
+        """
+        :param msk: whole mask of the sample, used to score candidate windows
+        :return: crop window of the sample. None if the dataset does not crop
+        """
+        if self._crop is None:
+            return None
+        return self._crop.window(msk.size(-2), msk.size(-1), msk)
+
+    def _resize(self, sample: Dict[str, torch.ByteTensor]) -> Dict[str, torch.ByteTensor]:
+        if self._crop is None:
+            return sample
+        return {key: self._crop.resize(value, label=(key == 'msk')) for key, value in sample.items()}
+
+    @abc.abstractmethod
+    def decode(self, index: int) -> Dict[str, torch.ByteTensor]:
+        """
+        decodes whole images and masks of an image data, before any random choice of the dataset
+        :param index: # of image data
+        """
+        pass
+
+    @abc.abstractmethod
+    def sample(self, decoded: Dict[str, torch.ByteTensor]) -> Dict[str, torch.ByteTensor]:
+        """
+        makes random choices of the dataset (image version, crop window) on decoded tensors of an image data.
+        decode and sample together give the same samples as __getitem__, so decoded tensors can be kept
+        and sampled again
+        :param decoded: output of decode
+        """
+        pass
 
 
 class LocalizationDataset(Xview2Dataset):
     def __init__(self, source: Union[Sequence[ImageData], Iterable[Path], Path],
                  check: bool = False,
-                 use_post_disaster_images: Union[bool, float] = 0.015):
+                 use_post_disaster_images: Union[bool, float] = 0.015,
+                 cache: Optional[TensorCache] = None,
+                 manifest: bool = False,
+                 rasterize_masks: bool = False,
+                 mask_cache_bytes: int = 256 * 2 ** 20,
+                 tiles: Optional[TiledImageStore] = None,
+                 crop: Optional[CropSampler] = None,
+                 decode_reduction: int = 1,
+                 manifest_dir: Optional[Path] = None):
         """
         Train Dataset
         :param source: source of images, could be a folder
@@ -36,71 +199,106 @@ class LocalizationDataset(Xview2Dataset):
         if false, this dataset won't include any post-disaster image. if float value passed,
         this value should be a probability in [0,1) and with this probability pre-disaster images will be replaced
         with their corresponding post-disaster image
+        :param cache: if passed, images and masks are decoded once into this cache and read from it afterwards
+        :param manifest: discover folders from their manifest instead of the filesystem
+        :param rasterize_masks: create masks from polygon labels instead of reading mask files
+        :param mask_cache_bytes: size limit of each worker's cache of rasterized masks
+        :param tiles: if passed, images are converted once into tiles and only the needed tiles are read afterwards
+        :param crop: if passed, crop window of each sample is chosen before reading its images
+                     and samples are cropped and resized in the dataset
+        :param decode_reduction: 1, 2, 4 or 8. images are decoded at 1/decode_reduction of their size.
+                                 use it when the transforms resize samples down anyway
+        :param manifest_dir: directory to keep manifests of folders in. defaults to each folder
         """
-        super().__init__(source, check)
-        self._post_version_prob: float
+        super().__init__(source, check, cache, manifest, rasterize_masks, mask_cache_bytes, tiles, crop,
+                         decode_reduction, manifest_dir)
         self._use_post_disaster_images: bool
-        if isinstance(use_post_disaster_images, float):
-            if not 0 <= use_post_disaster_images < 1:
-                raise ValueError("post_version_prob should be in [0,1]")
-            self._post_version_prob = use_post_disaster_images
-            self._use_post_disaster_images = False
-        elif isinstance(use_post_disaster_images, bool):
-            self._use_post_disaster_images = use_post_disaster_images
-            self._post_version_prob = 0.
-        else:
-            raise TypeError(f"unsupported type for 'use_post_disaster_images'"
-                            f" expected Union[bool,float] got {type(use_post_disaster_images)}")
+        self._post_version_prob: float
+        self._use_post_disaster_images, self._post_version_prob = post_disaster_images(use_post_disaster_images)
 
     def __len__(self) -> int:
         if self._use_post_disaster_images:
             return 2 * len(self._image_dataset)
         return len(self._image_dataset)
 
-    def __getitem__(self, identifier: int) -> Dict[str, torch.FloatTensor]:
+    def __getitem__(self, identifier: int) -> Dict[str, torch.ByteTensor]:
         """
         :param identifier: # of image data
+        :return: {'img': uint8 tensor of shape (3,H,W), 'msk': uint8 tensor of shape (1,H,W) with 0-1 values}
         """
-        image_data: ImageData
+        index: int
         data_time: DataTime
         if self._use_post_disaster_images:
-            image_data = self._image_dataset[identifier // 2]
+            index = identifier // 2
             data_time = DataTime.PRE if identifier % 2 == 0 else DataTime.POST
         else:
-            image_data = self._image_dataset[identifier]
-            data_time = DataTime.PRE
+            index = identifier
+            # version of the image is chosen before reading it, so only one image is decoded
+            data_time = DataTime.POST if torch.rand(1).item() < self._post_version_prob else DataTime.PRE
 
-        img: torch.FloatTensor
-        msk: torch.FloatTensor
-        img = kio.load_image(str(image_data.image(DataTime.PRE)), ImageLoadType.RGB32)
-        msk = kio.load_image(str(image_data.mask(DataTime.PRE)), ImageLoadType.UNCHANGED) \
-            .float().mean(dim=0, keepdim=True)
+        # localization mask is the same as pre-disaster version
+        msk: torch.ByteTensor = self._load_mask(index, DataTime.PRE)
+        window: Optional[Window] = self._sample_window(msk)
+        img: torch.ByteTensor = self._load_image(index, data_time, window)
 
-        if not self._use_post_disaster_images and torch.rand(1).item() > self._post_version_prob:
-            img = kio.load_image(str(image_data.image(DataTime.POST)), ImageLoadType.RGB32)
-            # localization mask is the same as pre-disaster version
+        return self._resize({"img": img, "msk": _crop(msk, window)})
 
-        return {"img": img, "msk": msk}
+    def decode(self, index: int) -> Dict[str, torch.ByteTensor]:
+        """
+        :return: {'img_pre': uint8 tensor of shape (3,H,W), 'img_post': uint8 tensor of shape (3,H,W),
+                  'msk': uint8 tensor of shape (1,H,W) with 0-1 values}.
+                 'img_post' is left out if post-disaster images are never used
+        """
+        decoded: Dict[str, torch.ByteTensor] = {'img_pre': self._load_image(index, DataTime.PRE),
+                                                'msk': self._load_mask(index, DataTime.PRE)}
+        if self._use_post_disaster_images or self._post_version_prob > 0:
+            decoded['img_post'] = self._load_image(index, DataTime.POST)
+        return decoded
+
+    def sample(self, decoded: Dict[str, torch.ByteTensor]) -> Dict[str, torch.ByteTensor]:
+        """
+        :return: {'img': uint8 tensor of shape (3,H,W), 'msk': uint8 tensor of shape (1,H,W) with 0-1 values}.
+                 if the dataset includes all post-disaster images, either version is chosen with equal probability
+        """
+        post_prob: float = 0.5 if self._use_post_disaster_images else self._post_version_prob
+        img: torch.ByteTensor = decoded['img_post'] if torch.rand(1).item() < post_prob else decoded['img_pre']
+        window: Optional[Window] = self._sample_window(decoded['msk'])
+        return self._resize({"img": _crop(img, window), "msk": _crop(decoded['msk'], window)})
 
 
 class ClassificationDataset(Xview2Dataset):
     def __len__(self):
         return len(self._image_dataset)
 
-    def __getitem__(self, identifier: int) -> Dict[str, torch.FloatTensor]:
+    def __getitem__(self, identifier: int) -> Dict[str, torch.ByteTensor]:
         """
         :param identifier: # of image data
+        :return: {'img_pre': uint8 tensor of shape (3,H,W), 'img_post': uint8 tensor of shape (3,H,W),
+                  'msk': uint8 tensor of shape (1,H,W) with 0-4 values}
         """
-        image_data: ImageData = self._image_dataset[identifier]
-
-        pre_image: torch.IntTensor = kio.load_image(str(image_data.image(DataTime.PRE)), ImageLoadType.RGB32)
-        post_image: torch.IntTensor = kio.load_image(str(image_data.image(DataTime.POST)), ImageLoadType.RGB32)
-        post_msk: torch.FloatTensor = kio.load_image(str(image_data.mask(DataTime.POST)),
-                                                     ImageLoadType.UNCHANGED).float().mean(dim=0, keepdim=True) / 4
+        post_msk: torch.ByteTensor = self._load_mask(identifier, DataTime.POST)
+        window: Optional[Window] = self._sample_window(post_msk)
+        pre_image: torch.ByteTensor = self._load_image(identifier, DataTime.PRE, window)
+        post_image: torch.ByteTensor = self._load_image(identifier, DataTime.POST, window)
 
         # TODO: normalize colors, one-hot labels and concat pre-and-post disaster images
-        return {
+        return self._resize({
             "img_pre": pre_image,
             "img_post": post_image,
-            "msk": post_msk
+            "msk": _crop(post_msk, window)
+        })
+
+    def decode(self, index: int) -> Dict[str, torch.ByteTensor]:
+        """
+        :return: {'img_pre': uint8 tensor of shape (3,H,W), 'img_post': uint8 tensor of shape (3,H,W),
+                  'msk': uint8 tensor of shape (1,H,W) with 0-4 values}
+        """
+        return {
+            "img_pre": self._load_image(index, DataTime.PRE),
+            "img_post": self._load_image(index, DataTime.POST),
+            "msk": self._load_mask(index, DataTime.POST)
         }
+
+    def sample(self, decoded: Dict[str, torch.ByteTensor]) -> Dict[str, torch.ByteTensor]:
+        window: Optional[Window] = self._sample_window(decoded['msk'])
+        return self._resize({key: _crop(value, window) for key, value in decoded.items()})
@@ -1,14 +1,16 @@
+import hashlib
 import logging
 from dataclasses import dataclass
 import pathlib
 import json
-from typing import List, Tuple, Iterable, Union, Dict
+from typing import List, Tuple, Iterable, Union, Dict, Optional
 
 from shapely.geometry import Polygon
 from shapely import wkt
 
 from ..configs import DamageType, damage_to_damage_type, GeneralConfig
 from .data_time import DataTime
+from .labels import LabelStore, label_store
 from ..logging import EmojiAdapter
 
 logger = EmojiAdapter(logging.getLogger())
@@ -56,7 +58,16 @@ class ImageData:
         """
         list of image polygons and their subtypes
         for per disaster images it returns
+        polygons are read from the compiled label store of base directory if it is built
+        and the label file has not changed since then. empty polygons are skipped, like in the store
         """
+        store: Optional[LabelStore] = label_store(self.base)
+        if store is not None and store.is_current(self.name(time), self.label(time)):
+            polygons, damage = store.polygons(self.name(time))
+            if time == DataTime.POST:
+                return [(polygon, DamageType(int(value))) for polygon, value in zip(polygons, damage)]
+            return polygons
+
         with open(self.label(time)) as json_file:
             json_data = json.load(json_file)
 
@@ -64,29 +75,53 @@ class ImageData:
             results: List[Tuple[Polygon, DamageType]] = []
             for feat in json_data['features']['xy']:
                 polygon: Polygon = wkt.loads(feat['wkt'])
+                if polygon.is_empty:
+                    continue
                 subtype: DamageType = damage_to_damage_type[feat['properties']['subtype']]
                 results.append((polygon, subtype))
         else:
             assert time == DataTime.PRE, f"invalid DataTime, expected {DataTime.PRE} got {time}"
-            results: List[Polygon] = [wkt.loads(feat['wkt']) for feat in json_data['features']['xy']]
+            results: List[Polygon] = [polygon for polygon in (wkt.loads(feat['wkt'])
+                                                              for feat in json_data['features']['xy'])
+                                      if not polygon.is_empty]
 
         return results
 
 
-def discover_directories(directories: Iterable[pathlib.Path], check: bool = True) -> List[ImageData]:
+def directory_key(directory: pathlib.Path) -> str:
+    """
+    :return: name of directory followed by a hash of its resolved path,
+             so files derived from different directories with the same name do not collide
+    """
+    return f"{directory.name}-{hashlib.sha1(str(directory.resolve()).encode()).hexdigest()[:12]}"
+
+
+def discover_directories(directories: Iterable[pathlib.Path], check: bool = True,
+                         manifest: bool = False, manifest_dir: Optional[pathlib.Path] = None) -> List[ImageData]:
     results: List[ImageData] = []
     directory: pathlib.Path
     for directory in directories:
-        results.extend(discover_directory(directory, check))
+        results.extend(discover_directory(directory, check, manifest, manifest_dir))
     return results
 
 
-def discover_directory(base_directory: pathlib.Path, check: bool = True) -> List[ImageData]:
+def discover_directory(base_directory: pathlib.Path, check: bool = True, manifest: bool = False,
+                       manifest_dir: Optional[pathlib.Path] = None) -> List[ImageData]:
     """
     :param base_directory: directory to discover
     :param check: check if other files of image data exist
+    :param manifest: answer from the directory manifest instead of the filesystem.
+                     the manifest is created if it does not exist and refreshed if files were added or removed.
+    :param manifest_dir: directory to keep the manifest in, for read-only dataset directories.
+                         defaults to the base directory
     :return: list of image datas
     """
+    if manifest:
+        from .manifest import Manifest
+        directory_manifest: Manifest = Manifest.at(base_directory, manifest_dir)
+        directory_manifest.refresh()
+        return directory_manifest.image_datas(check)
+
     results: List[ImageData] = []
     if not base_directory.is_dir():
         raise ValueError(f"{base_directory.absolute()} is not a directory")
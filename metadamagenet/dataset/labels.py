@@ -0,0 +1,206 @@
+import json
+import logging
+import os
+import pathlib
+import re
+from typing import Dict, List, Tuple, Optional, Union
+
+import numpy as np
+import numpy.typing as npt
+from shapely import wkt
+from shapely.geometry import Polygon, MultiPolygon
+from tqdm.autonotebook import tqdm
+
+from ..configs import GeneralConfig, damage_to_damage_type
+from ..logging import EmojiAdapter
+
+logger = EmojiAdapter(logging.getLogger())
+
+_POLYGON_WKT = re.compile(r'^\s*POLYGON\s*\(\((.*)\)\)\s*$', re.DOTALL)
+_RING_SEPARATOR = re.compile(r'\)\s*,\s*\(')
+
+Rings = List[npt.NDArray[np.float32]]  # exterior ring followed by interior rings, each of shape (N,2)
+
+
+def _parse_wkts(wkts: List[str]) -> Tuple[List[int], List[int], List[int], List[int], npt.NDArray[np.float32]]:
+    """
+    parses polygons of a label file together.
+    coordinates of all rings are converted with a single numpy call.
+    empty polygons and rings are skipped, and so are features without any non-empty polygon.
+    :return: (indices of kept features, number of polygons of each kept feature, number of rings of each polygon,
+              number of points of each ring, coordinates of shape (P,2))
+    """
+    features: List[int] = []
+    feature_polygons: List[int] = []
+    polygon_rings: List[int] = []
+    ring_points: List[int] = []
+    texts: List[str] = []
+    i: int
+    text: str
+    for i, text in enumerate(wkts):
+        match = _POLYGON_WKT.match(text)
+        if match is not None:
+            features.append(i)
+            feature_polygons.append(1)
+            rings: List[str] = _RING_SEPARATOR.split(match.group(1))
+            polygon_rings.append(len(rings))
+            for ring in rings:
+                ring_points.append(ring.count(',') + 1)
+                texts.append(ring.replace(',', ' '))
+            continue
+        # fall back to shapely for anything other than a simple polygon
+        geometry = wkt.loads(text)
+        parts: List[Polygon] = [part for part in (geometry.geoms if isinstance(geometry, MultiPolygon) else [geometry])
+                                if not part.is_empty]
+        if len(parts) == 0:
+            continue
+        features.append(i)
+        feature_polygons.append(len(parts))
+        for part in parts:
+            rings = [ring.coords for ring in [part.exterior, *part.interiors] if len(ring.coords) > 0]
+            polygon_rings.append(len(rings))
+            for ring in rings:
+                ring_points.append(len(ring))
+                texts.append(' '.join(f"{x} {y}" for x, y in ring))
+
+    coords = np.array(' '.join(texts).split(), dtype=np.float32).reshape(-1, 2)
+    return features, feature_polygons, polygon_rings, ring_points, coords
+
+
+class LabelStore:
+    """
+    compiled polygons of all label files of a dataset directory. empty polygons are not kept.
+    polygon coordinates are kept in flat float32 arrays with ring, polygon and feature offsets
+    and a uint8 damage type column. arrays are memory-mapped for reading.
+    modification time and size of each label file are recorded, so entries of edited files can be detected.
+    """
+    dirname: str = 'labels.store'
+
+    def __init__(self, root: pathlib.Path):
+        """
+        :param root: store directory
+        """
+        self._root: pathlib.Path = root
+        with open(root / 'index.json', 'r') as index_file:
+            # name -> [first polygon, last polygon+1, mtime, size, first feature, last feature+1]
+            self._index: Dict[str, List[int]] = json.load(index_file)
+        self._coords: npt.NDArray[np.float32] = np.load(root / 'coords.npy', mmap_mode='r')
+        self._rings: npt.NDArray[np.int64] = np.load(root / 'rings.npy', mmap_mode='r')
+        self._polygons: npt.NDArray[np.int64] = np.load(root / 'polygons.npy', mmap_mode='r')
+        self._features: npt.NDArray[np.int64] = np.load(root / 'features.npy', mmap_mode='r')
+        self._damage: npt.NDArray[np.uint8] = np.load(root / 'damage.npy', mmap_mode='r')
+
+    @classmethod
+    def path(cls, base_directory: pathlib.Path) -> pathlib.Path:
+        return base_directory / cls.dirname
+
+    @classmethod
+    def build(cls, base_directory: pathlib.Path) -> 'LabelStore':
+        """
+        compiles label files of a dataset directory. does nothing if none of them has changed since last build.
+        """
+        labels_directory: pathlib.Path = base_directory / GeneralConfig.get_instance().labels_dirname
+        label_paths: List[pathlib.Path] = sorted(labels_directory.glob('*.json'))
+        stats: Dict[str, List[int]] = {path.stem: cls._file_stat(path) for path in label_paths}
+        root: pathlib.Path = cls.path(base_directory)
+        if (root / 'features.npy').exists():
+            store = LabelStore(root)
+            if {name: entry[2:4] for name, entry in store._index.items()} == stats:
+                return store
+
+        logger.info(f":package: compiling {len(label_paths)} label files of {base_directory.absolute()}...")
+        feature_polygons: List[int] = []
+        polygon_rings: List[int] = []
+        ring_points: List[int] = []
+        coords: List[npt.NDArray[np.float32]] = []
+        damage: List[int] = []
+        index: Dict[str, List[int]] = {}
+        path: pathlib.Path
+        for path in tqdm(label_paths, leave=False):
+            with open(path) as json_file:
+                features: List[dict] = json.load(json_file)['features']['xy']
+            kept, file_feature_polygons, file_polygon_rings, file_ring_points, file_coords = \
+                _parse_wkts([feat['wkt'] for feat in features])
+            first: int = len(polygon_rings)
+            first_feature: int = len(feature_polygons)
+            feature_polygons.extend(file_feature_polygons)
+            polygon_rings.extend(file_polygon_rings)
+            ring_points.extend(file_ring_points)
+            coords.append(file_coords)
+            # a multipolygon feature is stored as one polygon per part, all with the damage type of the feature
+            for feat, polygons in zip([features[i] for i in kept], file_feature_polygons):
+                subtype: Optional[str] = feat['properties'].get('subtype')
+                damage.extend([damage_to_damage_type[subtype].value if subtype is not None else 0] * polygons)
+            index[path.stem] = [first, len(polygon_rings), *stats[path.stem], first_feature, len(feature_polygons)]
+
+        root.mkdir(parents=True, exist_ok=True)
+        np.save(root / 'coords.npy', np.concatenate(coords) if len(coords) > 0 else np.zeros((0, 2), np.float32))
+        np.save(root / 'rings.npy', np.concatenate(([0], np.cumsum(ring_points, dtype=np.int64))))
+        np.save(root / 'polygons.npy', np.concatenate(([0], np.cumsum(polygon_rings, dtype=np.int64))))
+        np.save(root / 'features.npy', np.concatenate(([0], np.cumsum(feature_polygons, dtype=np.int64))))
+        np.save(root / 'damage.npy', np.array(damage, dtype=np.uint8))
+        with open(root / 'index.json', 'w') as index_file:
+            json.dump(index, index_file)
+        _stores.pop(base_directory, None)
+        return LabelStore(root)
+
+    @staticmethod
+    def _file_stat(path: pathlib.Path) -> List[int]:
+        stat: os.stat_result = os.stat(path)
+        return [stat.st_mtime_ns, stat.st_size]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._index
+
+    def is_current(self, name: str, label_path: pathlib.Path) -> bool:
+        """
+        :param name: label file name without extension
+        :param label_path: label file
+        :return: label file is in the store and has not changed since it was compiled
+        """
+        entry: Optional[List[int]] = self._index.get(name)
+        return entry is not None and entry[2:4] == self._file_stat(label_path)
+
+    def rings(self, name: str) -> Tuple[List[Rings], npt.NDArray[np.uint8]]:
+        """
+        each part of a multipolygon feature is a separate polygon here
+        :param name: label file name without extension
+        :return: (rings of each polygon as views into the store, damage type value of each polygon)
+        """
+        first, last = self._index[name][:2]
+        results: List[Rings] = []
+        for polygon in range(first, last):
+            ring_first, ring_last = self._polygons[polygon], self._polygons[polygon + 1]
+            results.append([self._coords[self._rings[ring]:self._rings[ring + 1]]
+                            for ring in range(ring_first, ring_last)])
+        return results, self._damage[first:last]
+
+    def polygons(self, name: str) -> Tuple[List[Union[Polygon, MultiPolygon]], npt.NDArray[np.uint8]]:
+        """
+        :param name: label file name without extension
+        :return: (geometry of each feature, damage type value of each feature).
+                 like the label file, features with several parts are multipolygons
+        """
+        rings, damage = self.rings(name)
+        first, last, _, _, first_feature, last_feature = self._index[name]
+        parts: List[Polygon] = [Polygon(polygon_rings[0], polygon_rings[1:]) for polygon_rings in rings]
+        bounds: npt.NDArray[np.int64] = self._features[first_feature:last_feature + 1] - first
+        return [parts[start] if end - start == 1 else MultiPolygon(parts[start:end])
+                for start, end in zip(bounds[:-1], bounds[1:])], damage[bounds[:-1]]
+
+
+_stores: Dict[pathlib.Path, LabelStore] = {}
+
+
+def label_store(base_directory: pathlib.Path) -> Optional[LabelStore]:
+    """
+    stores are opened once per process. directories without a store are checked again on each call
+    :return: label store of a dataset directory if it has been built, otherwise None
+    """
+    store: Optional[LabelStore] = _stores.get(base_directory)
+    if store is None:
+        root: pathlib.Path = LabelStore.path(base_directory)
+        if not (root / 'features.npy').exists():
+            return None
+        store = _stores[base_directory] = LabelStore(root)
+    return store
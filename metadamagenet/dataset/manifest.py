@@ -0,0 +1,259 @@
+import json
+import logging
+import os
+import pathlib
+import sqlite3
+from dataclasses import dataclass
+from typing import List, Tuple, Dict, Optional
+
+import cv2
+import numpy as np
+
+from ..configs import GeneralConfig
+from ..logging import EmojiAdapter
+from .data_time import DataTime
+from .image_data import ImageData, directory_key
+from .rasterize import rasterize_image_data
+
+logger = EmojiAdapter(logging.getLogger())
+
+_FILES: List[Tuple[str, DataTime]] = [(kind, time)
+                                      for kind in ('image', 'label', 'mask')
+                                      for time in (DataTime.PRE, DataTime.POST)]
+_DAMAGE_CLASSES: int = 5
+
+
+def _column(kind: str, time: DataTime) -> str:
+    return f"{kind}_{time.value}"
+
+
+def _file_path(image_data: ImageData, kind: str, time: DataTime) -> pathlib.Path:
+    return getattr(image_data, kind)(time)
+
+
+def _listing_key(path: pathlib.Path) -> str:
+    return f"{path.parent.name}/{path.name}"
+
+
+@dataclass
+class ImageStats:
+    """
+    statistics of an image data stored in its directory manifest
+    """
+    image_data: ImageData
+    buildings: int  # number of buildings in post-disaster label
+    pixels: Tuple[int, ...]  # number of pixels of each damage level (0-4) in post-disaster mask
+    has_pixels: bool = True  # post-disaster mask or label existed when the statistics were computed
+
+
+class Manifest:
+    """
+    sqlite index of a dataset directory.
+    keeps identifier, disaster, size and modification time of image, label and mask files
+    plus building count and damage level pixel histogram of each image data.
+    modification times of the image, label and mask folders are kept too,
+    so adding or removing files is noticed without listing the folders.
+    """
+    filename: str = 'manifest.sqlite'
+
+    def __init__(self, base_directory: pathlib.Path, path: Optional[pathlib.Path] = None):
+        """
+        :param base_directory: dataset directory containing images, labels and masks folders
+        :param path: manifest file path. defaults to a file inside the base directory
+        """
+        self._base: pathlib.Path = base_directory
+        self._path: pathlib.Path = path if path is not None else base_directory / self.filename
+
+    @classmethod
+    def at(cls, base_directory: pathlib.Path, directory: Optional[pathlib.Path] = None) -> 'Manifest':
+        """
+        :param directory: directory to keep the manifest in. manifests of several dataset directories can share it.
+                          defaults to the base directory
+        """
+        if directory is None:
+            return cls(base_directory)
+        return cls(base_directory, directory / f'{directory_key(base_directory)}.sqlite')
+
+    @property
+    def path(self) -> pathlib.Path:
+        return self._path
+
+    @property
+    def exists(self) -> bool:
+        return self._path.exists()
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(str(self._path))
+        file_columns: str = ', '.join(f"{_column(kind, time)}_size INTEGER, {_column(kind, time)}_mtime INTEGER"
+                                      for kind, time in _FILES)
+        pixel_columns: str = ', '.join(f"pixels_{i} INTEGER" for i in range(_DAMAGE_CLASSES))
+        connection.execute(f"CREATE TABLE IF NOT EXISTS images ("
+                           f"disaster TEXT NOT NULL, identifier TEXT NOT NULL, {file_columns}, "
+                           f"buildings INTEGER, {pixel_columns}, PRIMARY KEY (disaster, identifier))")
+        connection.execute("CREATE TABLE IF NOT EXISTS folders (dirname TEXT PRIMARY KEY, mtime INTEGER)")
+        return connection
+
+    def _folder_mtimes(self) -> Dict[str, Optional[int]]:
+        """
+        :return: modification time of image, label and mask folders. it changes when a file is added or removed
+        """
+        config: GeneralConfig = GeneralConfig.get_instance()
+        mtimes: Dict[str, Optional[int]] = {}
+        for dirname in (config.images_dirname, config.labels_dirname, config.masks_dirname):
+            try:
+                mtimes[dirname] = os.stat(self._base / dirname).st_mtime_ns
+            except FileNotFoundError:
+                mtimes[dirname] = None
+        return mtimes
+
+    @property
+    def stale(self) -> bool:
+        """
+        manifest does not exist or files were added to or removed from the directory since it was updated.
+        files modified in place are only noticed by update
+        """
+        if not self.exists:
+            return True
+        connection: sqlite3.Connection = self._connect()
+        recorded: Dict[str, int] = dict(connection.execute("SELECT dirname, mtime FROM folders").fetchall())
+        connection.close()
+        return recorded != self._folder_mtimes()
+
+    def refresh(self) -> int:
+        """
+        updates manifest if it is stale
+        :return: number of inserted or updated rows
+        """
+        if not self.stale:
+            return 0
+        return self.update()
+
+    def _listing(self) -> Dict[str, Tuple[int, int]]:
+        """
+        :return: file name -> (size, mtime) for files of image, label and mask directories
+        """
+        config: GeneralConfig = GeneralConfig.get_instance()
+        listing: Dict[str, Tuple[int, int]] = {}
+        for dirname in (config.images_dirname, config.labels_dirname, config.masks_dirname):
+            directory: pathlib.Path = self._base / dirname
+            if not directory.is_dir():
+                continue
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_file():
+                        stat: os.stat_result = entry.stat()
+                        listing[_listing_key(directory / entry.name)] = (stat.st_size, stat.st_mtime_ns)
+        return listing
+
+    @staticmethod
+    def _stats(image_data: ImageData, has_label: bool, has_mask: bool) -> Tuple[Optional[int], List[Optional[int]]]:
+        """
+        damage level pixels are counted in the post-disaster mask,
+        or in the mask rasterized from the post-disaster label if masks are not created
+        """
+        buildings: Optional[int] = None
+        if has_label:
+            with open(image_data.label(DataTime.POST)) as json_file:
+                buildings = len(json.load(json_file)['features']['xy'])
+        pixels: List[Optional[int]] = [None] * _DAMAGE_CLASSES
+        msk: Optional[np.ndarray] = None
+        if has_mask:
+            msk = cv2.imread(str(image_data.mask(DataTime.POST)), cv2.IMREAD_GRAYSCALE)
+        elif has_label:
+            msk = rasterize_image_data(image_data, DataTime.POST)
+        if msk is not None:
+            pixels = np.bincount(msk.ravel(), minlength=_DAMAGE_CLASSES)[:_DAMAGE_CLASSES].tolist()
+        return buildings, pixels
+
+    def update(self) -> int:
+        """
+        brings manifest up-to-date with the directory.
+        only image datas with added or modified files are re-inspected.
+        :return: number of inserted or updated rows
+        """
+        if not self._base.is_dir():
+            raise ValueError(f"{self._base.absolute()} is not a directory")
+        logger.info(f":card_index: updating manifest of {self._base.absolute()}...")
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        config: GeneralConfig = GeneralConfig.get_instance()
+        # folder times are taken before listing, so files added during the update make the manifest stale
+        folder_mtimes: Dict[str, Optional[int]] = self._folder_mtimes()
+        listing: Dict[str, Tuple[int, int]] = self._listing()
+        file_columns: List[str] = [f"{_column(kind, time)}_{field}" for kind, time in _FILES
+                                   for field in ('size', 'mtime')]
+        columns: List[str] = ['disaster', 'identifier', *file_columns, 'buildings',
+                              *(f"pixels_{i}" for i in range(_DAMAGE_CLASSES))]
+        connection: sqlite3.Connection = self._connect()
+        with connection:
+            # rows written without pixel counts, before labels were rasterized for them, are re-inspected too
+            known: Dict[Tuple[str, str], tuple] = {
+                (row[0], row[1]): tuple(row[2:-1])
+                for row in connection.execute(f"SELECT disaster, identifier, {', '.join(file_columns)}, pixels_0 "
+                                              f"FROM images")
+                if row[-1] is not None or row[2 + file_columns.index('label_post_size')] is None
+            }
+            seen: set = set()
+            changed: int = 0
+            for file_name in listing:
+                dirname, name = file_name.split('/', 1)
+                if dirname != config.images_dirname or not name.endswith('_pre_disaster.png'):
+                    continue
+                disaster, identifier, _, _ = name.split('_')
+                image_data: ImageData = ImageData(self._base, identifier, disaster)
+                files: tuple = tuple(value
+                                     for kind, time in _FILES
+                                     for value in listing.get(_listing_key(_file_path(image_data, kind, time)),
+                                                              (None, None)))
+                seen.add((disaster, identifier))
+                if known.get((disaster, identifier)) == files:
+                    continue
+                buildings, pixels = self._stats(image_data,
+                                                has_label=files[file_columns.index('label_post_size')] is not None,
+                                                has_mask=files[file_columns.index('mask_post_size')] is not None)
+                connection.execute(f"INSERT OR REPLACE INTO images ({', '.join(columns)}) "
+                                   f"VALUES ({', '.join('?' * len(columns))})",
+                                   (disaster, identifier, *files, buildings, *pixels))
+                changed += 1
+            removed: List[Tuple[str, str]] = [key for key in known if key not in seen]
+            connection.executemany("DELETE FROM images WHERE disaster = ? AND identifier = ?", removed)
+            connection.execute("DELETE FROM folders")
+            connection.executemany("INSERT INTO folders (dirname, mtime) VALUES (?, ?)", folder_mtimes.items())
+        connection.close()
+        logger.info(f":card_index: manifest updated. {changed} changed, {len(removed)} removed.")
+        return changed
+
+    def image_datas(self, check: bool = True) -> List[ImageData]:
+        """
+        :param check: check if manifest has recorded all the files of each image data
+        :return: list of image datas, read only from the manifest
+        """
+        size_columns: List[str] = [f"{_column(kind, time)}_size" for kind, time in _FILES]
+        connection: sqlite3.Connection = self._connect()
+        rows: List[tuple] = connection.execute(
+            f"SELECT disaster, identifier, {', '.join(size_columns)} FROM images ORDER BY disaster, identifier"
+        ).fetchall()
+        connection.close()
+        results: List[ImageData] = []
+        for disaster, identifier, *sizes in rows:
+            image_data: ImageData = ImageData(self._base, identifier, disaster)
+            if check:
+                for (kind, time), size in zip(_FILES, sizes):
+                    assert size is not None, f"{_file_path(image_data, kind, time)} does not exist"
+            results.append(image_data)
+        return results
+
+    def stats(self) -> List[ImageStats]:
+        """
+        :return: building count and damage level pixel histogram of each image data
+        """
+        pixel_columns: str = ', '.join(f"pixels_{i}" for i in range(_DAMAGE_CLASSES))
+        connection: sqlite3.Connection = self._connect()
+        rows: List[tuple] = connection.execute(
+            f"SELECT disaster, identifier, buildings, {pixel_columns} FROM images ORDER BY disaster, identifier"
+        ).fetchall()
+        connection.close()
+        return [ImageStats(image_data=ImageData(self._base, identifier, disaster),
+                           buildings=buildings if buildings is not None else 0,
+                           pixels=tuple(p if p is not None else 0 for p in pixels),
+                           has_pixels=pixels[0] is not None)
+                for disaster, identifier, buildings, *pixels in rows]
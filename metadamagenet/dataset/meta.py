@@ -1,10 +1,19 @@
+import queue
 import random
+import threading
 from dataclasses import dataclass
-from typing import List, Iterable, Type, Tuple
+from typing import List, Iterator, Type, Tuple, Dict, Union, Optional, Sequence
 
+import torch
+import torch.multiprocessing as mp
 from torch.utils.data import DataLoader
+from torch.utils.data.dataloader import default_collate
 
 from .dataset import ImageData, Xview2Dataset
+from .cache import TaskCache
+from .table import ImageDataTable
+
+Batch = Dict[str, torch.Tensor]
 
 
 @dataclass
@@ -12,10 +21,11 @@ class Task:
     """
     support: contains support-k-shot samples
     query: contains query-k-shot samples
+    both are data loaders, or lists of loaded batches when the meta data loader uses a worker pool
     """
     name: str
-    support: DataLoader
-    query: DataLoader
+    support: Union[DataLoader, List[Batch]]
+    query: Union[DataLoader, List[Batch]]
 
 
 @dataclass
@@ -32,26 +42,146 @@ class TaskSet:
         return self.tasks[item]
 
 
-class MetaDataLoader(Iterable):
+_worker_dataset: Optional[Xview2Dataset] = None
+
+
+def _init_worker(dataset_class: Type[Xview2Dataset], table: ImageDataTable) -> None:
+    """
+    creates the dataset of all tasks once in each worker of the pool, which decodes image datas
+    """
+    global _worker_dataset
+    # forked workers start with the random state of the parent, so they would draw the same random numbers
+    torch.seed()
+    random.seed()
+    _worker_dataset = dataset_class(table)
+
+
+def _decode(index: int) -> Batch:
+    return _worker_dataset.decode(index)
+
+
+class _Prefetcher(Iterator[TaskSet]):
+    """
+    creates task sets in a background thread and keeps up to depth of them ready
+    """
+
+    def __init__(self, meta_dataloader: 'MetaDataLoader', count: int, depth: int):
+        self._queue: queue.Queue = queue.Queue(maxsize=depth)
+        self._remaining: int = count
+        self._stopped: threading.Event = threading.Event()
+        self._thread = threading.Thread(target=self._produce, args=(meta_dataloader, count), daemon=True)
+        self._thread.start()
+
+    def _put(self, item: Union[TaskSet, Exception]) -> bool:
+        """
+        :return: whether item was queued before the prefetcher was stopped
+        """
+        while not self._stopped.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _produce(self, meta_dataloader: 'MetaDataLoader', count: int) -> None:
+        try:
+            for _ in range(count):
+                if self._stopped.is_set() or not self._put(meta_dataloader.make_task_set()):
+                    return
+        except Exception as e:
+            self._put(e)
+
+    def stop(self) -> None:
+        """
+        stops the background thread and waits until it has finished the task set it is creating,
+        so it does not use the meta data loader anymore. prefetched task sets are dropped
+        """
+        self._stopped.set()
+        self._thread.join()
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                break
+        self._remaining = 0
+
+    def __next__(self) -> TaskSet:
+        if self._remaining == 0:
+            raise StopIteration
+        item: Union[TaskSet, Exception] = self._queue.get()
+        if isinstance(item, Exception):
+            self._remaining = 0
+            raise item
+        self._remaining -= 1
+        return item
+
+
+class MetaDataLoader(Iterator[TaskSet]):
     def __init__(self,
                  dataset_class: Type[Xview2Dataset],
-                 tasks: List[Tuple[str, List[ImageData]]],
+                 tasks: List[Tuple[str, Sequence[ImageData]]],
                  task_set_size: int,
                  support_shots: int,
                  query_shots: int,
-                 batch_size: int = 1):
+                 batch_size: int = 1,
+                 num_workers: int = 0,
+                 prefetch: int = 0,
+                 pin_memory: bool = True,
+                 cache: Optional[TaskCache] = None):
+        """
+        :param num_workers: size of a worker pool shared by all tasks, which loads samples of tasks.
+                            it is created here, before any background thread is started.
+                            if 0, each task gets its own data loaders with a worker each
+        :param prefetch: number of task sets created ahead in background while the current one is used.
+                         requires num_workers > 0
+        :param pin_memory: copy loaded batches into pinned memory. used with the worker pool
+        :param cache: if passed, decoded images and masks are kept in it and taken from it when possible.
+                      image datas which are not cached are decoded by the worker pool, or in this process without one.
+                      random choices of the dataset (like crop windows) are made in this process for each sample
+        """
+        self._pool: Optional[mp.Pool] = None
+        self._prefetcher: Optional[_Prefetcher] = None
+        if prefetch > 0 and num_workers == 0:
+            raise ValueError("prefetching task sets requires a worker pool. num_workers should be positive")
         self._dataset_class: Type[Xview2Dataset] = dataset_class
-        self._tasks: List[Tuple[str, List[ImageData]]] = tasks
+        # image datas of all tasks are kept in one table. each task is a range of its rows
+        self._table: ImageDataTable = ImageDataTable.from_image_datas(
+            [image_data for _, dataset in tasks for image_data in dataset])
+        self._tasks: List[Tuple[str, range]] = []
+        start: int = 0
+        for name, dataset in tasks:
+            self._tasks.append((name, range(start, start + len(dataset))))
+            start += len(dataset)
         self._task_set_size: int = task_set_size
         self._support_shots: int = support_shots
         self._query_shots: int = query_shots
         self._batch_size: int = batch_size
+        self._num_workers: int = num_workers
+        self._prefetch: int = prefetch
+        self._pin_memory: bool = pin_memory and torch.cuda.is_available()
+        self._cache: Optional[TaskCache] = cache
+        self._dataset: Optional[Xview2Dataset] = None
         self._i: int = 0
+        if self._num_workers > 0:
+            self._pool = mp.Pool(self._num_workers, initializer=_init_worker,
+                                 initargs=(self._dataset_class, self._table))
 
-    def __iter__(self):
+    def __iter__(self) -> 'MetaDataLoader':
+        # a prefetcher of an abandoned epoch would create task sets along with the new one
+        self._stop_prefetcher()
         self._i = 0
+        self._prefetcher = _Prefetcher(self, len(self), self._prefetch) if self._prefetch > 0 else None
         return self
 
+    def __next__(self) -> TaskSet:
+        if self._i >= len(self):
+            raise StopIteration
+        self._i += 1
+        if self._prefetcher is not None:
+            return next(self._prefetcher)
+        return self.make_task_set()
+
     def __len__(self) -> int:
         return len(self._tasks) // self._task_set_size
 
@@ -63,35 +193,102 @@ class MetaDataLoader(Iterable):
     def task_set_size(self) -> int:
         return self._task_set_size
 
-    def __next__(self) -> TaskSet:
-        if self._i >= len(self):
-            raise StopIteration
-        self._i += 1
+    @property
+    def cache(self) -> Optional[TaskCache]:
+        return self._cache
 
+    @property
+    def pool(self) -> Optional[mp.Pool]:
+        """
+        worker pool which stays alive across tasks and task sets. None if num_workers is 0
+        """
+        return self._pool
+
+    def _stop_prefetcher(self) -> None:
+        if self._prefetcher is not None:
+            self._prefetcher.stop()
+            self._prefetcher = None
+
+    def close(self) -> None:
+        """
+        stops prefetching and terminates the worker pool
+        """
+        self._stop_prefetcher()
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool = None
+
+    def __del__(self):
+        self.close()
+
+    @property
+    def dataset(self) -> Xview2Dataset:
+        """
+        dataset of all tasks in this process. it makes random choices of samples
+        and decodes image datas without a worker pool
+        """
+        if self._dataset is None:
+            self._dataset = self._dataset_class(self._table)
+        return self._dataset
+
+    def _data_loader(self, indices: Sequence[int]) -> DataLoader:
+        return DataLoader(
+            dataset=self._dataset_class(self._table.take(indices)),
+            batch_size=self._batch_size,
+            num_workers=1,
+            pin_memory=True,
+            shuffle=True,
+            drop_last=False
+        )
+
+    def _batches(self, samples: List[Batch]) -> List[Batch]:
+        random.shuffle(samples)
+        batches: List[Batch] = []
+        for start in range(0, len(samples), self._batch_size):
+            batch: Batch = default_collate(samples[start:start + self._batch_size])
+            if self._pin_memory:
+                batch = {k: v.pin_memory() for k, v in batch.items()}
+            batches.append(batch)
+        return batches
+
+    def make_task_set(self) -> TaskSet:
         tasks: List[Task] = []
-        chosen_tasks: List[Tuple[str, List[ImageData]]] = random.sample(self._tasks, k=self._task_set_size)
-        dataset: List[ImageData]
-        for name, dataset in chosen_tasks:
-            mini_dataset: List[ImageData] = random.sample(dataset, k=(self._support_shots + self._query_shots))
-            support_set: List[ImageData] = mini_dataset[:self._support_shots]
-            query_set: List[ImageData] = mini_dataset[self._support_shots:]
+        chosen_tasks: List[Tuple[str, range]] = random.sample(self._tasks, k=self._task_set_size)
+        rows: range
+        if self._num_workers == 0 and self._cache is None:
+            for name, rows in chosen_tasks:
+                mini_dataset: List[int] = random.sample(rows, k=(self._support_shots + self._query_shots))
+                tasks.append(Task(
+                    name=name,
+                    support=self._data_loader(mini_dataset[:self._support_shots]),
+                    query=self._data_loader(mini_dataset[self._support_shots:])
+                ))
+            return TaskSet(tasks)
+
+        shots: int = self._support_shots + self._query_shots
+        chosen: List[Tuple[str, int]] = [(name, index)
+                                         for name, rows in chosen_tasks
+                                         for index in random.sample(rows, k=shots)]
+        keys: List[str] = [self._table.key(index) for _, index in chosen]
+        decoded: List[Optional[Batch]] = [self._cache.get(name, key) if self._cache is not None else None
+                                          for (name, _), key in zip(chosen, keys)]
+        missing: List[int] = [i for i, entry in enumerate(decoded) if entry is None]
+        # missing image datas of all tasks are submitted at once, so the pool stays busy across task boundaries
+        indices: List[int] = [chosen[i][1] for i in missing]
+        loaded: List[Batch] = self._pool.map(_decode, indices) if self._pool is not None \
+            else [self.dataset.decode(index) for index in indices]
+        for i, entry in zip(missing, loaded):
+            decoded[i] = entry
+            if self._cache is not None:
+                self._cache.put(chosen[i][0], keys[i], entry)
+        # random choices of the dataset are made here, so cached image datas give different samples each time
+        samples: List[Batch] = [self.dataset.sample(entry) for entry in decoded]
+
+        for i, (name, _) in enumerate(chosen_tasks):
+            task_samples: List[Batch] = samples[i * shots:(i + 1) * shots]
             tasks.append(Task(
                 name=name,
-                support=DataLoader(
-                    dataset=self._dataset_class(support_set),
-                    batch_size=self._batch_size,
-                    num_workers=1,
-                    pin_memory=True,
-                    shuffle=True,
-                    drop_last=False
-                ),
-                query=DataLoader(
-                    dataset=self._dataset_class(query_set),
-                    batch_size=self._batch_size,
-                    num_workers=1,
-                    pin_memory=True,
-                    shuffle=True,
-                    drop_last=False
-                )
+                support=self._batches(task_samples[:self._support_shots]),
+                query=self._batches(task_samples[self._support_shots:])
             ))
         return TaskSet(tasks)
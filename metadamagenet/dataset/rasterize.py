@@ -0,0 +1,117 @@
+from typing import List, Sequence, Tuple, Dict, Optional, Union
+
+import cv2
+import numpy as np
+import numpy.typing as npt
+from shapely.geometry import Polygon, MultiPolygon
+
+from ..configs import DamageType
+from .data_time import DataTime
+from .image_data import ImageData
+from .labels import Rings, LabelStore, label_store
+
+damage_type_color: Dict[DamageType, int] = {
+    DamageType.UN_CLASSIFIED: 1,
+    DamageType.NO_DAMAGE: 1,
+    DamageType.MINOR_DAMAGE: 2,
+    DamageType.MAJOR_DAMAGE: 3,
+    DamageType.DESTROYED: 4
+}
+
+
+def polygon_rings(polygon: Polygon) -> Rings:
+    """
+    :return: exterior ring followed by interior rings of a polygon
+    """
+    return [np.asarray(polygon.exterior.coords)] + [np.asarray(interior.coords) for interior in polygon.interiors]
+
+
+def _parts(geometry: Union[Polygon, MultiPolygon]) -> List[Polygon]:
+    """
+    :return: non-empty parts of a geometry
+    """
+    parts: List[Polygon] = list(geometry.geoms) if isinstance(geometry, MultiPolygon) else [geometry]
+    return [part for part in parts if not part.is_empty]
+
+
+def _layers(boxes: npt.NDArray[np.int32]) -> List[List[int]]:
+    """
+    greedily splits polygons into layers in which no two bounding boxes intersect
+    :param boxes: int array of shape (N,4) containing (x_min,y_min,x_max,y_max) of each polygon
+    :return: polygon indices of each layer
+    """
+    layers: List[List[int]] = []
+    layer_boxes: List[npt.NDArray[np.int32]] = []  # first len(layer) rows are boxes of the layer
+    for i, box in enumerate(boxes):
+        for layer, others in zip(layers, layer_boxes):
+            others_used = others[:len(layer)]
+            if not np.any((others_used[:, 0] <= box[2]) & (box[0] <= others_used[:, 2]) &
+                          (others_used[:, 1] <= box[3]) & (box[1] <= others_used[:, 3])):
+                break
+        else:
+            layer, others = [], np.empty((len(boxes), 4), dtype=np.int32)
+            layers.append(layer)
+            layer_boxes.append(others)
+        others[len(layer)] = box
+        layer.append(i)
+    return layers
+
+
+def rasterize(polygons: Sequence[Rings], values: Sequence[int],
+              size: Tuple[int, int] = (1024, 1024)) -> npt.NDArray[np.uint8]:
+    """
+    rasterizes polygons into a uint8 mask.
+    all polygons with the same value are filled by a single fillPoly call, or a few calls if some of them overlap.
+    fillPoly uses the even-odd rule, so interior rings passed along their exterior become holes.
+    where polygons with different values overlap, the larger value is kept.
+    :param polygons: rings of each polygon. empty rings and polygons without points are skipped
+    :param values: pixel value of each polygon
+    :param size: (height,width) of mask
+    :return: mask of shape (H,W)
+    """
+    mask: npt.NDArray[np.uint8] = np.zeros(size, dtype=np.uint8)
+    int_polygons: List[List[npt.NDArray[np.int32]]] = []
+    kept_values: List[int] = []
+    for rings, value in zip(polygons, values):
+        int_rings: List[npt.NDArray[np.int32]] = [np.asarray(ring).round().astype(np.int32).reshape(-1, 2)
+                                                  for ring in rings if len(ring) > 0]
+        if len(int_rings) > 0:
+            int_polygons.append(int_rings)
+            kept_values.append(value)
+    if len(int_polygons) == 0:
+        return mask
+    value_array: npt.NDArray = np.asarray(kept_values)
+    for value in np.unique(value_array):
+        indices: npt.NDArray[np.int64] = np.flatnonzero(value_array == value)
+        boxes: npt.NDArray[np.int32] = np.array([(*int_polygons[i][0].min(axis=0), *int_polygons[i][0].max(axis=0))
+                                                 for i in indices], dtype=np.int32)
+        # even-odd filling would cut the overlap of two polygons out, so overlapping polygons go to separate calls
+        for layer in _layers(boxes):
+            cv2.fillPoly(mask, [ring for i in layer for ring in int_polygons[indices[i]]], int(value))
+    return mask
+
+
+def rasterize_image_data(image_data: ImageData, time: DataTime = DataTime.PRE,
+                         size: Tuple[int, int] = (1024, 1024)) -> npt.NDArray[np.uint8]:
+    """
+    creates the mask of an image data from its polygons.
+    pre-disaster masks contain 0 and 1 values, post-disaster masks contain 0-4 values indicating damage level.
+    :return: mask of shape (H,W)
+    """
+    store: Optional[LabelStore] = label_store(image_data.base)
+    if store is not None and store.is_current(image_data.name(time), image_data.label(time)):
+        rings, damage = store.rings(image_data.name(time))
+        if time == DataTime.PRE:
+            return rasterize(rings, [1] * len(rings), size)
+        return rasterize(rings, [damage_type_color[DamageType(int(value))] for value in damage], size)
+
+    # each part of a multipolygon is rasterized as a separate polygon
+    if time == DataTime.PRE:
+        parts: List[Polygon] = [part for polygon in image_data.polygons(DataTime.PRE) for part in _parts(polygon)]
+        return rasterize([polygon_rings(part) for part in parts], [1] * len(parts), size)
+    parts_with_damage: List[Tuple[Polygon, DamageType]] = [
+        (part, damage_type) for polygon, damage_type in image_data.polygons(DataTime.POST) for part in _parts(polygon)
+    ]
+    return rasterize([polygon_rings(part) for part, _ in parts_with_damage],
+                     [damage_type_color[damage_type] for _, damage_type in parts_with_damage],
+                     size)
@@ -0,0 +1,141 @@
+import pathlib
+from typing import List, Sequence, Dict, Tuple, Optional, Iterator, Set
+
+import torch
+from torch.utils.data import Sampler
+
+from ..configs import GeneralConfig
+from .image_data import ImageData, group_by_disasters
+from .manifest import Manifest, ImageStats
+
+
+def _stats_by_key(manifest: Manifest) -> Dict[Tuple[str, str], ImageStats]:
+    return {(entry.image_data.disaster, entry.image_data.identifier): entry for entry in manifest.stats()}
+
+
+def image_stats(dataset: Sequence[ImageData], manifest_dir: Optional[pathlib.Path] = None) -> List[ImageStats]:
+    """
+    reads statistics of image datas from manifests of their directories.
+    manifests are created or refreshed if files were added or removed, so statistics of each image
+    are computed only once. a manifest missing some of the image datas or their damage histograms is updated.
+    damage histograms are counted in post-disaster masks, or in masks rasterized from labels if there are no masks.
+    :param manifest_dir: directory manifests are kept in. defaults to each directory
+    :return: statistics of each image data, in the same order as dataset
+    """
+    stats: Dict[Tuple[pathlib.Path, str, str], ImageStats] = {}
+    for base in {image_data.base for image_data in dataset}:
+        manifest: Manifest = Manifest.at(base, manifest_dir)
+        manifest.refresh()
+        base_stats: Dict[Tuple[str, str], ImageStats] = _stats_by_key(manifest)
+        keys: Set[Tuple[str, str]] = {(image_data.disaster, image_data.identifier)
+                                      for image_data in dataset if image_data.base == base}
+        if any(key not in base_stats or not base_stats[key].has_pixels for key in keys):
+            # files modified in place do not make a manifest stale, so it is checked file by file
+            manifest.update()
+            base_stats = _stats_by_key(manifest)
+        for key in keys:
+            if key not in base_stats:
+                raise ValueError(f"{base / GeneralConfig.get_instance().images_dirname}: "
+                                 f"no pre-disaster image of {key[0]}_{key[1]}")
+            if not base_stats[key].has_pixels:
+                raise ValueError(f"{base}: no post-disaster label or mask of {key[0]}_{key[1]}")
+            stats[(base, *key)] = base_stats[key]
+    return [stats[(image_data.base, image_data.disaster, image_data.identifier)] for image_data in dataset]
+
+
+class DamageAwareSampler(Sampler[int]):
+    """
+    samples images by how informative they are and balances disasters.
+    weight of each image is empty_weight plus the damage level pixels it contains, weighted by class_weights
+    and normalized to mean 1 over images with buildings.
+    total probability of each disaster is then proportional to (number of its images)^(1-disaster_balance).
+    use it with datasets which have one sample per image data, in the same order.
+    """
+
+    def __init__(self, dataset: Sequence[ImageData],
+                 num_samples: Optional[int] = None,
+                 class_weights: Optional[Sequence[float]] = None,
+                 empty_weight: float = 0.2,
+                 disaster_balance: float = 0.5,
+                 stratified: bool = False,
+                 generator: Optional[torch.Generator] = None,
+                 manifest_dir: Optional[pathlib.Path] = None):
+        """
+        :param dataset: image datas of the dataset
+        :param num_samples: number of samples in each epoch. defaults to dataset size
+        :param class_weights: weight of pixels of each damage level (0-4).
+                              defaults to inverse frequency of damage levels 1-4 in dataset and 0 for background
+        :param empty_weight: weight of an image without any building
+        :param disaster_balance: 0 keeps disasters in their natural proportion, 1 samples all disasters equally
+        :param stratified: draw exactly the expected number of samples from each disaster in every epoch,
+                           instead of drawing all samples from the overall distribution
+        :param generator: random generator used for sampling
+        :param manifest_dir: directory manifests are kept in. defaults to each directory
+        """
+        super().__init__(dataset)
+        if not 0 <= disaster_balance <= 1:
+            raise ValueError(f"disaster_balance should be in [0,1]. got {disaster_balance}")
+        self._num_samples: int = num_samples if num_samples is not None else len(dataset)
+        self._stratified: bool = stratified
+        self._generator: Optional[torch.Generator] = generator
+
+        pixels: torch.Tensor = torch.tensor([stats.pixels for stats in image_stats(dataset, manifest_dir)],
+                                            dtype=torch.float64)
+        weights: torch.Tensor
+        if class_weights is not None:
+            weights = torch.tensor(class_weights, dtype=torch.float64)
+        else:
+            class_pixels: torch.Tensor = pixels.sum(dim=0)
+            weights = torch.where(class_pixels > 0, class_pixels[1:].sum() / (4 * class_pixels),
+                                  torch.zeros_like(class_pixels))
+            weights[0] = 0
+        informativeness: torch.Tensor = pixels @ weights
+        has_buildings: torch.Tensor = pixels[:, 1:].sum(dim=1) > 0
+        if has_buildings.any():
+            informativeness /= informativeness[has_buildings].mean()
+        image_weights: torch.Tensor = empty_weight + informativeness
+
+        # indices of images of each disaster
+        image_datas: List[ImageData] = list(dataset)
+        positions: Dict[int, int] = {id(image_data): i for i, image_data in enumerate(image_datas)}
+        self._groups: List[torch.Tensor] = [torch.tensor([positions[id(image_data)] for image_data in images])
+                                            for _, images in group_by_disasters(image_datas)]
+        self._group_weights: List[torch.Tensor] = []
+        shares: List[float] = []
+        for group in self._groups:
+            group_weights: torch.Tensor = image_weights[group]
+            total: float = float(group_weights.sum())
+            # with empty_weight=0, a disaster without buildings has no weight. its images are sampled uniformly
+            self._group_weights.append(group_weights / total if total > 0
+                                       else torch.full_like(group_weights, 1 / len(group)))
+            shares.append(len(group) ** (1 - disaster_balance))
+        self._shares: torch.Tensor = torch.tensor(shares, dtype=torch.float64) / sum(shares)
+        self._weights: torch.Tensor = torch.zeros(len(dataset), dtype=torch.float64)
+        for group, group_weights, share in zip(self._groups, self._group_weights, self._shares):
+            self._weights[group] = group_weights * share
+
+    @property
+    def weights(self) -> torch.Tensor:
+        """
+        sampling probability of each image
+        """
+        return self._weights
+
+    def __len__(self) -> int:
+        return self._num_samples
+
+    def __iter__(self) -> Iterator[int]:
+        if not self._stratified:
+            yield from torch.multinomial(self._weights, self._num_samples, replacement=True,
+                                         generator=self._generator).tolist()
+            return
+
+        counts: torch.Tensor = (self._shares * self._num_samples).floor().long()
+        # remaining samples go to the disasters with the largest fractional part
+        remaining: int = self._num_samples - int(counts.sum())
+        counts[(self._shares * self._num_samples - counts).argsort(descending=True)[:remaining]] += 1
+        indices: torch.Tensor = torch.cat([
+            group[torch.multinomial(group_weights, int(count), replacement=True, generator=self._generator)]
+            for group, group_weights, count in zip(self._groups, self._group_weights, counts) if count > 0
+        ])
+        yield from indices[torch.randperm(len(indices), generator=self._generator)].tolist()
@@ -0,0 +1,302 @@
+import abc
+import json
+import logging
+import pathlib
+import random
+import tarfile
+from typing import Dict, List, Sequence, Iterator, Optional, Union, Tuple
+
+import cv2
+import numpy as np
+import torch
+import torch.distributed as dist
+from torch.utils.data import IterableDataset, get_worker_info
+from tqdm.autonotebook import tqdm
+
+from .data_time import DataTime
+from .dataset import post_disaster_images
+from .image_data import ImageData
+from ..logging import EmojiAdapter
+
+logger = EmojiAdapter(logging.getLogger())
+
+Sample = Dict[str, bytes]  # field -> encoded png. members of a sample in a shard are named '{key}.{field}.png'
+
+
+def _sample_files(image_data: ImageData) -> Dict[str, pathlib.Path]:
+    return {
+        'pre_img': image_data.image(DataTime.PRE),
+        'post_img': image_data.image(DataTime.POST),
+        'pre_msk': image_data.mask(DataTime.PRE),
+        'post_msk': image_data.mask(DataTime.POST)
+    }
+
+
+def write_shards(dataset: Sequence[ImageData], output: pathlib.Path, shard_size: int = 256,
+                 shuffle: bool = True, seed: int = 0) -> List[pathlib.Path]:
+    """
+    packs pre/post-disaster images and masks of a dataset into tar shards, so they can be read sequentially.
+    png files are stored as they are, without decoding. sample counts of shards are saved in an index file.
+    shards of an earlier run in output directory are removed.
+    :param dataset: image datas to pack
+    :param output: directory to write shards in
+    :param shard_size: number of samples in each shard
+    :param shuffle: shuffle samples before packing, so each shard contains a mix of disasters
+    :param seed: seed of sample order
+    :return: paths of written shards
+    """
+    samples: List[ImageData] = list(dataset)
+    if shuffle:
+        random.Random(seed).shuffle(samples)
+    output.mkdir(parents=True, exist_ok=True)
+    # shards of an earlier run would be read along with the new ones
+    for path in [*output.glob('shard-*.tar'), *output.glob('shard-*.tmp'), output / ShardDataset.index_filename]:
+        path.unlink(missing_ok=True)
+    logger.info(f":package: packing {len(samples)} samples into shards at {output}")
+
+    paths: List[pathlib.Path] = []
+    counts: Dict[str, int] = {}
+    for start in tqdm(range(0, len(samples), shard_size), leave=False):
+        path: pathlib.Path = output / f'shard-{len(paths):05d}.tar'
+        temp_path: pathlib.Path = path.with_suffix('.tmp')
+        with tarfile.open(temp_path, 'w') as shard:
+            image_data: ImageData
+            for image_data in samples[start:start + shard_size]:
+                key: str = f'{image_data.base.name}/{image_data.disaster}_{image_data.identifier}'
+                for field, file_path in _sample_files(image_data).items():
+                    shard.add(str(file_path), arcname=f'{key}.{field}.png')
+        temp_path.replace(path)
+        paths.append(path)
+        counts[path.name] = len(samples[start:start + shard_size])
+
+    with open(output / ShardDataset.index_filename, 'w') as index_file:
+        json.dump(counts, index_file)
+    return paths
+
+
+def _decode_image(data: bytes) -> torch.ByteTensor:
+    """
+    :return: uint8 RGB tensor of shape (3,H,W)
+    """
+    image: np.ndarray = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    return torch.from_numpy(np.ascontiguousarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB).transpose(2, 0, 1)))
+
+
+def _decode_mask(data: bytes) -> torch.ByteTensor:
+    """
+    :return: uint8 tensor of shape (1,H,W)
+    """
+    mask: np.ndarray = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+    return torch.from_numpy(mask).unsqueeze(0)
+
+
+class ShardDataset(IterableDataset, metaclass=abc.ABCMeta):
+    """
+    streams samples from tar shards created by write_shards.
+    shards are put in a (per epoch) random order and the sequence of their samples is split into equal contiguous
+    ranges between distributed ranks and DataLoader workers. each one reads its range sequentially.
+    remaining samples of an uneven split are dropped, so all ranks yield the same number of samples.
+    samples are shuffled within a bounded buffer of encoded samples and decoded when they leave it.
+    all random choices of a reader use one generator seeded by seed, epoch, rank and worker id.
+    call set_epoch before each epoch to shuffle shard order differently.
+    """
+    index_filename: str = 'shards.json'
+
+    def __init__(self, source: Union[pathlib.Path, Sequence[pathlib.Path]],
+                 shuffle_buffer: int = 512,
+                 seed: int = 0,
+                 rank: Optional[int] = None,
+                 world_size: Optional[int] = None):
+        """
+        :param source: directory of shards or list of shard paths. shards of a directory are the ones listed
+                       in its index file, or all shard files if it has no index
+        :param shuffle_buffer: number of samples kept in shuffle buffer. samples are not shuffled if it is 0 or 1
+        :param seed: seed of shard order and sample shuffling. it should be the same on all ranks
+        :param rank: rank of this process. taken from torch.distributed if it is initialized, otherwise 0
+        :param world_size: number of ranks. taken from torch.distributed if it is initialized, otherwise 1
+        """
+        super().__init__()
+        self._shards: List[pathlib.Path]
+        if isinstance(source, pathlib.Path) and (source / self.index_filename).exists():
+            with open(source / self.index_filename, 'r') as index_file:
+                self._shards = [source / name for name in sorted(json.load(index_file))]
+        elif isinstance(source, pathlib.Path):
+            self._shards = sorted(source.glob('shard-*.tar'))
+        else:
+            self._shards = list(source)
+        if len(self._shards) == 0:
+            raise ValueError(f"no shards found in {source}")
+        self._shuffle_buffer: int = shuffle_buffer
+        self._seed: int = seed
+        self._epoch: int = 0
+        distributed: bool = dist.is_available() and dist.is_initialized()
+        self._rank: int = rank if rank is not None else (dist.get_rank() if distributed else 0)
+        self._world_size: int = world_size if world_size is not None else \
+            (dist.get_world_size() if distributed else 1)
+        self._counts: List[int] = self._load_counts()
+
+    def _load_counts(self) -> List[int]:
+        """
+        :return: number of samples of each shard. read from index files of shard directories,
+                 or by listing shards which are not in them
+        """
+        counts: Dict[pathlib.Path, int] = {}
+        for directory in {shard.parent for shard in self._shards}:
+            if (directory / self.index_filename).exists():
+                with open(directory / self.index_filename, 'r') as index_file:
+                    # index files are keyed by shard file name, so they are resolved against their own directory
+                    counts.update({(directory / name).resolve(): count
+                                   for name, count in json.load(index_file).items()})
+        return [counts[shard.resolve()] if shard.resolve() in counts else self._count_samples(shard)
+                for shard in self._shards]
+
+    @staticmethod
+    def _count_samples(path: pathlib.Path) -> int:
+        with tarfile.open(path, 'r') as shard:
+            return len({member.name.rsplit('.', 2)[0] for member in shard.getmembers() if member.isfile()})
+
+    def set_epoch(self, epoch: int) -> None:
+        self._epoch = epoch
+
+    def _samples_per_rank(self) -> int:
+        return sum(self._counts) // self._world_size
+
+    def __len__(self) -> int:
+        """
+        number of samples yielded on this rank
+        """
+        return self._samples_per_rank()
+
+    @staticmethod
+    def _worker() -> Tuple[int, int]:
+        """
+        :return: (id of DataLoader worker, number of workers)
+        """
+        worker_info = get_worker_info()
+        return (worker_info.id, worker_info.num_workers) if worker_info is not None else (0, 1)
+
+    def _random(self) -> random.Random:
+        """
+        :return: generator of this reader in the current epoch
+        """
+        return random.Random(f"{self._seed}-{self._epoch}-{self._rank}-{self._worker()[0]}")
+
+    def _assigned_ranges(self) -> List[Tuple[pathlib.Path, int, int]]:
+        """
+        :return: (shard, first sample, last sample+1) of each shard read by this reader
+        """
+        order: List[int] = list(range(len(self._shards)))
+        # shard order is shared by all readers, so it does not depend on rank and worker
+        random.Random(self._seed + self._epoch).shuffle(order)
+        worker_id, num_workers = self._worker()
+        per_rank: int = self._samples_per_rank()
+        start: int = self._rank * per_rank + per_rank * worker_id // num_workers
+        end: int = self._rank * per_rank + per_rank * (worker_id + 1) // num_workers
+        ranges: List[Tuple[pathlib.Path, int, int]] = []
+        offset: int = 0
+        for i in order:
+            first, last = max(start - offset, 0), min(end - offset, self._counts[i])
+            if first < last:
+                ranges.append((self._shards[i], first, last))
+            offset += self._counts[i]
+        return ranges
+
+    @staticmethod
+    def _read_shard(path: pathlib.Path, first: int = 0, last: Optional[int] = None) -> Iterator[Sample]:
+        """
+        reads a shard as a stream and groups its members into samples
+        :param first: number of samples to skip
+        :param last: number of the sample to stop at. reads to the end of shard if None
+        """
+        key: Optional[str] = None
+        sample: Sample = {}
+        number: int = -1
+        with tarfile.open(path, 'r|') as shard:
+            for member in shard:
+                if not member.isfile():
+                    continue
+                member_key, field, _ = member.name.rsplit('.', 2)
+                if member_key != key:
+                    if len(sample) > 0:
+                        yield sample
+                    key, sample = member_key, {}
+                    number += 1
+                    if last is not None and number >= last:
+                        return
+                if number >= first:
+                    sample[field] = shard.extractfile(member).read()
+        if len(sample) > 0:
+            yield sample
+
+    def _samples(self, rng: random.Random) -> Iterator[Sample]:
+        buffer: List[Sample] = []
+        for path, first, last in self._assigned_ranges():
+            for sample in self._read_shard(path, first, last):
+                if self._shuffle_buffer <= 1:
+                    yield sample
+                    continue
+                if len(buffer) < self._shuffle_buffer:
+                    buffer.append(sample)
+                    continue
+                i: int = rng.randrange(len(buffer))
+                buffer[i], sample = sample, buffer[i]
+                yield sample
+        rng.shuffle(buffer)
+        yield from buffer
+
+    @abc.abstractmethod
+    def _decode(self, sample: Sample, rng: random.Random) -> Iterator[Dict[str, torch.ByteTensor]]:
+        """
+        :param rng: generator of this reader
+        :return: decoded samples of an encoded sample
+        """
+        pass
+
+    def __iter__(self) -> Iterator[Dict[str, torch.ByteTensor]]:
+        rng: random.Random = self._random()
+        for sample in self._samples(rng):
+            yield from self._decode(sample, rng)
+
+
+class ShardLocalizationDataset(ShardDataset):
+    def __init__(self, source: Union[pathlib.Path, Sequence[pathlib.Path]],
+                 use_post_disaster_images: Union[bool, float] = 0.015,
+                 shuffle_buffer: int = 512,
+                 seed: int = 0,
+                 rank: Optional[int] = None,
+                 world_size: Optional[int] = None):
+        """
+        :param use_post_disaster_images: if true, both pre- and post-disaster version of each sample are yielded.
+        if false, only pre-disaster images are yielded. if float value passed,
+        this value should be a probability in [0,1) and with this probability pre-disaster images will be replaced
+        with their corresponding post-disaster image
+        """
+        super().__init__(source, shuffle_buffer, seed, rank, world_size)
+        self._use_post_disaster_images: bool
+        self._post_version_prob: float
+        self._use_post_disaster_images, self._post_version_prob = post_disaster_images(use_post_disaster_images)
+
+    def __len__(self) -> int:
+        if self._use_post_disaster_images:
+            return 2 * super().__len__()
+        return super().__len__()
+
+    def _decode(self, sample: Sample, rng: random.Random) -> Iterator[Dict[str, torch.ByteTensor]]:
+        # localization mask is the same as pre-disaster version
+        msk: torch.ByteTensor = _decode_mask(sample['pre_msk'])
+        if self._use_post_disaster_images:
+            yield {'img': _decode_image(sample['pre_img']), 'msk': msk}
+            yield {'img': _decode_image(sample['post_img']), 'msk': msk}
+        elif rng.random() < self._post_version_prob:
+            yield {'img': _decode_image(sample['post_img']), 'msk': msk}
+        else:
+            yield {'img': _decode_image(sample['pre_img']), 'msk': msk}
+
+
+class ShardClassificationDataset(ShardDataset):
+    def _decode(self, sample: Sample, rng: random.Random) -> Iterator[Dict[str, torch.ByteTensor]]:
+        yield {
+            'img_pre': _decode_image(sample['pre_img']),
+            'img_post': _decode_image(sample['post_img']),
+            'msk': _decode_mask(sample['post_msk'])
+        }
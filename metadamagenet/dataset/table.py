@@ -0,0 +1,145 @@
+import pathlib
+from typing import List, Iterable, Iterator, Sequence, Tuple, Dict, Union, overload
+
+import numpy as np
+import numpy.typing as npt
+
+from ..configs import GeneralConfig
+from .data_time import DataTime
+from .image_data import ImageData
+
+
+class ImageDataTable(Sequence[ImageData]):
+    """
+    columnar table of image datas.
+    disasters and identifiers are kept in byte string arrays and base directories are interned,
+    so the table holds no python object per entry and pickles as a few buffers.
+    image datas are created when they are accessed. paths and keys of entries can be read
+    without creating image datas.
+    """
+
+    def __init__(self, bases: List[str], base_indices: npt.NDArray[np.int32],
+                 disasters: npt.NDArray[np.bytes_], identifiers: npt.NDArray[np.bytes_]):
+        """
+        :param bases: distinct base directories
+        :param base_indices: index of base directory of each entry
+        :param disasters: disaster of each entry
+        :param identifiers: identifier of each entry
+        """
+        self._bases: List[str] = bases
+        self._base_indices: npt.NDArray[np.int32] = base_indices
+        self._disasters: npt.NDArray[np.bytes_] = disasters
+        self._identifiers: npt.NDArray[np.bytes_] = identifiers
+        self._base_paths: List[pathlib.Path] = [pathlib.Path(base) for base in bases]
+        # cache keys use absolute base directories, see TensorCache.key
+        self._key_prefixes: List[str] = [f'{path.absolute()}/' for path in self._base_paths]
+        config: GeneralConfig = GeneralConfig.get_instance()
+        self._images_dirname: str = config.images_dirname
+        self._labels_dirname: str = config.labels_dirname
+        self._masks_dirname: str = config.masks_dirname
+
+    @classmethod
+    def from_image_datas(cls, image_datas: Iterable[ImageData]) -> 'ImageDataTable':
+        if isinstance(image_datas, ImageDataTable):
+            return image_datas
+        bases: Dict[pathlib.Path, int] = {}
+        base_indices: List[int] = []
+        disasters: List[str] = []
+        identifiers: List[str] = []
+        image_data: ImageData
+        for image_data in image_datas:
+            base_indices.append(bases.setdefault(image_data.base, len(bases)))
+            disasters.append(image_data.disaster)
+            identifiers.append(image_data.identifier)
+        return cls([str(base) for base in bases],
+                   np.array(base_indices, dtype=np.int32),
+                   np.array(disasters, dtype=np.bytes_),
+                   np.array(identifiers, dtype=np.bytes_))
+
+    def __len__(self) -> int:
+        return len(self._identifiers)
+
+    @overload
+    def __getitem__(self, index: int) -> ImageData:
+        ...
+
+    @overload
+    def __getitem__(self, index: slice) -> 'ImageDataTable':
+        ...
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[ImageData, 'ImageDataTable']:
+        if isinstance(index, slice):
+            return self.take(np.arange(len(self))[index])
+        return ImageData(self._base_paths[self._base_indices[index]],
+                         self._identifiers[index].decode(),
+                         self._disasters[index].decode())
+
+    def __iter__(self) -> Iterator[ImageData]:
+        for index in range(len(self)):
+            yield self[index]
+
+    def take(self, indices: Sequence[int]) -> 'ImageDataTable':
+        """
+        :return: table of entries at indices
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        return ImageDataTable(self._bases, self._base_indices[indices], self._disasters[indices],
+                              self._identifiers[indices])
+
+    @property
+    def disasters(self) -> npt.NDArray[np.bytes_]:
+        return self._disasters
+
+    @property
+    def identifiers(self) -> npt.NDArray[np.bytes_]:
+        return self._identifiers
+
+    def base(self, index: int) -> pathlib.Path:
+        """
+        :return: base directory of an entry
+        """
+        return self._base_paths[self._base_indices[index]]
+
+    def key(self, index: int) -> str:
+        """
+        :return: cache key of an entry, the same as TensorCache.key of its image data
+        """
+        return f'{self._key_prefixes[self._base_indices[index]]}' \
+               f'{self._disasters[index].decode()}_{self._identifiers[index].decode()}'
+
+    def name(self, index: int, time: DataTime = DataTime.PRE) -> str:
+        """
+        returns filename (without extension) of an entry
+        """
+        return f'{self._disasters[index].decode()}_{self._identifiers[index].decode()}_{time.value}_disaster'
+
+    def _path(self, index: int, dirname: str, filename: str) -> str:
+        return f'{self._bases[self._base_indices[index]]}/{dirname}/{filename}'
+
+    def image(self, index: int, time: DataTime = DataTime.PRE) -> str:
+        """
+        :return: path to image file of an entry
+        """
+        return self._path(index, self._images_dirname, f'{self.name(index, time)}.png')
+
+    def label(self, index: int, time: DataTime = DataTime.PRE) -> str:
+        """
+        :return: path to json label file of an entry
+        """
+        return self._path(index, self._labels_dirname, f'{self.name(index, time)}.json')
+
+    def mask(self, index: int, time: DataTime = DataTime.PRE) -> str:
+        """
+        :return: path to mask image file of an entry
+        """
+        return self._path(index, self._masks_dirname, f'{self.name(index, time)}_target.png')
+
+    def group_by_disasters(self) -> List[Tuple[str, 'ImageDataTable']]:
+        """
+        same as group_by_disasters, with a table for each disaster
+        """
+        disasters, inverse = np.unique(self._disasters, return_inverse=True)
+        order: npt.NDArray[np.int64] = np.argsort(inverse, kind='stable')
+        bounds: npt.NDArray[np.int64] = np.cumsum(np.bincount(inverse, minlength=len(disasters)))
+        return [(disaster.decode(), self.take(indices))
+                for disaster, indices in zip(disasters, np.split(order, bounds[:-1]))]
@@ -0,0 +1,162 @@
+import logging
+import math
+import os
+import pathlib
+import struct
+import zlib
+from typing import Optional, Sequence, Tuple, List, Dict
+
+import numpy as np
+import numpy.typing as npt
+import kornia.io as kio
+from kornia.io import ImageLoadType
+from tqdm.autonotebook import tqdm
+
+from ..logging import EmojiAdapter
+from .data_time import DataTime
+from .image_data import ImageData, directory_key
+
+logger = EmojiAdapter(logging.getLogger())
+
+Window = Tuple[int, int, int, int]  # (top, left, height, width) in pixels
+
+_MAGIC: bytes = b'MDNT'
+_HEADER = struct.Struct('<4sBBHHHH')  # magic, version, compressed, channels, height, width, tile size
+
+
+def write_tiles(path: pathlib.Path, image: npt.NDArray[np.uint8], tile_size: int = 128, compress: bool = True) -> None:
+    """
+    writes an image as a grid of tiles. tiles are stored row by row after a table of their byte offsets.
+    :param path: tiled image file path
+    :param image: uint8 array of shape (C,H,W)
+    :param tile_size: height and width of each tile
+    :param compress: compress each tile with zlib
+    """
+    channels, height, width = image.shape
+    payloads: List[bytes] = []
+    for top in range(0, height, tile_size):
+        for left in range(0, width, tile_size):
+            tile: bytes = np.ascontiguousarray(image[:, top:top + tile_size, left:left + tile_size]).tobytes()
+            payloads.append(zlib.compress(tile, 1) if compress else tile)
+    offsets: npt.NDArray[np.uint64] = np.concatenate(([0], np.cumsum([len(p) for p in payloads]))).astype('<u8')
+
+    temp_path: pathlib.Path = path.with_suffix('.tmp')
+    with open(temp_path, 'wb') as tiled_file:
+        tiled_file.write(_HEADER.pack(_MAGIC, 1, compress, channels, height, width, tile_size))
+        tiled_file.write(offsets.tobytes())
+        for payload in payloads:
+            tiled_file.write(payload)
+    os.replace(temp_path, path)
+
+
+def read_window(path: pathlib.Path, window: Optional[Window] = None) -> npt.NDArray[np.uint8]:
+    """
+    reads and decodes only the tiles covering a window of a tiled image
+    :param path: tiled image file path
+    :param window: region to read. whole image if None
+    :return: uint8 array of shape (C,height,width)
+    """
+    with open(path, 'rb') as tiled_file:
+        magic, _, compressed, channels, height, width, tile_size = _HEADER.unpack(tiled_file.read(_HEADER.size))
+        assert magic == _MAGIC, f"{path} is not a tiled image"
+        rows, cols = math.ceil(height / tile_size), math.ceil(width / tile_size)
+        offsets: npt.NDArray[np.uint64] = np.frombuffer(tiled_file.read(8 * (rows * cols + 1)), dtype='<u8')
+        data_start: int = _HEADER.size + 8 * (rows * cols + 1)
+
+        top, left, window_height, window_width = window if window is not None else (0, 0, height, width)
+        first_row, last_row = top // tile_size, (top + window_height - 1) // tile_size
+        first_col, last_col = left // tile_size, (left + window_width - 1) // tile_size
+        region_top, region_left = first_row * tile_size, first_col * tile_size
+        region: npt.NDArray[np.uint8] = np.empty(
+            (channels,
+             min(height, (last_row + 1) * tile_size) - region_top,
+             min(width, (last_col + 1) * tile_size) - region_left), dtype=np.uint8)
+
+        for row in range(first_row, last_row + 1):
+            # tiles of a row are contiguous in the file, so each row of the window is a single read
+            start: int = int(offsets[row * cols + first_col])
+            tiled_file.seek(data_start + start)
+            buffer: bytes = tiled_file.read(int(offsets[row * cols + last_col + 1]) - start)
+            tile_height: int = min(tile_size, height - row * tile_size)
+            for col in range(first_col, last_col + 1):
+                payload: bytes = buffer[int(offsets[row * cols + col]) - start:int(offsets[row * cols + col + 1]) - start]
+                tile_width: int = min(tile_size, width - col * tile_size)
+                tile = np.frombuffer(zlib.decompress(payload) if compressed else payload, dtype=np.uint8)
+                region[:,
+                       row * tile_size - region_top:row * tile_size - region_top + tile_height,
+                       col * tile_size - region_left:col * tile_size - region_left + tile_width] = \
+                    tile.reshape(channels, tile_height, tile_width)
+
+    return region[:, top - region_top:top - region_top + window_height,
+                  left - region_left:left - region_left + window_width]
+
+
+class TiledImageStore:
+    """
+    dataset images stored as grids of (optionally compressed) uint8 tiles,
+    so a crop of an image can be read without decoding the whole image.
+    """
+
+    def __init__(self, root: pathlib.Path, tile_size: int = 128, compress: bool = True):
+        """
+        :param root: directory to keep tiled images in
+        :param tile_size: height and width of each tile
+        :param compress: compress each tile with zlib
+        """
+        self._root: pathlib.Path = root
+        self._tile_size: int = tile_size
+        self._compress: bool = compress
+        self._directories: Dict[pathlib.Path, pathlib.Path] = {}
+
+    def directory(self, base: pathlib.Path) -> pathlib.Path:
+        """
+        :return: directory of tiled images of a dataset directory, named after a hash of its resolved path
+        """
+        directory: Optional[pathlib.Path] = self._directories.get(base)
+        if directory is None:
+            directory = self._directories[base] = self._root / directory_key(base)
+        return directory
+
+    def path(self, image_data: ImageData, time: DataTime = DataTime.PRE) -> pathlib.Path:
+        return self.file(image_data.base, image_data.name(time))
+
+    def file(self, base: pathlib.Path, name: str) -> pathlib.Path:
+        """
+        :param base: dataset directory of image
+        :param name: image file name without extension
+        :return: path to tiled image
+        """
+        return self.directory(base) / f'{name}.tiles'
+
+    def sync(self, dataset: Sequence[ImageData]) -> int:
+        """
+        converts images which are not converted yet or have changed since they were converted
+        :return: number of converted images
+        """
+        stale: List[Tuple[ImageData, DataTime]] = []
+        for image_data in dataset:
+            for time in (DataTime.PRE, DataTime.POST):
+                tiled_path: pathlib.Path = self.path(image_data, time)
+                if not tiled_path.exists() or \
+                        tiled_path.stat().st_mtime_ns < image_data.image(time).stat().st_mtime_ns:
+                    stale.append((image_data, time))
+        if len(stale) == 0:
+            return 0
+
+        logger.info(f":jigsaw: converting {len(stale)} images into tiles at {self._root}")
+        for image_data, time in tqdm(stale, leave=False):
+            tiled_path = self.path(image_data, time)
+            tiled_path.parent.mkdir(parents=True, exist_ok=True)
+            write_tiles(tiled_path,
+                        kio.load_image(str(image_data.image(time)), ImageLoadType.RGB8).numpy(),
+                        self._tile_size,
+                        self._compress)
+        return len(stale)
+
+    def read(self, base: pathlib.Path, name: str, window: Optional[Window] = None) -> npt.NDArray[np.uint8]:
+        """
+        :param base: dataset directory of image
+        :param name: image file name without extension
+        :return: uint8 array of shape (3,H,W) holding the window of the image
+        """
+        return read_window(self.file(base, name), window)
@@ -1,3 +1,4 @@
 from .manager import Metadata, Checkpoint, ModelManager
 from .base import BaseModel, Classifier, Localizer
+from .inference import InferenceReport
 from .aggregate import ModelAggregator, Mean, FourFlips, FourRotations
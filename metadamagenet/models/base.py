@@ -1,6 +1,9 @@
 import abc
+import contextlib
+import copy
+import functools
 import logging
-from typing import Generic, TypeVar, Optional, Tuple, Dict, get_args, Type
+from typing import Generic, TypeVar, Optional, Tuple, Dict, get_args, Type, Callable, Iterator, List
 
 from typing_extensions import Self
 import torch
@@ -8,6 +11,7 @@ from torch import Tensor, nn
 
 from ..logging import EmojiAdapter
 from .manager import Checkpoint, Metadata, ModelManager
+from .inference import InferenceReport, fold_batch_norms, freeze
 from .unet import UnetBase
 
 logger = EmojiAdapter(logging.getLogger())
@@ -64,10 +68,70 @@ class BaseModel(nn.Module, metaclass=abc.ABCMeta):
     def name(cls) -> str:
         pass
 
+    def optimize_for_inference(self, sample: torch.Tensor, frozen: bool = True) -> Tuple[nn.Module, InferenceReport]:
+        """
+        creates a copy of model for inference, which folds batch norm layers into convolutions where it is valid.
+        if frozen, the copy is also traced, frozen and optimized by torch.jit, which fuses convolutions with
+        following relu layers where the backend supports it. model is not changed and keeps its training mode.
+        :param sample: preprocessed input batch on the device of model, in the memory format used for inference
+        :param frozen: trace and freeze the optimized model. falls back to the unfrozen model if tracing fails
+        :return: (optimized model, report of folded layers and maximum output deviation from model on sample)
+        """
+        training: bool = self.training
+        self.eval()
+        try:
+            with torch.no_grad():
+                expected: torch.Tensor = self(sample)
+                optimized: nn.Module = copy.deepcopy(self)
+                folded, moved = fold_batch_norms(optimized)
+                is_frozen: bool = False
+                if frozen:
+                    try:
+                        optimized = freeze(optimized, sample)
+                        is_frozen = True
+                    except Exception as e:
+                        logger.warning(f":warning: could not freeze {self.name()}, using unfrozen model: {e}")
+                deviation: torch.Tensor = (optimized(sample) - expected).abs().max()
+        finally:
+            self.train(training)
+        report = InferenceReport(folded=folded,
+                                 moved=moved,
+                                 frozen=is_frozen,
+                                 max_abs_deviation=deviation.item(),
+                                 max_rel_deviation=(deviation / expected.abs().max().clamp(min=1e-12)).item())
+        logger.info(f":zap: optimized {self.name()} for inference: {report}")
+        return optimized, report
+
 
 UnetType = TypeVar('UnetType', bound=UnetBase)
 
 
+def _forward_chunks(forward: Callable[[Tensor], Tensor], chunks: int, x: Tensor) -> Tensor:
+    return torch.cat([forward(chunk) for chunk in x.chunk(chunks, dim=0)], dim=0)
+
+
+@contextlib.contextmanager
+def batch_norm_per_chunk(module: nn.Module, chunks: int) -> Iterator[None]:
+    """
+    makes batch norm layers of a module in training mode normalize each chunk of their input batch separately,
+    and update running statistics once per chunk in order. so a forward pass on a batch of concatenated chunks
+    normalizes and updates statistics the same as separate forward passes on each chunk.
+    other layers still run once on the whole batch.
+    :param module: module to change batch norm layers of
+    :param chunks: number of equal chunks of the batch
+    """
+    layers: List[nn.modules.batchnorm._BatchNorm] = [layer for layer in module.modules()
+                                                     if isinstance(layer, nn.modules.batchnorm._BatchNorm)
+                                                     and layer.training]
+    for layer in layers:
+        layer.forward = functools.partial(_forward_chunks, type(layer).forward.__get__(layer), chunks)
+    try:
+        yield
+    finally:
+        for layer in layers:
+            del layer.forward
+
+
 class Localizer(BaseModel, Generic[UnetType]):
     @classmethod
     def get_unet_type(cls) -> Type[UnetType]:
@@ -124,9 +188,16 @@ class Classifier(BaseModel, Generic[UnetType]):
     def name(cls) -> str:
         return cls.get_unet_type().name() + "Classifier"
 
-    def __init__(self, unet: Optional[UnetType] = None):
+    def __init__(self, unet: Optional[UnetType] = None, batched_siamese: bool = False):
+        """
+        :param unet: shared unet of pre- and post-disaster images
+        :param batched_siamese: run the unet once on a batch of pre- and post-disaster images stacked together,
+                                instead of once for each. in training, batch norm layers still normalize them
+                                separately, so outputs, gradients and running statistics are the same
+        """
         super().__init__()
         self.unet: UnetType = unet if unet is not None else self.get_unet_type()()
+        self.batched_siamese: bool = batched_siamese
         self.res: nn.Conv2d = nn.Conv2d(in_channels=self.unet.out_channels * 2,
                                         out_channels=5,
                                         kernel_size=1,
@@ -148,8 +219,13 @@ class Classifier(BaseModel, Generic[UnetType]):
         :param x: float tensor of shape (N,6,H,H)
         :return: float tensor of shape (N,5,H,H)
         """
-        pre_disaster_embedding = self.unet(x[:, :3, :, :])
-        post_disaster_embedding = self.unet(x[:, 3:, :, :])
+        if self.batched_siamese:
+            with batch_norm_per_chunk(self.unet, 2):
+                embeddings = self.unet(torch.cat((x[:, :3, :, :], x[:, 3:, :, :]), dim=0))
+            pre_disaster_embedding, post_disaster_embedding = embeddings.chunk(2, dim=0)
+        else:
+            pre_disaster_embedding = self.unet(x[:, :3, :, :])
+            post_disaster_embedding = self.unet(x[:, 3:, :, :])
         dec10 = torch.cat([pre_disaster_embedding, post_disaster_embedding], dim=1)
         return self.res(dec10)
 
@@ -160,8 +236,8 @@ class Classifier(BaseModel, Generic[UnetType]):
         """
         :param data: {'img_pre': torch.Tensor of shape (N,3,H,H),
                       'img_post': torch.Tensor of shape (N,3,H,H),
-                      'msk':torch.Tensor of shape (N,1,H,H)}
+                      'msk':torch.Tensor of shape (N,1,H,H) with 0-4 values}
         :return: (torch.FloatTensor of shape (N,6,H,H), torch.LongTensor of shape (N,H,W)
         """
         return (torch.cat((data['img_pre'] * 2 - 1, data['img_post'] * 2 - 1), dim=1),
-                (data['msk'] * 4).long().squeeze(1))
+                data['msk'].long().squeeze(1))
@@ -1,6 +1,8 @@
 import torch
 from torch import nn
 
+from ..functional import concat
+
 
 class CatBnAct(nn.Module):
     """
@@ -13,7 +15,7 @@ class CatBnAct(nn.Module):
         self.act = activation_fn
 
     def forward(self, x: torch.Tensor):
-        x = torch.cat(x, dim=1) if isinstance(x, tuple) else x
+        x = concat(x) if isinstance(x, tuple) else x
         return self.act(self.bn(x))
 
 
@@ -97,7 +99,7 @@ class DualPathBlock(nn.Module):
             self.c1x1_c = BnActConv2d(in_chs=num_3x3_b, out_chs=num_1x1_c + inc, kernel_size=1, stride=1)
 
     def forward(self, x):
-        x_in = torch.cat(x, dim=1) if isinstance(x, tuple) else x
+        x_in = concat(x) if isinstance(x, tuple) else x
         if self.has_proj:
             if self.key_stride == 2:
                 x_s = self.c1x1_w_s2(x_in)
@@ -119,5 +121,5 @@ class DualPathBlock(nn.Module):
             out1 = x_in[:, :self.num_1x1_c, :, :]
             out2 = x_in[:, self.num_1x1_c:, :, :]
         resid = x_s1 + out1
-        dense = torch.cat([x_s2, out2], dim=1)
+        dense = concat([x_s2, out2])
         return resid, dense
@@ -0,0 +1,26 @@
+from typing import Sequence
+
+import torch
+
+__all__ = ('concat',)
+
+
+def _channels_last(tensor: torch.Tensor) -> bool:
+    """
+    channel slices of channels_last tensors are not contiguous in any format, but keep channels innermost
+    """
+    return tensor.dim() == 4 and (tensor.is_contiguous(memory_format=torch.channels_last) or
+                                  (tensor.stride(1) == 1 and tensor.size(1) > 1))
+
+
+def concat(tensors: Sequence[torch.Tensor]) -> torch.Tensor:
+    """
+    concatenates feature maps along channels.
+    torch.cat returns an NCHW tensor when its inputs have different memory formats,
+    so the result is converted back to channels_last if any input is channels_last
+    """
+    result: torch.Tensor = torch.cat(tensors, dim=1)
+    if any(_channels_last(tensor) for tensor in tensors) and \
+            not result.is_contiguous(memory_format=torch.channels_last):
+        result = result.contiguous(memory_format=torch.channels_last)
+    return result
@@ -0,0 +1,147 @@
+import dataclasses
+from typing import Tuple, Type, Dict, Sequence
+
+import torch
+import torchvision
+from torch import nn
+
+from .dpn.modules import BnActConv2d, CatBnAct, DualPathBlock, InputBlock
+from .senet.modules import Bottleneck
+
+__all__ = ('InferenceReport', 'ChannelAffine', 'fold_conv_bn', 'fold_batch_norms', 'freeze')
+
+# attributes of conv and batch norm layers which are applied one after another in forward of each module type
+CONV_BN_ATTRIBUTES: Dict[Type[nn.Module], Tuple[Tuple[str, str], ...]] = {
+    Bottleneck: (('conv1', 'bn1'), ('conv2', 'bn2'), ('conv3', 'bn3')),
+    torchvision.models.resnet.BasicBlock: (('conv1', 'bn1'), ('conv2', 'bn2')),
+    torchvision.models.resnet.Bottleneck: (('conv1', 'bn1'), ('conv2', 'bn2'), ('conv3', 'bn3')),
+    InputBlock: (('conv', 'bn'),),
+}
+
+
+@dataclasses.dataclass
+class InferenceReport:
+    folded: int  # batch norms folded into their preceding convolutions
+    moved: int  # batch norms before relu whose scales are moved into their following convolutions
+    frozen: bool  # model is traced, frozen and optimized by torch.jit
+    max_abs_deviation: float  # maximum absolute difference of outputs from the original model
+    max_rel_deviation: float  # max_abs_deviation relative to the maximum absolute output of the original model
+
+
+class ChannelAffine(nn.Module):
+    """
+    per-channel scale and shift which replaces a batch norm in inference
+    """
+
+    def __init__(self, scale: torch.Tensor, shift: torch.Tensor):
+        super().__init__()
+        self.register_buffer('scale', scale.view(1, -1, 1, 1))
+        self.register_buffer('shift', shift.view(1, -1, 1, 1))
+        self.scaled: bool = not bool(torch.all(scale == 1))
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        if self.scaled:
+            return torch.addcmul(self.shift, x, self.scale)
+        return x + self.shift
+
+
+def _batch_norm_affine(bn: nn.BatchNorm2d) -> Tuple[torch.Tensor, torch.Tensor]:
+    """
+    :return: (scale,shift) of batch norm in eval mode
+    """
+    scale: torch.Tensor = torch.rsqrt(bn.running_var + bn.eps)
+    if bn.weight is not None:
+        scale = scale * bn.weight
+    shift: torch.Tensor = -bn.running_mean * scale
+    if bn.bias is not None:
+        shift = shift + bn.bias
+    return scale, shift
+
+
+def fold_conv_bn(conv: nn.Conv2d, bn: nn.BatchNorm2d) -> None:
+    """
+    folds a batch norm into weights and bias of the convolution whose output it normalizes
+    """
+    scale, shift = _batch_norm_affine(bn)
+    conv.weight.data.mul_(scale.view(-1, 1, 1, 1))
+    bias: torch.Tensor = conv.bias.data * scale + shift if conv.bias is not None else shift
+    conv.bias = nn.Parameter(bias)
+
+
+def _scale_inputs(conv: nn.Conv2d, scale: torch.Tensor) -> None:
+    """
+    multiplies weights of a convolution by a scale of each input channel
+    """
+    out_channels, group_in_channels = conv.weight.shape[:2]
+    out_per_group: int = out_channels // conv.groups
+    # input channel of each (output channel, weight input channel) of a grouped convolution
+    channels: torch.Tensor = (torch.arange(out_channels, device=scale.device) // out_per_group).unsqueeze(1) \
+        * group_in_channels + torch.arange(group_in_channels, device=scale.device).unsqueeze(0)
+    conv.weight.data.mul_(scale[channels].unsqueeze(-1).unsqueeze(-1))
+
+
+def _move_bn_scale(bn: nn.BatchNorm2d, convs: Sequence[nn.Conv2d]) -> ChannelAffine:
+    """
+    relu(a*x+b) = a*relu(x+b/a) for a > 0, so positive scales of a batch norm followed by relu
+    are moved into the convolutions applied on the output of relu, whose zero padding is not changed by them.
+    :return: remaining shift and scale which replaces the batch norm
+    """
+    scale, shift = _batch_norm_affine(bn)
+    positive: torch.Tensor = scale > 0
+    for conv in convs:
+        _scale_inputs(conv, torch.where(positive, scale, torch.ones_like(scale)))
+    return ChannelAffine(torch.where(positive, torch.ones_like(scale), scale),
+                         torch.where(positive, shift / torch.where(positive, scale, torch.ones_like(scale)), shift))
+
+
+def fold_batch_norms(module: nn.Module) -> Tuple[int, int]:
+    """
+    removes batch norm layers of a model in eval mode where it is valid:
+    batch norms which directly follow a convolution (in sequential modules, senet and resnet blocks and dpn input
+    block) are folded into it, and scales of dpn batch norms, which are followed by relu and a convolution,
+    are moved into that convolution.
+    batch norms of efficientnet backbones are only folded where the backbone builds them in sequential modules
+    right after their convolutions, as the torch hub efficientnets do. other batch norms are kept.
+    :param module: model to change in place
+    :return: number of folded and moved batch norms
+    """
+    folded: int = 0
+    moved: int = 0
+    for parent in list(module.modules()):
+        for cls, attributes in CONV_BN_ATTRIBUTES.items():
+            if isinstance(parent, cls):
+                for conv_name, bn_name in attributes:
+                    conv, bn = getattr(parent, conv_name), getattr(parent, bn_name)
+                    if isinstance(conv, nn.Conv2d) and isinstance(bn, nn.BatchNorm2d):
+                        fold_conv_bn(conv, bn)
+                        setattr(parent, bn_name, nn.Identity())
+                        folded += 1
+
+        if isinstance(parent, nn.Sequential):
+            names = list(parent._modules)
+            for conv_name, bn_name in zip(names, names[1:]):
+                conv, bn = parent._modules[conv_name], parent._modules[bn_name]
+                if isinstance(conv, nn.Conv2d) and isinstance(bn, nn.BatchNorm2d):
+                    fold_conv_bn(conv, bn)
+                    parent._modules[bn_name] = nn.Identity()
+                    folded += 1
+
+        if isinstance(parent, BnActConv2d) and isinstance(parent.bn, nn.BatchNorm2d) and \
+                isinstance(parent.act, nn.ReLU):
+            parent.bn = _move_bn_scale(parent.bn, [parent.conv])
+            moved += 1
+        if isinstance(parent, DualPathBlock) and parent.b and isinstance(parent.c1x1_c, CatBnAct) and \
+                isinstance(parent.c1x1_c.bn, nn.BatchNorm2d) and isinstance(parent.c1x1_c.act, nn.ReLU):
+            parent.c1x1_c.bn = _move_bn_scale(parent.c1x1_c.bn, [parent.c1x1_c1, parent.c1x1_c2])
+            moved += 1
+    return folded, moved
+
+
+def freeze(module: nn.Module, sample: torch.Tensor) -> torch.jit.ScriptModule:
+    """
+    traces a model on a sample batch, freezes its weights and applies torch.jit inference optimizations,
+    which fuse convolutions with following relu and add operations where the backend supports it
+    (oneDNN on cpu, cuDNN on cuda)
+    """
+    traced: torch.jit.ScriptModule = torch.jit.trace(module, sample)
+    return torch.jit.optimize_for_inference(torch.jit.freeze(traced))
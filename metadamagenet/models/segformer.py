@@ -6,17 +6,30 @@ import torch.nn.functional as tf
 from torch import Tensor
 from transformers import SegformerDecodeHead, SegformerModel, SegformerConfig, SegformerForSemanticSegmentation
 
-from .base import BaseModel
+from .base import BaseModel, batch_norm_per_chunk
+
+
+def _resize(x: torch.Tensor, size: Optional[Tuple[int, int]]) -> torch.Tensor:
+    """
+    resizes images to the working resolution of segformer. they are not resized if size is None
+    """
+    if size is None or tuple(x.shape[-2:]) == tuple(size):
+        return x
+    return tf.interpolate(x, size=size, mode='bilinear', align_corners=False)
 
 
 class SegFormerLocalizer(BaseModel):
-    def __init__(self):
+    def __init__(self, input_size: Optional[Tuple[int, int]] = (512, 512)):
+        """
+        :param input_size: working resolution of segformer. inputs are resized to it and logits are resized back.
+                           None keeps inputs in their native resolution. smaller sizes are faster
+        """
         super().__init__()
         self.config: SegformerConfig = SegformerConfig.from_pretrained("nvidia/segformer-b0-finetuned-ade-512-512")
         self.config.num_labels = 1
         self.segformer: SegformerModel = SegformerModel.from_pretrained("nvidia/segformer-b0-finetuned-ade-512-512")
         self.decode_head: SegformerDecodeHead = SegformerDecodeHead(self.config)
-        self.segformer_input_size = (512, 512)
+        self.segformer_input_size: Optional[Tuple[int, int]] = input_size
 
     @classmethod
     def name(cls) -> str:
@@ -39,7 +52,7 @@ class SegFormerLocalizer(BaseModel):
         output_hidden_states: bool = False
         output_size: Tuple[int, int] = x.shape[-2:]
 
-        pixel_values = tf.interpolate(x, size=self.segformer_input_size, mode='bilinear', align_corners=False)
+        pixel_values = _resize(x, self.segformer_input_size)
 
         outputs = self.segformer(
             pixel_values,
@@ -55,7 +68,14 @@ class SegFormerLocalizer(BaseModel):
 
 
 class SegFormerClassifier(BaseModel):
-    def __init__(self, segformer: Optional[SegformerModel] = None):
+    def __init__(self, segformer: Optional[SegformerModel] = None, batched_siamese: bool = False,
+                 input_size: Optional[Tuple[int, int]] = (512, 512)):
+        """
+        :param segformer: shared encoder of pre- and post-disaster images
+        :param batched_siamese: run the encoder once on pre- and post-disaster images stacked together
+        :param input_size: working resolution of segformer. inputs are resized to it and logits are resized back.
+                           None keeps inputs in their native resolution. smaller sizes are faster
+        """
         super().__init__()
         self.config: SegformerConfig = SegformerConfig.from_pretrained("nvidia/segformer-b0-finetuned-ade-512-512")
         if segformer is not None:
@@ -65,7 +85,8 @@ class SegFormerClassifier(BaseModel):
         self.config.num_labels = 5
         self.config.hidden_sizes = [hidden_size * 2 for hidden_size in self.config.hidden_sizes]
         self.decode_head: SegformerDecodeHead = SegformerDecodeHead(self.config)
-        self.segformer_input_size = (512, 512)
+        self.batched_siamese: bool = batched_siamese
+        self.segformer_input_size: Optional[Tuple[int, int]] = input_size
 
     @classmethod
     def name(cls) -> str:
@@ -78,35 +99,47 @@ class SegFormerClassifier(BaseModel):
         """
         :param data: {'img_pre': torch.Tensor of shape (N,3,H,H),
                       'img_post': torch.Tensor of shape (N,3,H,H),
-                      'msk':torch.Tensor of shape (N,1,H,H)}
+                      'msk':torch.Tensor of shape (N,1,H,H) with 0-4 values}
         :return: (torch.FloatTensor of shape (N,6,H,H), torch.LongTensor of shape (N,H,W)
         """
         return (torch.cat((data['img_pre'] * 2 - 1, data['img_post'] * 2 - 1), dim=1),
-                (data['msk'] * 4).long().squeeze(1))
+                data['msk'].long().squeeze(1))
 
     def forward(self, x: torch.Tensor) -> torch.Tensor:
         return_dict: bool = True
         output_hidden_states: bool = False
         output_size: Tuple[int, int] = x.shape[-2:]
 
-        pixel_values = tf.interpolate(x, size=self.segformer_input_size, mode='bilinear', align_corners=False)
-
-        pre_outputs = self.segformer(
-            pixel_values[:, :3, :, :],
-            output_attentions=False,
-            output_hidden_states=True,  # we need the intermediate hidden states
-            return_dict=return_dict,
-        )
-
-        post_outputs = self.segformer(
-            pixel_values[:, 3:, :, :],
-            output_attentions=False,
-            output_hidden_states=True,  # we need the intermediate hidden states
-            return_dict=return_dict,
-        )
-        # concat before feed into MLP layers
-        concatenated_outputs = [torch.cat([a, b], dim=1)
-                                for a, b in zip(pre_outputs.hidden_states, post_outputs.hidden_states)]
+        pixel_values = _resize(x, self.segformer_input_size)
+
+        if self.batched_siamese:
+            with batch_norm_per_chunk(self.segformer, 2):
+                outputs = self.segformer(
+                    torch.cat((pixel_values[:, :3, :, :], pixel_values[:, 3:, :, :]), dim=0),
+                    output_attentions=False,
+                    output_hidden_states=True,  # we need the intermediate hidden states
+                    return_dict=return_dict,
+                )
+            # hidden states of pre- and post-disaster images are in the first and second half of the batch
+            concatenated_outputs = [torch.cat(hidden_state.chunk(2, dim=0), dim=1)
+                                    for hidden_state in outputs.hidden_states]
+        else:
+            pre_outputs = self.segformer(
+                pixel_values[:, :3, :, :],
+                output_attentions=False,
+                output_hidden_states=True,  # we need the intermediate hidden states
+                return_dict=return_dict,
+            )
+
+            post_outputs = self.segformer(
+                pixel_values[:, 3:, :, :],
+                output_attentions=False,
+                output_hidden_states=True,  # we need the intermediate hidden states
+                return_dict=return_dict,
+            )
+            # concat before feed into MLP layers
+            concatenated_outputs = [torch.cat([a, b], dim=1)
+                                    for a, b in zip(pre_outputs.hidden_states, post_outputs.hidden_states)]
         logits = self.decode_head(concatenated_outputs)
         upsampled_logits = tf.interpolate(logits, size=output_size, mode="bilinear", align_corners=False)
 
@@ -3,6 +3,7 @@ import torch
 from torch import nn
 import torch.nn.functional as tf
 
+from ..functional import concat
 from ..senet import SCSEModule
 
 
@@ -61,7 +62,7 @@ class DecoderModule(nn.Module):
         :return: torch.Tensor of shape (N,out_channels,H,H)
         """
         out1: torch.Tensor = self.conv1(tf.interpolate(inputs, scale_factor=2))
-        return self.conv2(torch.cat((out1, injected), dim=1))
+        return self.conv2(concat((out1, injected)))
 
 
 class SCSEDecoderModule(DecoderModule):
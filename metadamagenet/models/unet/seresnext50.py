@@ -3,7 +3,7 @@ from torch import nn
 import torch.nn.functional as F
 
 from .base import UnetBase
-from .modules import ConvRelu
+from .modules import ConvRelu, concat
 from ..senet import SENet, se_resnext50_32x4d
 
 
@@ -52,16 +52,16 @@ class SeResnext50Unet(UnetBase):
         enc5 = self.conv5(enc4)
 
         dec6 = self.conv6(F.interpolate(enc5, scale_factor=2))
-        dec6 = self.conv6_2(torch.cat([dec6, enc4], 1))
+        dec6 = self.conv6_2(concat([dec6, enc4]))
 
         dec7 = self.conv7(F.interpolate(dec6, scale_factor=2))
-        dec7 = self.conv7_2(torch.cat([dec7, enc3], 1))
+        dec7 = self.conv7_2(concat([dec7, enc3]))
 
         dec8 = self.conv8(F.interpolate(dec7, scale_factor=2))
-        dec8 = self.conv8_2(torch.cat([dec8, enc2], 1))
+        dec8 = self.conv8_2(concat([dec8, enc2]))
 
         dec9 = self.conv9(F.interpolate(dec8, scale_factor=2))
-        dec9 = self.conv9_2(torch.cat([dec9, enc1], 1))
+        dec9 = self.conv9_2(concat([dec9, enc1]))
 
         dec10 = self.conv10(F.interpolate(dec9, scale_factor=2))
 
@@ -1,8 +1,26 @@
-from typing import Any
+from typing import Any, Dict
 import abc
 
+import torch
+
 
 class Runner(metaclass=abc.ABCMeta):
     @abc.abstractmethod
     def run(self) -> Any:
         pass
+
+
+def to_device(data_batch: Dict[str, torch.Tensor], device: torch.device) -> Dict[str, torch.Tensor]:
+    """
+    moves a data batch to device. datasets emit uint8 tensors, so only uint8 data is copied to the device.
+    images ('img*' keys) are converted to [0,1] float values there in one multiplication.
+    masks stay uint8 label maps, which augmentations warp with nearest neighbour and models convert to long.
+    float tensors are moved without conversion.
+    """
+    result: Dict[str, torch.Tensor] = {}
+    for key, value in data_batch.items():
+        value = value.to(device=device, non_blocking=True)
+        if value.dtype == torch.uint8 and key.startswith('img'):
+            value = value * (1 / 255)
+        result[key] = value
+    return result
@@ -16,7 +16,7 @@ from tqdm.autonotebook import tqdm
 from ...logging import EmojiAdapter
 from ...models import BaseModel, Metadata, Checkpoint, ModelManager
 from ...dataset import MetaDataLoader, TaskSet, Task
-from ..base import Runner
+from ..base import Runner, to_device
 from .validator import MetaValidator
 
 logger = EmojiAdapter(logging.getLogger())
@@ -47,13 +47,18 @@ class MetaTrainer(Runner):
                  validation_params: Optional[MetaValidationInTrainingParams] = None,
                  model_metadata: Metadata = Metadata(),
                  device: Optional[torch.device] = None,
+                 memory_format: torch.memory_format = torch.contiguous_format
                  ):
+        """
+        :param memory_format: memory format of model weights and inputs. torch.channels_last runs convolutions in NHWC
+        """
 
         self._device: Optional[torch.device] = device if device is not None else (
             torch.device("cuda") if torch.cuda.is_available() else torch.device("cpu")
         )
 
-        self._model: BaseModel = model.to(self._device)
+        self._memory_format: torch.memory_format = memory_format
+        self._model: BaseModel = model.to(self._device, memory_format=memory_format)
         self._version: str = version
         self._seed: str = seed
         self._meta_dataloader: MetaDataLoader = meta_dataloader
@@ -109,17 +114,17 @@ class MetaTrainer(Runner):
             transform=self._validation_params.transform,
             loss=self._loss,
             score=self._validation_params.score if self._validation_params.score is not None else self._score,
-            device=self._device
+            device=self._device,
+            memory_format=self._memory_format
         )
 
     def _prepare_batch(self, data_batch: Dict[str, torch.Tensor]) -> Dict[str, torch.Tensor]:
-        if self._device is not None:
-            data_batch = {k: v.to(device=self._device, non_blocking=True) for k, v in
-                          data_batch.items()}
+        data_batch = to_device(data_batch, self._device)
         with torch.no_grad():
             if self._transform is not None:
                 data_batch = self._transform(data_batch)
-            return self._model.preprocess(data_batch)
+            inputs, targets = self._model.preprocess(data_batch)
+            return inputs.contiguous(memory_format=self._memory_format), targets
 
     def _train_epoch(self, epoch: int) -> None:
         self._model.train()
@@ -227,6 +232,8 @@ class MetaTrainer(Runner):
                     "query_score": total_query_score.compute().item(),
                     "lr": f"{self._lr_scheduler.get_last_lr()[-1]:.7f}"
                 })
+        if self._meta_dataloader.cache is not None:
+            self._meta_dataloader.cache.log_stats()
 
     def _save_model(self, epochs_trained: int, score: float) -> None:
         self._model.metadata.best_score = score
@@ -12,7 +12,7 @@ from tqdm.autonotebook import tqdm
 from ...logging import EmojiAdapter
 from ...models import BaseModel
 from ...dataset import MetaDataLoader, TaskSet, Task
-from ..base import Runner
+from ..base import Runner, to_device
 
 logger = EmojiAdapter(logging.getLogger())
 
@@ -26,13 +26,18 @@ class MetaValidator(Runner):
                  n_inner_iter: int,
                  transform: Optional[nn.Module] = None,
                  loss: nn.Module = None,
-                 device: Optional[torch.device] = None):
+                 device: Optional[torch.device] = None,
+                 memory_format: torch.memory_format = torch.contiguous_format):
+        """
+        :param memory_format: memory format of model weights and inputs. torch.channels_last runs convolutions in NHWC
+        """
         self._device: torch.device
         if device is not None:
             self._device = device
         else:
             self._device = torch.device('cuda') if torch.cuda.is_available() else torch.device('cpu')
-        self._model: BaseModel = model.to(self._device)
+        self._memory_format: torch.memory_format = memory_format
+        self._model: BaseModel = model.to(self._device, memory_format=memory_format)
         self._transform: nn.Module = transform
         if self._transform is not None:
             self._transform = self._transform.to(self._device)
@@ -44,13 +49,12 @@ class MetaValidator(Runner):
         self._inner_optim: Callable[[nn.Module, ], torch.optim.Optimizer] = inner_opt
 
     def _prepare_batch(self, data_batch: Dict[str, torch.Tensor]) -> Dict[str, torch.Tensor]:
-        if self._device is not None:
-            data_batch = {k: v.to(device=self._device, non_blocking=True) for k, v in
-                          data_batch.items()}
+        data_batch = to_device(data_batch, self._device)
         with torch.no_grad():
             if self._transform is not None:
                 data_batch = self._transform(data_batch)
-            return self._model.preprocess(data_batch)
+            inputs, targets = self._model.preprocess(data_batch)
+            return inputs.contiguous(memory_format=self._memory_format), targets
 
     def run(self) -> float:
         # Crucially in our testing procedure here, we do *not* fine-tune
@@ -145,4 +149,6 @@ class MetaValidator(Runner):
             "query_loss": total_query_loss.compute().item(),
             "query_score": total_query_score.compute().item()
         })
+        if self._meta_dataloader.cache is not None:
+            self._meta_dataloader.cache.log_stats()
         return total_query_score.compute().item()
@@ -15,7 +15,7 @@ from torch.cuda import amp
 from torch.backends import cudnn
 from torchmetrics import MeanMetric
 
-from .base import Runner
+from .base import Runner, to_device
 from ..models import Checkpoint, Metadata, ModelManager, BaseModel
 from torchmetrics import Metric
 from ..logging import EmojiAdapter
@@ -48,14 +48,19 @@ class Trainer(Runner):
                  model_metadata: Metadata = Metadata(),
                  device: Optional[torch.device] = None,
                  grad_scaler: Optional[amp.GradScaler] = None,
-                 clip_grad_norm: Optional[float] = None
+                 clip_grad_norm: Optional[float] = None,
+                 memory_format: torch.memory_format = torch.contiguous_format
                  ):
+        """
+        :param memory_format: memory format of model weights and inputs. torch.channels_last runs convolutions in NHWC
+        """
 
         self._device: Optional[torch.device] = device if device is not None else (
             torch.device("cuda") if torch.cuda.is_available() else torch.device("cpu")
         )
 
-        self._model: BaseModel = model.to(self._device) if self._device is not None else model
+        self._memory_format: torch.memory_format = memory_format
+        self._model: BaseModel = model.to(self._device, memory_format=memory_format)
         self._version: str = version
         self._seed: str = seed
         self._dataloader: DataLoader = dataloader
@@ -110,7 +115,8 @@ class Trainer(Runner):
             transform=self._validation_params.transform,
             loss=self._loss,
             score=self._validation_params.score if self._validation_params.score is not None else self._score,
-            device=self._device
+            device=self._device,
+            memory_format=self._memory_format
         )
 
     def _train_epoch(self, epoch: int) -> None:
@@ -121,9 +127,9 @@ class Trainer(Runner):
                         leave=False,
                         desc=emoji.emojize(f":repeat_one: Training {epoch}/{self._epochs}", language='alias'))
         i: int
-        data_batch: Dict[str, torch.FloatTensor]
+        data_batch: Dict[str, torch.Tensor]
         for i, data_batch in enumerate(iterator):
-            data_batch = {k: v.to(device=self._device, non_blocking=True) for k, v in data_batch.items()}
+            data_batch = to_device(data_batch, self._device)
 
             inputs: torch.Tensor  # (B,5,H,W) or (B,1,H,W) with float values
             targets: torch.Tensor  # (B,H,W) with long values (0-4) or (0-1)
@@ -131,6 +137,7 @@ class Trainer(Runner):
                 if self._transform is not None:
                     data_batch = self._transform(data_batch)
                 inputs, targets = self._model.preprocess(data_batch)
+                inputs = inputs.contiguous(memory_format=self._memory_format)
 
             with amp.autocast() if self._grad_scaler is not None else nullcontext():
                 outputs: torch.Tensor = self._model(inputs)
@@ -8,7 +8,7 @@ from torch import nn
 from torch.utils.data import DataLoader
 from torchmetrics import MeanMetric
 
-from .base import Runner
+from .base import Runner, to_device
 from torchmetrics import Metric
 from ..logging import EmojiAdapter
 from ..models import BaseModel, ModelAggregator
@@ -23,15 +23,20 @@ class Validator(Runner):
                  score: Metric,
                  transform: Optional[nn.Module] = None,
                  loss: Optional[nn.Module] = None,
-                 device: Optional[torch.device] = None
+                 device: Optional[torch.device] = None,
+                 memory_format: torch.memory_format = torch.contiguous_format
                  ):
+        """
+        :param memory_format: memory format of model weights and inputs. torch.channels_last runs convolutions in NHWC
+        """
 
         self._device: torch.device
         if device is not None:
             self._device = device
         else:
             self._device = torch.device('cuda') if torch.cuda.is_available() else torch.device('cpu')
-        self._model: Union[BaseModel, ModelAggregator] = model.to(self._device)
+        self._memory_format: torch.memory_format = memory_format
+        self._model: Union[BaseModel, ModelAggregator] = model.to(self._device, memory_format=memory_format)
         self._transform: nn.Module = transform
         if self._transform is not None:
             self._transform = self._transform.to(self._device)
@@ -61,8 +66,7 @@ class Validator(Runner):
         with torch.no_grad():
             i: int
             for i, data_batch in enumerate(iterator):
-                if self._device is not None:
-                    data_batch = {k: v.to(device=self._device, non_blocking=True) for k, v in data_batch.items()}
+                data_batch = to_device(data_batch, self._device)
 
                 if self._transform is not None:
                     data_batch = self._transform(data_batch)
@@ -70,6 +74,7 @@ class Validator(Runner):
                 inputs: torch.Tensor
                 targets: torch.Tensor
                 inputs, targets = self._model.preprocess(data_batch)
+                inputs = inputs.contiguous(memory_format=self._memory_format)
                 activated_outputs: torch.Tensor
                 if isinstance(self._model, BaseModel):
                     outputs: torch.Tensor = self._model(inputs)
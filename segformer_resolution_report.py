@@ -0,0 +1,113 @@
+import argparse
+import json
+import pathlib
+import time
+from typing import Dict, List, Optional, Tuple, Any
+
+import torch
+from torch.utils.data import DataLoader
+from torchmetrics import Metric
+
+from metadamagenet.dataset import LocalizationDataset, ClassificationDataset
+from metadamagenet.metrics import xview2
+from metadamagenet.models import BaseModel
+from metadamagenet.models.segformer import SegFormerLocalizer, SegFormerClassifier
+from metadamagenet.runner.base import to_device
+
+
+def parse_resolution(value: str) -> Optional[Tuple[int, int]]:
+    """
+    'native' keeps the native resolution, 'N' is N*N and 'HxW' is H*W
+    """
+    if value == 'native':
+        return None
+    height, _, width = value.partition('x')
+    return int(height), int(width or height)
+
+
+def evaluate(model: BaseModel, dataloader: DataLoader, score: Metric, device: torch.device,
+             batches: Optional[int]) -> Dict[str, Any]:
+    """
+    :return: score of model and latency of its forward pass on each batch
+    """
+    model.eval()
+    score = score.clone().to(device)
+    latencies: List[float] = []
+    sizes: List[int] = []
+    with torch.no_grad():
+        for i, data_batch in enumerate(dataloader):
+            if batches is not None and i >= batches:
+                break
+            inputs, targets = model.preprocess(to_device(data_batch, device))
+            if device.type == 'cuda':
+                torch.cuda.synchronize(device)
+            start: float = time.perf_counter()
+            outputs: torch.Tensor = model(inputs)
+            if device.type == 'cuda':
+                torch.cuda.synchronize(device)
+            latencies.append(time.perf_counter() - start)
+            sizes.append(inputs.size(0))
+            score.update(model.activate(outputs), targets)
+    # the first batch includes warmup of kernels and allocators
+    start_index: int = 1 if len(latencies) > 1 else 0
+    return {
+        'score': score.compute().item(),
+        'batches': len(latencies),
+        'images': sum(sizes),
+        'latency_per_batch': sum(latencies[start_index:]) / len(latencies[start_index:]),
+        'latency_per_image': sum(latencies[start_index:]) / sum(sizes[start_index:]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='latency and score of segformer models at each working resolution')
+    parser.add_argument('--data', required=True, nargs='+', help='validation dataset directories')
+    parser.add_argument('--resolutions', nargs='+', default=['native', '512', '384', '256'],
+                        help="working resolutions: 'native', N or HxW")
+    parser.add_argument('--localizer', nargs=2, metavar=('VERSION', 'SEED'), default=None,
+                        help='checkpoint of localizer. randomly initialized if not given')
+    parser.add_argument('--classifier', nargs=2, metavar=('VERSION', 'SEED'), default=None,
+                        help='checkpoint of classifier. randomly initialized if not given')
+    parser.add_argument('--batched-siamese', action='store_true', help='use batched siamese forward of classifier')
+    parser.add_argument('--batch-size', type=int, default=4)
+    parser.add_argument('--batches', type=int, default=None, help='number of batches to evaluate. all if not given')
+    parser.add_argument('--num-workers', type=int, default=4)
+    parser.add_argument('--output', default=None, help='json file to write the report in. printed if not given')
+    args = parser.parse_args()
+
+    device = torch.device('cuda') if torch.cuda.is_available() else torch.device('cpu')
+    sources = [pathlib.Path(path) for path in args.data]
+    localizer: SegFormerLocalizer = SegFormerLocalizer.from_pretrained(args.localizer[0], int(args.localizer[1])) \
+        if args.localizer is not None else SegFormerLocalizer()
+    classifier: SegFormerClassifier = SegFormerClassifier.from_pretrained(args.classifier[0],
+                                                                          int(args.classifier[1])) \
+        if args.classifier is not None else SegFormerClassifier()
+    classifier.batched_siamese = args.batched_siamese
+    runs = [
+        (localizer, LocalizationDataset(sources, use_post_disaster_images=False), xview2.localization_score),
+        (classifier, ClassificationDataset(sources), xview2.classification_score),
+    ]
+
+    records: List[Dict[str, Any]] = []
+    for model, dataset, score in runs:
+        model.to(device)
+        dataloader = DataLoader(dataset, batch_size=args.batch_size, num_workers=args.num_workers, shuffle=False,
+                                drop_last=False, pin_memory=True)
+        for resolution in args.resolutions:
+            model.segformer_input_size = parse_resolution(resolution)
+            record: Dict[str, Any] = {'model': model.name(), 'resolution': resolution}
+            record.update(evaluate(model, dataloader, score, device, args.batches))
+            print(f"{record['model']} resolution={resolution}: score={record['score']:.4f} "
+                  f"latency={record['latency_per_image'] * 1000:.1f}ms/image")
+            records.append(record)
+
+    report = {'device': str(device), 'batch_size': args.batch_size, 'records': records}
+    if args.output is None:
+        print(json.dumps(report, indent=2))
+    else:
+        with open(args.output, 'w') as output_file:
+            json.dump(report, output_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()